@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+"""IPAM scaling benchmarks on SQLite.
+
+    methods: find, one transaction per prefix as in
+        tests/test_ipam.py::test_speed, against find_many.
+    size: find and find_many in pools already holding 10k to 1M
+        prefixes, with the time to load the trie of the pool.
+    version: IPv4 against IPv6, for the same and a deeper split.
+    fragmented: find in a clean pool against one where every other
+        address is allocated, the free space scattered in single
+        addresses.
+    release: releasing prefixes in order, each pair coalescing with its
+        buddy, against in random order.
+    contention: find by worker processes allocating from one pool. On
+        SQLite writers take turns, this measures the cost of conflicts
+        rather than scaling.
+
+    $ python benchmarks/ipam.py [benchmark ...] [--prefixes N]
+          [--sizes N,N] [--workers N,N] [--baseline FILE]
+
+Without benchmarks all run. Results are printed as JSON, one line per
+measurement. Given the output of an earlier run as baseline, the run
+fails when any measurement is slower than the tolerance allows.
+"""
+import sys
+import json
+import time
+import random
+import argparse
+from multiprocessing import get_context
+
+from luxon.core.app import App
+from luxon import db
+
+app = App(name="Benchmark", ini='/dev/null')
+app.config['database'] = {}
+app.config['database']['type'] = 'sqlite3'
+
+from netrino.models.ipam import netrino_prefix, netrino_prefix_tag
+from netrino.helpers.ipam import IPAM, trie
+
+POOL = '198.18.0.0/16'
+# Pool of the size benchmark, holding 16M /32s.
+LARGE = '10.0.0.0/8'
+# Pools and prefix lengths allocated of the version benchmark.
+VERSIONS = (('ipv4', '198.18.0.0/16', 32,),
+            ('ipv6', '2001:db8::/48', 64,),
+            ('ipv6_deep', '2001:db8::/32', 128,),)
+# Prefixes allocated per find_many of pools filled.
+CHUNK = 50000
+
+
+def reset(ipam):
+    with db() as conn:
+        conn.execute('DELETE FROM netrino_prefix_tag')
+        conn.execute('DELETE FROM netrino_prefix')
+        conn.commit()
+    ipam._trie.load()
+
+
+def pool(ipam, prefix=POOL):
+    reset(ipam)
+    ipam.add_tag(ipam.add_prefix('benchmark', prefix)['id'], 'benchmark')
+
+
+def fill(ipam, prefixes, prefix_len=32):
+    allocated = []
+    for i in range(0, prefixes, CHUNK):
+        allocated += ipam.find_many(
+            [(prefix_len, 'benchmark', 'fill%s' % j)
+             for j in range(i, min(i + CHUNK, prefixes))])
+    return allocated
+
+
+def find(ipam, prefixes, prefix_len=32):
+    for i in range(prefixes):
+        ipam.find(prefix_len, 'benchmark', 'lo%s' % i)
+
+
+def find_many(ipam, prefixes, prefix_len=32):
+    ipam.find_many([(prefix_len, 'benchmark', 'lo%s' % i)
+                    for i in range(prefixes)])
+
+
+# Fields of the results measured, the others identify the measurement.
+MEASURED = ('count', 'seconds', 'per_second', 'load_seconds', 'rows_left',)
+
+results = []
+
+
+def report(benchmark, count, duration, **fields):
+    result = dict(benchmark=benchmark, **fields, count=count,
+                  seconds=round(duration, 4),
+                  per_second=round(count / duration))
+    results.append(result)
+    print(json.dumps(result))
+    sys.stdout.flush()
+
+
+def _key(result):
+    return tuple(sorted((field, value)
+                        for field, value in result.items()
+                        if field not in MEASURED))
+
+
+def regressions(baseline, tolerance):
+    """Results slower than in the baseline file by more than tolerance.
+    """
+    with open(baseline) as lines:
+        before = {_key(result): result
+                  for result in map(json.loads, lines) if result}
+    slower = []
+    for result in results:
+        previous = before.get(_key(result))
+        if (previous is not None and result['per_second'] <
+                previous['per_second'] * (1 - tolerance)):
+            slower.append((previous, result,))
+    return slower
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def methods(ipam, options):
+    for method in (find, find_many,):
+        pool(ipam)
+        report('methods', options.prefixes,
+               timed(method, ipam, options.prefixes),
+               method=method.__name__)
+
+
+def size(ipam, options):
+    for prefixes in options.sizes:
+        pool(ipam, LARGE)
+        fill(ipam, prefixes)
+        load = timed(ipam._trie.load)
+        for method in (find, find_many,):
+            report('size', options.prefixes,
+                   timed(method, ipam, options.prefixes),
+                   method=method.__name__, pool_prefixes=prefixes,
+                   load_seconds=round(load, 4))
+
+
+def version(ipam, options):
+    for name, prefix, prefix_len in VERSIONS:
+        for method in (find, find_many,):
+            pool(ipam, prefix)
+            report('version', options.prefixes,
+                   timed(method, ipam, options.prefixes, prefix_len),
+                   method=method.__name__, version=name, pool=prefix,
+                   prefix_len=prefix_len)
+
+
+def fragmented(ipam, options):
+    for fragment in (False, True,):
+        for prefix_len in (32, 28,):
+            pool(ipam, LARGE)
+            if fragment:
+                # Every other address, none of the pairs coalescing.
+                allocated = fill(ipam, 2 * options.prefixes)
+                for prefix in allocated[::2]:
+                    ipam.release_prefix(prefix)
+            report('fragmented', options.prefixes,
+                   timed(find, ipam, options.prefixes, prefix_len),
+                   fragmented=fragment, prefix_len=prefix_len)
+
+
+def release(ipam, options):
+    for order in ('allocated', 'random',):
+        pool(ipam)
+        allocated = fill(ipam, options.prefixes)
+        if order == 'random':
+            random.shuffle(allocated)
+
+        def release_all():
+            for prefix in allocated:
+                ipam.release_prefix(prefix)
+
+        duration = timed(release_all)
+        with db() as conn:
+            rows = conn.execute('SELECT count(id) AS n'
+                                ' FROM netrino_prefix').fetchone()['n']
+        report('release', options.prefixes, duration, order=order,
+               rows_left=rows)
+
+
+def allocate(prefixes):
+    # Worker of the contention benchmark, timed once its trie is loaded.
+    ipam = IPAM()
+    trie().ready()
+    start = time.time()
+    find(ipam, prefixes)
+    return start, time.time()
+
+
+def contention(ipam, options):
+    context = get_context('spawn')
+    for workers in options.workers:
+        pool(ipam)
+        per_worker = options.prefixes // workers
+        with context.Pool(workers) as processes:
+            times = processes.map(allocate, [per_worker] * workers)
+        start = min(start for start, end in times)
+        end = max(end for start, end in times)
+        report('contention', per_worker * workers, end - start,
+               workers=workers)
+
+
+BENCHMARKS = (methods, size, version, fragmented, release, contention,)
+
+
+def integers(value):
+    return [int(integer) for integer in value.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='IPAM benchmarks')
+    parser.add_argument('benchmarks', nargs='*',
+                        help='Benchmarks to run, all by default')
+    parser.add_argument('--prefixes', type=int, default=2000,
+                        help='Prefixes allocated or released timed')
+    parser.add_argument('--sizes', type=integers, default=[10000, 100000],
+                        help='Prefixes already in the pool of size')
+    parser.add_argument('--workers', type=integers, default=[1, 2, 4, 8],
+                        help='Worker processes of contention')
+    parser.add_argument('--baseline',
+                        help='Results of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Part slower than the baseline allowed')
+    options = parser.parse_args(argv)
+    names = [benchmark.__name__ for benchmark in BENCHMARKS]
+    for name in options.benchmarks:
+        if name not in names:
+            parser.error("unknown benchmark '%s', choose from %s" %
+                         (name, ', '.join(names),))
+
+    netrino_prefix().create_table()
+    netrino_prefix_tag().create_table()
+    ipam = IPAM()
+    for benchmark in BENCHMARKS:
+        if (not options.benchmarks or
+                benchmark.__name__ in options.benchmarks):
+            benchmark(ipam, options)
+    reset(ipam)
+
+    if options.baseline:
+        slower = regressions(options.baseline, options.tolerance)
+        for previous, result in slower:
+            print('Slower than baseline, %s per second against %s: %s' %
+                  (result['per_second'], previous['per_second'],
+                   json.dumps(result),), file=sys.stderr)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
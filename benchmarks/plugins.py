@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+"""Plugin lookup cost per request.
+
+Compares constructing luxon EntryPoints for a lookup, as views did on
+every request, against the startup-resolved plugin registry.
+
+    $ python benchmarks/plugins.py [iterations]
+
+Results are printed as JSON, one line per group.
+"""
+import sys
+import json
+import timeit
+
+from luxon.utils.pkg import EntryPoints
+
+from netrino.helpers.plugins import plugins, load, GROUPS
+
+
+def entrypoints(group):
+    for name in EntryPoints(group):
+        EntryPoints(group)[name]
+
+
+def registry(group):
+    for name in plugins(group):
+        plugins(group)[name]
+
+
+def main(iterations=1000):
+    load()
+    for group in GROUPS:
+        before = timeit.timeit(lambda: entrypoints(group),
+                               number=iterations) / iterations
+        after = timeit.timeit(lambda: registry(group),
+                              number=iterations) / iterations
+        print(json.dumps({'group': group,
+                          'plugins': len(plugins(group)),
+                          'entrypoints_us': round(before * 1e6, 3),
+                          'registry_us': round(after * 1e6, 3),
+                          'saved_us': round((before - after) * 1e6, 3)}))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
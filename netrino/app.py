@@ -41,3 +41,12 @@ gclient()
 register.middleware(Client)
 
 import netrino.views
+
+from netrino.helpers import plugins
+plugins.load()
+
+from netrino.helpers.search import search
+search().build()
+
+from netrino.helpers.ipam import trie
+trie().build()
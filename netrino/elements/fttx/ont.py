@@ -30,5 +30,9 @@
 from luxon import Model
 
 class ONT(Model):
+    # Names of the tachyonic_interfaces supported, see
+    # netrino.helpers.elements.interfaces().
+    interfaces = ()
+
     serial = Model.String()
     password = Model.Password()
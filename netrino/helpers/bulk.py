@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+import io
+import csv
+from uuid import uuid4
+from decimal import Decimal, InvalidOperation
+
+from luxon import db
+from luxon import js
+from luxon import GetLogger
+from luxon.utils.timezone import now
+from luxon.exceptions import SQLIntegrityError
+
+from netrino.helpers.dialect import insert_many
+from netrino.helpers.products import load_products
+from netrino.helpers.plugins import plugins
+from netrino.helpers.search import search
+from netrino.helpers import hierarchy
+from netrino.helpers import facets
+
+FORMATS = ('ndjson', 'csv',)
+
+# Product columns exported and imported, images are not included.
+FIELDS = ('id', 'name', 'parent_id', 'price', 'monthly', 'description',)
+
+# Product detail keys and the columns kept for each child.
+CHILDREN = (('categories', ('name',)),
+            ('custom_attributes', ('name', 'value', 'visible',)),
+            ('payment_gateways', ('name', 'description',)),
+            ('services', ('entrypoint', 'metadata',)),)
+
+COLUMNS = FIELDS + tuple(key for key, fields in CHILDREN)
+
+# Products per transaction and per export query.
+BATCH = 200
+
+log = GetLogger(__name__)
+
+
+def _export_record(product):
+    record = {field: product[field] for field in FIELDS}
+    record['price'] = str(record['price'] or 0)
+    record['monthly'] = bool(record['monthly'])
+    for key, fields in CHILDREN:
+        record[key] = [{field: child[field] for field in fields}
+                       for child in product[key]]
+    record['categories'] = [child['name'] for child in record['categories']]
+    for service in record['services']:
+        try:
+            service['metadata'] = js.loads(service['metadata'])
+        except (TypeError, ValueError):
+            pass
+
+    return record
+
+
+def _level(conn, parents):
+    # Ids of the products under parents ordered by id, those without a
+    # parent when parents is None.
+    if parents is None:
+        return [row['id'] for row in conn.execute(
+            'SELECT id FROM netrino_product WHERE parent_id IS NULL'
+            ' ORDER BY id').fetchall()]
+
+    pids = []
+    for i in range(0, len(parents), BATCH):
+        chunk = tuple(parents[i:i + BATCH])
+        pids += [row['id'] for row in conn.execute(
+            'SELECT id FROM netrino_product WHERE parent_id IN (%s)'
+            ' ORDER BY id' % ','.join('?' * len(chunk)), chunk).fetchall()]
+    return pids
+
+
+def records():
+    """Products with their children for export.
+
+    Products are returned parents first, level by level of the product
+    hierarchy following parent_id, so that an import of the output never
+    references a parent not yet imported. Only the ids of a level and
+    BATCH products are held in memory at a time.
+
+    Returns:
+        Generator of product dicts.
+    """
+    pids = None
+    while True:
+        with db() as conn:
+            pids = _level(conn, pids)
+        if not pids:
+            return
+        for i in range(0, len(pids), BATCH):
+            for product in load_products(pids[i:i + BATCH], FIELDS):
+                yield _export_record(product)
+
+
+def export(fmt='ndjson'):
+    """Export the product catalog.
+
+    Args:
+        fmt (str): 'ndjson' or 'csv'. In CSV the child columns hold JSON
+            lists.
+
+    Returns:
+        Generator of lines.
+    """
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(COLUMNS)
+        for record in records():
+            for key, fields in CHILDREN:
+                record[key] = js.dumps(record[key])
+            writer.writerow([record[column] for column in COLUMNS])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    else:
+        for record in records():
+            yield js.dumps(record) + '\n'
+
+
+def _bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y',)
+    return bool(value)
+
+
+def _list(record, key):
+    value = record.get(key) or []
+    if isinstance(value, str):
+        value = js.loads(value)
+    if not isinstance(value, list):
+        raise ValueError("'%s' must be a list" % key)
+    return value
+
+
+def _parse(record, tasks):
+    """Validate an import record.
+
+    Args:
+        record (dict): Product as exported.
+        tasks (dict): Known product tasks.
+
+    Returns:
+        Normalized record.
+
+    Raises:
+        ValueError: Describing the first problem found.
+    """
+    if not isinstance(record, dict):
+        raise ValueError('Expected an object')
+    name = record.get('name')
+    if not name:
+        raise ValueError("'name' is required")
+    try:
+        price = Decimal(str(record.get('price') or 0))
+    except InvalidOperation:
+        raise ValueError("Invalid price '%s'" % record.get('price'))
+
+    product = {'id': record.get('id') or str(uuid4()),
+               'name': name,
+               'parent_id': record.get('parent_id') or None,
+               'price': str(price),
+               'monthly': _bool(record.get('monthly', False)),
+               'description': record.get('description') or None}
+
+    categories = []
+    for category in _list(record, 'categories'):
+        if isinstance(category, dict):
+            category = category.get('name')
+        if not category:
+            raise ValueError('Category name is required')
+        categories.append(category)
+    product['categories'] = categories
+
+    attrs = []
+    for attr in _list(record, 'custom_attributes'):
+        if not isinstance(attr, dict) or not attr.get('name'):
+            raise ValueError('Custom attribute name is required')
+        attrs.append({'name': attr['name'],
+                      'value': attr.get('value'),
+                      'visible': _bool(attr.get('visible', True))})
+    product['custom_attributes'] = attrs
+
+    gateways = []
+    for gateway in _list(record, 'payment_gateways'):
+        if isinstance(gateway, str):
+            gateway = {'name': gateway}
+        if not isinstance(gateway, dict) or not gateway.get('name'):
+            raise ValueError('Payment gateway name is required')
+        gateways.append({'name': gateway['name'],
+                         'description': gateway.get('description')})
+    product['payment_gateways'] = gateways
+
+    services = []
+    for service in _list(record, 'services'):
+        if not isinstance(service, dict) or not service.get('entrypoint'):
+            raise ValueError('Service entrypoint is required')
+        if service['entrypoint'] not in tasks:
+            raise ValueError("Unknown product task '%s'"
+                             % service['entrypoint'])
+        metadata = service.get('metadata')
+        if metadata is not None and not isinstance(metadata, str):
+            metadata = js.dumps(metadata)
+        services.append({'entrypoint': service['entrypoint'],
+                         'metadata': metadata})
+    product['services'] = services
+
+    return product
+
+
+def _write(conn, products, domain=None):
+    """Insert a batch of products with multi-row inserts.
+
+    Returns:
+        False if any product could not be linked to its parent in the
+        hierarchy index.
+    """
+    created = now()
+    insert_many(conn, 'netrino_product',
+                FIELDS + ('domain', 'creation_time',),
+                [tuple(product[field] for field in FIELDS) +
+                 (domain, created,) for product in products])
+    insert_many(conn, 'netrino_categories', ('id', 'name', 'product_id',),
+                [(str(uuid4()), category, product['id'],)
+                 for product in products
+                 for category in product['categories']])
+    insert_many(conn, 'netrino_custom_attr',
+                ('id', 'name', 'value', 'visible', 'product_id',),
+                [(str(uuid4()), attr['name'], attr['value'],
+                  attr['visible'], product['id'],)
+                 for product in products
+                 for attr in product['custom_attributes']])
+    insert_many(conn, 'netrino_payment_gateway',
+                ('id', 'product_id', 'name', 'description',
+                 'creation_time',),
+                [(str(uuid4()), product['id'], gateway['name'],
+                  gateway['description'], created,)
+                 for product in products
+                 for gateway in product['payment_gateways']])
+    insert_many(conn, 'netrino_product_entrypoint',
+                ('id', 'product_id', 'entrypoint', 'metadata',
+                 'creation_time',),
+                [(str(uuid4()), product['id'], service['entrypoint'],
+                  service['metadata'], created,)
+                 for product in products
+                 for service in product['services']])
+
+    categories = {}
+    attrs = {}
+    for product in products:
+        for category in product['categories']:
+            categories[category] = categories.get(category, 0) + 1
+        for attr in product['custom_attributes']:
+            key = (attr['name'], attr['value'],)
+            attrs[key] = attrs.get(key, 0) + 1
+    for category, count in categories.items():
+        facets.count_category(conn, category, count, domain)
+    for (name, value), count in attrs.items():
+        facets.count_attribute(conn, name, value, count, domain)
+
+    linked = True
+    for product in products:
+        if not hierarchy.add(conn, product['id'], product['parent_id']):
+            linked = False
+    return linked
+
+
+class Import(object):
+    """Import products in batched transactions.
+
+    A batch failing on a database error is retried one product per
+    transaction, so that only the offending products are reported. Parents
+    are resolved against the database and the products of each committed
+    batch are reindexed for search, nothing is kept per product imported.
+
+    Args:
+        domain (str): Domain of the products imported.
+        batch (int): Products per transaction.
+    """
+    def __init__(self, domain=None, batch=BATCH):
+        self.domain = domain
+        self.batch = batch
+        self.imported = 0
+        self.errors = []
+        self._linked = True
+        self._tasks = plugins('netrino.product.tasks')
+
+    def _error(self, row, product, error):
+        self.errors.append({'row': row,
+                            'id': product.get('id')
+                            if isinstance(product, dict) else None,
+                            'error': str(error)})
+
+    def _flush(self, pending):
+        if not pending:
+            return
+        with db() as conn:
+            try:
+                linked = _write(conn, [product for row, product in pending],
+                                self.domain)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+            else:
+                self._done(pending, linked)
+                return
+
+            for row, product in pending:
+                try:
+                    linked = _write(conn, [product], self.domain)
+                    conn.commit()
+                except SQLIntegrityError as e:
+                    conn.rollback()
+                    self._error(row, product, e)
+                except Exception as e:
+                    conn.rollback()
+                    log.error('Unable to import product %s: %s'
+                              % (product['id'], e))
+                    self._error(row, product, e)
+                else:
+                    self._done([(row, product)], linked)
+
+    def _done(self, pending, linked):
+        self.imported += len(pending)
+        self._linked = self._linked and linked
+        search().refresh(*[product['id'] for row, product in pending])
+
+    def run(self, records):
+        """Import records.
+
+        Args:
+            records (iterable): Product dicts as exported.
+
+        Returns:
+            Dict with the number of products 'imported' and a list of
+            'errors' giving the row, product id and error of each product
+            not imported.
+        """
+        pending = []
+        for row, record in enumerate(records, 1):
+            try:
+                pending.append((row, _parse(record, self._tasks),))
+            except (TypeError, ValueError) as e:
+                self._error(row, record, e)
+            if len(pending) >= self.batch:
+                self._flush(pending)
+                pending = []
+        self._flush(pending)
+
+        if not self._linked:
+            # Children imported before their parents.
+            log.warning('Rebuilding product hierarchy after import')
+            hierarchy.rebuild()
+
+        return {'imported': self.imported, 'errors': self.errors}
+
+
+def parse(lines, fmt='ndjson'):
+    """Records from lines of NDJSON or CSV.
+
+    Lines that can not be decoded are returned as strings, reported by
+    the import as errors.
+
+    Args:
+        lines (iterable): Lines or chunks of lines as str or bytes.
+        fmt (str): 'ndjson' or 'csv'.
+
+    Returns:
+        Generator of records.
+    """
+    lines = (line
+             for chunk in lines
+             for line in (chunk.decode('utf-8') if isinstance(chunk, bytes)
+                          else chunk).splitlines(True))
+    if fmt == 'csv':
+        for record in csv.DictReader(lines):
+            yield record
+    else:
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                yield js.loads(line)
+            except ValueError:
+                yield line
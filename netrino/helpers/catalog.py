@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+import time
+from uuid import uuid4
+from threading import Lock
+
+from luxon import g
+from luxon import db
+from luxon import js
+from luxon import GetLogger
+
+from netrino.utils.lru import LRU
+from netrino.helpers.dialect import upsert_add
+
+log = GetLogger(__name__)
+
+GENERATION_KEY = 'netrino:catalog:generation'
+
+# netrino_product_changes row counting the generation without Redis.
+GENERATION_NAME = 'catalog'
+
+
+class Catalog(object):
+    """Product catalog cache.
+
+    Entries are kept in an in-process LRU (L1) and, when the [cache]
+    backend is Redis, in Redis (L2) shared by all workers.
+
+    Product details are cached per product and invalidated per product.
+    Listings, categories and attributes depend on many products and are
+    cached under the catalog generation, which every mutation increments.
+    The generation is kept in Redis, or in the database without Redis.
+    Workers compare theirs with it at most every [catalog] generation_ttl
+    seconds, discarding their L1 when it moved.
+    """
+    def __init__(self):
+        config = g.app.config
+        self._ttl = config.getint('catalog', 'ttl', fallback=300)
+        self._generation_ttl = config.getfloat('catalog', 'generation_ttl',
+                                               fallback=1)
+        self._l1 = LRU(config.getint('catalog', 'size', fallback=10000),
+                       self._ttl)
+        self._l2 = self._redis()
+        self._generation = 0
+        self._checked = 0
+        self._lock = Lock()
+
+    def _redis(self):
+        backend = g.app.config.get('cache', 'backend', fallback='')
+        if 'redis' not in backend.lower():
+            return None
+
+        try:
+            import redis
+        except ImportError:
+            log.warning('Catalog cache limited to memory,'
+                        ' redis module not installed')
+            return None
+
+        return redis.StrictRedis(
+            host=g.app.config.get('redis', 'host', fallback='localhost'),
+            port=g.app.config.getint('redis', 'port', fallback=6379),
+            db=g.app.config.getint('redis', 'db', fallback=0))
+
+    def _current(self):
+        # Generation shared by all workers.
+        if self._l2 is not None:
+            return int(self._l2.get(GENERATION_KEY) or 0)
+
+        with db() as conn:
+            row = conn.execute('SELECT changes FROM netrino_product_changes'
+                               ' WHERE name=?', GENERATION_NAME).fetchone()
+        return row['changes'] if row else 0
+
+    def _increment(self, keys):
+        # Removes keys from L2 and moves the shared generation.
+        if self._l2 is not None:
+            if keys:
+                self._l2.delete(*keys)
+            return self._l2.incr(GENERATION_KEY)
+
+        with db() as conn:
+            conn.execute(upsert_add('netrino_product_changes', ('name',),
+                                    'changes'),
+                         (str(uuid4()), GENERATION_NAME, 1,))
+            conn.commit()
+        return self._current()
+
+    @property
+    def generation(self):
+        if time.monotonic() - self._checked > self._generation_ttl:
+            try:
+                generation = self._current()
+            except Exception as e:
+                log.error('Catalog cache generation unavailable: %s' % e)
+            else:
+                with self._lock:
+                    if generation != self._generation:
+                        self._l1.clear()
+                        self._generation = generation
+            self._checked = time.monotonic()
+
+        return self._generation
+
+    def _load(self, key):
+        value = self._l1.get(key)
+        if value is not None or self._l2 is None:
+            return value
+
+        try:
+            value = self._l2.get(key)
+        except Exception as e:
+            log.error('Catalog cache L2 unavailable: %s' % e)
+            return None
+
+        if value is not None:
+            value = js.loads(value)
+            self._l1.set(key, value)
+
+        return value
+
+    def _store(self, key, value):
+        self._l1.set(key, value)
+        if self._l2 is not None:
+            try:
+                self._l2.set(key, js.dumps(value), ex=self._ttl)
+            except Exception as e:
+                log.error('Catalog cache L2 unavailable: %s' % e)
+
+    def get(self, key, func, *args, **kwargs):
+        """Cached result of func, calling it on a miss.
+
+        Args:
+            key (str): Cache key, ie 'product:<id>' or 'products:<query>'.
+            func (function): Function returning the value.
+        """
+        if not key.startswith('product:'):
+            key = '%s:%s' % (self.generation, key)
+        else:
+            # Ensure a moved generation discards the L1 of this worker.
+            self.generation
+
+        value = self._load(key)
+        if value is None:
+            generation = self._generation
+            value = func(*args, **kwargs)
+            # Not caching what may predate a concurrent invalidation.
+            if generation == self._generation:
+                self._store(key, value)
+
+        return value
+
+    def invalidate(self, *pids):
+        """Invalidate products and all listings.
+
+        Args:
+            pids (str): Ids of products changed.
+        """
+        keys = ['product:%s' % pid for pid in pids if pid]
+        for key in keys:
+            self._l1.delete(key)
+
+        with self._lock:
+            try:
+                self._generation = self._increment(keys)
+                self._checked = time.monotonic()
+                return
+            except Exception as e:
+                log.error('Catalog cache generation unavailable: %s' % e)
+            self._l1.clear()
+            self._generation += 1
+
+
+_catalog = None
+
+
+def catalog():
+    """Process wide catalog cache.
+    """
+    global _catalog
+
+    if _catalog is None:
+        _catalog = Catalog()
+
+    return _catalog
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+from uuid import UUID
+
+from luxon import g
+from luxon import js
+
+
+def driver():
+    """Configured database driver.
+
+    Returns:
+        'mysql' or 'sqlite3' as per the [database] type option.
+    """
+    return g.app.config.get('database', 'type', fallback='sqlite3')
+
+
+def json_merge_patch(field):
+    """SQL expression applying a JSON merge-patch to a text column.
+
+    The patch document is expected as the next query parameter. Empty and
+    NULL columns are treated as an empty object.
+
+    Args:
+        field (str): Column holding the JSON document.
+
+    Returns:
+        SQL expression or None if the driver has no native merge-patch.
+    """
+    current = "COALESCE(NULLIF(%s,''),'{}')" % field
+    if driver() == 'mysql':
+        return 'JSON_MERGE_PATCH(%s,?)' % current
+    if driver() == 'sqlite3':
+        return 'json_patch(%s,?)' % current
+    return None
+
+
+def upsert_add(table, keys, column):
+    """SQL statement adding to a counter column, creating the row if needed.
+
+    Parameters expected are the row id, the values for keys and finally the
+    amount to add. The keys must be covered by a unique index.
+
+    Args:
+        table (str): Table name.
+        keys (tuple): Columns identifying the row.
+        column (str): Counter column.
+
+    Returns:
+        SQL statement.
+    """
+    fields = ('id',) + tuple(keys) + (column,)
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (table,
+                                               ','.join(fields),
+                                               ','.join('?' * len(fields)))
+    if driver() == 'mysql':
+        sql += ' ON DUPLICATE KEY UPDATE %s=%s+VALUES(%s)' % (column,
+                                                             column,
+                                                             column)
+    else:
+        sql += ' ON CONFLICT(%s) DO UPDATE SET %s=%s+excluded.%s' % (
+            ','.join(keys), column, column, column)
+
+    return sql
+
+
+def insert(conn, table, values):
+    """Insert a row on the given connection without committing.
+
+    Used where a row must be written in the same transaction as other
+    statements, which SQLModel.commit does not allow.
+
+    Args:
+        conn: Database connection.
+        table (str): Table name.
+        values (dict): Column values.
+    """
+    fields = tuple(values)
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (table,
+                                               ','.join(fields),
+                                               ','.join('?' * len(fields)))
+    conn.execute(sql, [_value(values[field]) for field in fields])
+
+
+def _value(value):
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, (dict, list,)):
+        return js.dumps(value)
+    return value
+
+
+def update(conn, table, values, id):
+    """Update a row on the given connection without committing.
+
+    Args:
+        conn: Database connection.
+        table (str): Table name.
+        values (dict): Column values, any 'id' is ignored.
+        id (str): Primary key of the row.
+    """
+    fields = tuple(field for field in values if field != 'id')
+    sql = 'UPDATE %s SET %s WHERE id=?' % (table,
+                                           ','.join('%s=?' % field
+                                                    for field in fields))
+    conn.execute(sql, [_value(values[field]) for field in fields] + [id])
+
+
+def insert_ignore(table, fields):
+    """SQL statement inserting a row unless its key already exists.
+
+    Args:
+        table (str): Table name.
+        fields (tuple): Columns given as parameters.
+
+    Returns:
+        SQL statement.
+    """
+    if driver() == 'mysql':
+        sql = 'INSERT IGNORE INTO'
+    else:
+        sql = 'INSERT OR IGNORE INTO'
+
+    return '%s %s (%s) VALUES (%s)' % (sql, table, ','.join(fields),
+                                       ','.join('?' * len(fields)))
+
+
+# Parameters per statement, within the SQLite default limit of 999.
+MAX_PARAMS = 900
+
+
+def insert_many(conn, table, fields, rows):
+    """Insert rows with multi-row INSERT statements without committing.
+
+    Args:
+        conn: Database connection.
+        table (str): Table name.
+        fields (tuple): Columns.
+        rows (list): Tuples of values in the order of fields.
+    """
+    per_statement = max(1, MAX_PARAMS // len(fields))
+    row_sql = '(%s)' % ','.join('?' * len(fields))
+    for i in range(0, len(rows), per_statement):
+        batch = rows[i:i + per_statement]
+        sql = 'INSERT INTO %s (%s) VALUES %s' % (
+            table, ','.join(fields), ','.join([row_sql] * len(batch)))
+        conn.execute(sql, [_value(value) for row in batch for value in row])
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+from uuid import uuid4
+
+from luxon import db
+
+from netrino.helpers.dialect import insert_many
+from netrino.helpers.plugins import plugins
+
+CLASSIFICATIONS = 'tachyonic.element.classifications'
+
+# Elements indexed per transaction when rebuilding.
+BATCH = 1000
+
+
+def interfaces(classification):
+    """Interfaces supported by elements of a classification.
+
+    Classifications list the names of the tachyonic_interfaces they
+    support in an 'interfaces' attribute, interfaces may list the
+    classifications they support in a 'classifications' attribute.
+
+    Args:
+        classification (str): Classification entry point name.
+
+    Returns:
+        Tuple of interface names.
+    """
+    cls = plugins(CLASSIFICATIONS).get(classification)
+    names = list(getattr(cls, 'interfaces', None) or ())
+    for name, interface in plugins('tachyonic_interfaces').items():
+        if (name not in names and classification in
+                (getattr(interface, 'classifications', None) or ())):
+            names.append(name)
+    return tuple(names)
+
+
+def signature():
+    """Interfaces per classification, to tell whether plugin changes
+    require a rebuild.
+    """
+    return {classification: interfaces(classification)
+            for classification in plugins(CLASSIFICATIONS)}
+
+
+def index(conn, element_id, classification):
+    """Index the interfaces of an element.
+
+    Executed on the connection of the transaction creating or updating the
+    element, the caller commits.
+
+    Args:
+        conn: Database connection.
+        element_id (str): Element id.
+        classification (str): Element classification.
+    """
+    unindex(conn, element_id)
+    insert_many(conn, 'netrino_element_interface',
+                ('id', 'interface', 'element_id',),
+                [(str(uuid4()), interface, element_id,)
+                 for interface in interfaces(classification)])
+
+
+def unindex(conn, element_id):
+    """Remove an element from the interface index.
+
+    Args:
+        conn: Database connection.
+        element_id (str): Element id.
+    """
+    conn.execute('DELETE FROM netrino_element_interface'
+                 ' WHERE element_id=?', element_id)
+
+
+def elements_with_interface(interface, limit=1000, marker=None):
+    """Ids of elements supporting an interface, in pages.
+
+    Args:
+        interface (str): Interface name.
+        limit (int): Maximum ids returned.
+        marker (str): Last id of the previous page.
+
+    Returns:
+        List of element ids in order.
+    """
+    with db() as conn:
+        rows = conn.execute('SELECT element_id'
+                            ' FROM netrino_element_interface'
+                            ' WHERE interface=? AND element_id>?'
+                            ' ORDER BY element_id LIMIT ?',
+                            (interface, marker or '', limit,)).fetchall()
+
+    return [row['element_id'] for row in rows]
+
+
+def rebuild():
+    """Rebuild the interface index from all elements.
+
+    Returns:
+        Number of interfaces indexed.
+    """
+    supported = signature()
+    rows = 0
+    last = ''
+    with db() as conn:
+        conn.execute('DELETE FROM netrino_element_interface')
+        while True:
+            elements = conn.execute('SELECT id,classification'
+                                    ' FROM netrino_element WHERE id>?'
+                                    ' ORDER BY id LIMIT ?',
+                                    (last, BATCH,)).fetchall()
+            if not elements:
+                break
+            last = elements[-1]['id']
+            values = [(str(uuid4()), interface, element['id'],)
+                      for element in elements
+                      for interface in supported.get(
+                          element['classification'], ())]
+            insert_many(conn, 'netrino_element_interface',
+                        ('id', 'interface', 'element_id',), values)
+            rows += len(values)
+        conn.commit()
+
+    return rows
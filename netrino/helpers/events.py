@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+import time
+from uuid import uuid4
+
+from luxon import g
+from luxon import db
+from luxon import js
+from luxon import GetLogger
+from luxon.utils.timezone import now
+
+from netrino.helpers.dialect import insert
+
+log = GetLogger(__name__)
+
+
+def emit(conn, event, object_id, payload):
+    """Queue an event in the transactional outbox.
+
+    The event is written on the connection of the transaction changing the
+    object and is only published once that transaction commits.
+
+    Args:
+        conn: Database connection.
+        event (str): Event name, ie 'order.created'.
+        object_id (str): Id of the object the event concerns.
+        payload (dict): Event data.
+    """
+    insert(conn, 'netrino_outbox', {'id': str(uuid4()),
+                                    'event': event,
+                                    'object_id': str(object_id),
+                                    'payload': js.dumps(payload),
+                                    'attempts': 0,
+                                    'claim_expiry': 0,
+                                    'creation_time': now()})
+
+
+class Local(object):
+    """Broker keeping published events in memory.
+
+    Stand-in for AMQP in tests and single process deployments.
+    """
+    def __init__(self):
+        self.events = []
+
+    def publish(self, events):
+        self.events.extend(events)
+
+
+class Amqp(object):
+    """Broker publishing events to the RabbitMQ configured in [rabbitmq].
+
+    Each event is distributed to the queue named after the event.
+    """
+    def publish(self, events):
+        from luxon.helpers.rmq import rmq
+
+        with rmq() as mb:
+            for event in events:
+                mb.distribute(event['event'], **event)
+
+
+BROKERS = {'local': Local,
+           'amqp': Amqp}
+
+
+class Publisher(object):
+    """Drains the outbox to a broker in batches.
+
+    A batch is claimed for the [outbox] lease seconds and committed before
+    publishing, so no row locks are held while waiting on the broker. Events
+    are removed only after the broker accepted the batch, those of a
+    publisher that died are claimed again once the lease expired. Delivery
+    is therefore at-least-once and consumers should ignore event ids they
+    have seen.
+
+    Args:
+        broker (obj): Broker with publish(events) method. Defaults to the
+            [outbox] broker option, 'amqp' or 'local'.
+        batch (int): Events per batch, defaults to [outbox] batch option.
+        lease (int): Seconds a claimed batch is reserved, defaults to the
+            [outbox] lease option.
+    """
+    def __init__(self, broker=None, batch=None, lease=None):
+        if broker is None:
+            broker = BROKERS[g.app.config.get('outbox', 'broker',
+                                              fallback='amqp')]()
+        if batch is None:
+            batch = g.app.config.getint('outbox', 'batch', fallback=100)
+        if lease is None:
+            lease = g.app.config.getint('outbox', 'lease', fallback=60)
+
+        self.broker = broker
+        self.batch = batch
+        self.lease = lease
+
+    def _claim(self):
+        """Reserve the oldest unclaimed events for this publisher.
+
+        Returns:
+            Claim id and the rows claimed.
+        """
+        claim = str(uuid4())
+        current = int(time.time())
+        pending = 'SELECT id FROM netrino_outbox WHERE claim_expiry<?' \
+                  ' ORDER BY creation_time LIMIT ?'
+
+        with db() as conn:
+            ids = [row['id'] for row in
+                   conn.execute(pending, (current, self.batch,)).fetchall()]
+            if not ids:
+                return claim, []
+            # Rows another publisher claimed meanwhile are left out.
+            conn.execute('UPDATE netrino_outbox SET claim=?,claim_expiry=?'
+                         ' WHERE claim_expiry<? AND id IN (%s)'
+                         % ','.join('?' * len(ids)),
+                         [claim, current + self.lease, current] + ids)
+            conn.commit()
+            rows = conn.execute('SELECT id,event,object_id,payload,'
+                                'creation_time FROM netrino_outbox'
+                                ' WHERE claim=? ORDER BY creation_time',
+                                claim).fetchall()
+        return claim, rows
+
+    def drain(self):
+        """Publish one batch of pending events.
+
+        Returns:
+            Number of events published.
+        """
+        claim, rows = self._claim()
+        if not rows:
+            return 0
+
+        events = [{'id': row['id'],
+                   'event': row['event'],
+                   'object_id': row['object_id'],
+                   'payload': js.loads(row['payload']),
+                   'time': row['creation_time']} for row in rows]
+        try:
+            self.broker.publish(events)
+        except Exception:
+            with db() as conn:
+                conn.execute('UPDATE netrino_outbox'
+                             ' SET attempts=attempts+1,claim=NULL,'
+                             'claim_expiry=0 WHERE claim=?', claim)
+                conn.commit()
+            raise
+
+        with db() as conn:
+            conn.execute('DELETE FROM netrino_outbox WHERE claim=?', claim)
+            conn.commit()
+
+        return len(rows)
+
+    def run(self, interval=1, once=False):
+        """Publish pending events until stopped.
+
+        Args:
+            interval (int): Seconds to wait when the outbox is empty or the
+                broker failed.
+            once (bool): Return once the outbox is empty.
+        """
+        while True:
+            try:
+                if self.drain():
+                    continue
+            except Exception as e:
+                log.error('Failed publishing events: %s' % e)
+                if once:
+                    raise
+            if once:
+                return
+            time.sleep(interval)
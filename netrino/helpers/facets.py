@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+from uuid import uuid4
+
+from luxon import db
+
+from netrino.helpers.dialect import upsert_add
+
+
+def count_category(conn, name, products=1, domain=None):
+    """Add to the product count of a category.
+
+    Executed on the connection of the transaction changing the category,
+    the caller commits. Counts are kept per product domain.
+
+    Args:
+        conn: Database connection.
+        name (str): Category name.
+        products (int): Amount to add, negative to subtract.
+        domain (str): Domain of the products.
+    """
+    conn.execute(upsert_add('netrino_category', ('name', 'domain',),
+                            'products'),
+                 (str(uuid4()), name, domain or '', products,))
+
+
+def count_attribute(conn, name, value, products=1, domain=None):
+    """Add to the product count of a custom attribute value.
+
+    Args:
+        conn: Database connection.
+        name (str): Attribute name.
+        value (str): Attribute value.
+        products (int): Amount to add, negative to subtract.
+        domain (str): Domain of the products.
+    """
+    conn.execute(upsert_add('netrino_attr_facet', ('name', 'value', 'domain',),
+                            'products'),
+                 (str(uuid4()), name, value or '', domain or '', products,))
+
+
+def domain(conn, pid):
+    """Domain of a product, to count its facets under.
+
+    Args:
+        conn: Database connection.
+        pid (str): Product id.
+    """
+    product = conn.execute('SELECT domain FROM netrino_product WHERE id=?',
+                           pid).fetchone()
+    return product['domain'] if product else None
+
+
+def count_product(conn, pid, products=-1):
+    """Add to the counts of all categories and attribute values of a
+    product, ie subtract before deleting it.
+
+    Args:
+        conn: Database connection.
+        pid (str): Product id.
+        products (int): Amount to add, negative to subtract.
+    """
+    product_domain = domain(conn, pid)
+    for category in conn.execute('SELECT name FROM netrino_categories'
+                                 ' WHERE product_id=?', pid).fetchall():
+        count_category(conn, category['name'], products, product_domain)
+    for attr in conn.execute('SELECT name,value FROM netrino_custom_attr'
+                             ' WHERE product_id=?', pid).fetchall():
+        count_attribute(conn, attr['name'], attr['value'], products,
+                        product_domain)
+
+
+def _scoped(domain):
+    # Counters of products in the domain and those without one, all
+    # counters when not scoped to a domain.
+    if domain is None:
+        return '', ()
+    return " WHERE domain IN ('',?)", (domain,)
+
+
+def categories(domain=None):
+    """Categories in use with their product counts.
+
+    Args:
+        domain (str): Only products in this domain or without one.
+    """
+    where, values = _scoped(domain)
+    with db() as conn:
+        return conn.execute('SELECT name,SUM(products) AS products'
+                            ' FROM netrino_category%s GROUP BY name'
+                            ' HAVING SUM(products)>0 ORDER BY name' % where,
+                            values).fetchall()
+
+
+def attributes(domain=None):
+    """Custom attribute names in use.
+
+    Args:
+        domain (str): Only products in this domain or without one.
+    """
+    where, values = _scoped(domain)
+    with db() as conn:
+        return conn.execute('SELECT name FROM netrino_attr_facet%s'
+                            ' GROUP BY name HAVING SUM(products)>0'
+                            ' ORDER BY name' % where, values).fetchall()
+
+
+def _matching(category, domain, search):
+    # Products listed under the same filters, as a subquery with values.
+    where = []
+    values = []
+    if category:
+        where.append('id IN (SELECT product_id FROM netrino_categories'
+                     ' WHERE name=?)')
+        values.append(category)
+    if domain:
+        where.append('(domain IS NULL OR domain=?)')
+        values.append(domain)
+    if search:
+        where.append('(%s)' % ' OR '.join('%s LIKE ?' % field
+                                          for field in search))
+        values += ['%%%s%%' % search[field] for field in search]
+    return ('SELECT id FROM netrino_product WHERE %s' % ' AND '.join(where),
+            values)
+
+
+def facets(category=None, domain=None, search=None):
+    """Product counts per category and per custom attribute value.
+
+    Read from the counters maintained per domain, unless filtered by
+    category or search, when the products matching the filters of the
+    listing are counted.
+
+    Args:
+        category (str): Only products in this category.
+        domain (str): Only products in this domain or without one.
+        search (dict): Product field to text it contains, a product
+            matching any of them is counted.
+    """
+    if not (category or search):
+        where, values = _scoped(domain)
+        with db() as conn:
+            attrs = conn.execute('SELECT name,value,'
+                                 'SUM(products) AS products'
+                                 ' FROM netrino_attr_facet%s'
+                                 ' GROUP BY name,value'
+                                 ' HAVING SUM(products)>0'
+                                 ' ORDER BY name,value' % where,
+                                 values).fetchall()
+
+        return {'categories': categories(domain),
+                'attributes': attrs}
+
+    products, values = _matching(category, domain, search)
+    with db() as conn:
+        cats = conn.execute('SELECT name,COUNT(product_id) AS products'
+                            ' FROM netrino_categories'
+                            ' WHERE product_id IN (%s)'
+                            ' GROUP BY name ORDER BY name' % products,
+                            values).fetchall()
+        attrs = conn.execute("SELECT name,COALESCE(value,'') AS value,"
+                             'COUNT(product_id) AS products'
+                             ' FROM netrino_custom_attr'
+                             ' WHERE product_id IN (%s)'
+                             ' GROUP BY name,value'
+                             ' ORDER BY name,value' % products,
+                             values).fetchall()
+
+    return {'categories': cats,
+            'attributes': attrs}
+
+
+def rebuild():
+    """Recount category and custom attribute facets.
+
+    Returns:
+        Number of facets counted.
+    """
+    with db() as conn:
+        cats = conn.execute('SELECT c.name,p.domain,'
+                            'COUNT(c.product_id) AS products'
+                            ' FROM netrino_categories c'
+                            ' INNER JOIN netrino_product p'
+                            ' ON p.id=c.product_id'
+                            ' GROUP BY c.name,p.domain').fetchall()
+        attrs = conn.execute('SELECT a.name,a.value,p.domain,'
+                             'COUNT(a.product_id) AS products'
+                             ' FROM netrino_custom_attr a'
+                             ' INNER JOIN netrino_product p'
+                             ' ON p.id=a.product_id'
+                             ' GROUP BY a.name,a.value,p.domain').fetchall()
+        conn.execute('DELETE FROM netrino_category')
+        conn.execute('DELETE FROM netrino_attr_facet')
+        for cat in cats:
+            count_category(conn, cat['name'], cat['products'],
+                           cat['domain'])
+        for attr in attrs:
+            count_attribute(conn, attr['name'], attr['value'],
+                            attr['products'], attr['domain'])
+        conn.commit()
+
+    return len(cats) + len(attrs)
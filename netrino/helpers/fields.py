@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+from luxon.exceptions import ValidationError
+
+
+def requested(req, available, default=None):
+    """Fields requested with the comma separated fields query parameter.
+
+    Large columns left out of default are deferred, only selected when
+    requested explicitly.
+
+    Args:
+        req: Request object.
+        available (tuple): Fields that may be requested.
+        default (tuple): Fields returned when none are requested, all
+            available fields if None.
+
+    Returns:
+        Tuple of fields in the order of available, always including 'id'
+        when available.
+
+    Raises:
+        ValidationError: When an unknown field is requested.
+    """
+    query = req.query_params.get('fields', None)
+    if not query:
+        return tuple(default if default is not None else available)
+
+    names = set(field.strip() for field in query.split(',')
+                if field.strip())
+    unknown = names - set(available)
+    if unknown:
+        raise ValidationError("Unknown fields '%s', expected any of %s"
+                              % (', '.join(sorted(unknown)),
+                                 ', '.join(available)))
+    if 'id' in available:
+        names.add('id')
+
+    return tuple(field for field in available if field in names)
+
+
+def project(record, fields):
+    """Record with only the given fields.
+
+    Args:
+        record (dict): Record.
+        fields (tuple): Fields to keep.
+
+    Returns:
+        New dict.
+    """
+    return {field: record[field] for field in fields if field in record}
+
+
+def number(req, name, default, minimum=0):
+    """Integer query parameter.
+
+    Args:
+        req: Request object.
+        name (str): Query parameter.
+        default (int): Value when not given.
+        minimum (int): Smallest value accepted.
+
+    Raises:
+        ValidationError: When the value is not an integer of at least
+            minimum.
+    """
+    value = req.query_params.get(name, None)
+    if value is None or value == '':
+        return default
+
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        value = None
+    if value is None or value < minimum:
+        raise ValidationError("Invalid %s '%s', expected an integer of at"
+                              " least %s" % (name, req.query_params[name],
+                                             minimum))
+
+    return value
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+import time
+from threading import Lock, BoundedSemaphore
+from contextlib import contextmanager
+
+from luxon import g
+from luxon import GetLogger
+from luxon.exceptions import NotFoundError, ValidationError
+
+from netrino.helpers.sessions import Unavailable
+from netrino.helpers.plugins import plugins
+
+log = GetLogger(__name__)
+
+# Exceptions raised by interfaces that do not indicate a failing element,
+# GeneratorExit being a streamed result closed early.
+IGNORED = (NotFoundError, ValidationError, Unavailable, GeneratorExit,)
+
+
+class CircuitOpen(Unavailable):
+    """Calls to the element are failing, not attempted until reset."""
+
+
+class Busy(Unavailable):
+    """Concurrency limit reached and no call finished within the timeout."""
+
+
+class Breaker(object):
+    """Circuit breaker of an element.
+
+    Opens after a number of consecutive failures. Once open for reset
+    seconds a single probe call is allowed through, closing the circuit
+    when it succeeds and opening it again when it fails. A success of a
+    call started before the last failure, such as a call that timed out,
+    is ignored.
+
+    Args:
+        failures (int): Consecutive failures opening the circuit.
+        reset (float): Seconds open before probing.
+    """
+    def __init__(self, failures=5, reset=30):
+        self.threshold = failures
+        self.reset = reset
+        self.failures = 0
+        self.opened = None
+        self.failed = None
+        self._probing = False
+        self._lock = Lock()
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return 'closed'
+        if self._probing or time.monotonic() - self.opened >= self.reset:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self.opened is None:
+                return True
+            if (not self._probing and
+                    time.monotonic() - self.opened >= self.reset):
+                self._probing = True
+                return True
+            return False
+
+    def success(self, started=None):
+        with self._lock:
+            if (started is not None and self.failed is not None and
+                    started <= self.failed):
+                # Outcome known to be outdated by a later failure.
+                return
+            self.failures = 0
+            self.opened = None
+            self._probing = False
+
+    def cancel(self):
+        # Call not attempted, not a verdict on the element.
+        with self._lock:
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failed = time.monotonic()
+            self.failures += 1
+            if self.opened is not None or self.failures >= self.threshold:
+                self.opened = time.monotonic()
+            self._probing = False
+
+
+class Guard(object):
+    """Concurrency limits and circuit breakers of interface calls.
+
+    Args:
+        element_limit (int): Concurrent calls per interface and element.
+        interface_limit (int): Concurrent calls per interface.
+        failures (int): Consecutive failures opening an element circuit.
+        reset (float): Seconds a circuit stays open before probing.
+        timeout (float): Seconds to wait at a concurrency limit.
+        idle (float): Seconds without calls before the limit and closed
+            circuit of an element are forgotten.
+    """
+    def __init__(self, element_limit=2, interface_limit=64, failures=5,
+                 reset=30, timeout=30, idle=300):
+        self.element_limit = element_limit
+        self.interface_limit = interface_limit
+        self.failures = failures
+        self.reset = reset
+        self.timeout = timeout
+        self.idle = idle
+        self._lock = Lock()
+        self._semaphores = {}
+        self._breakers = {}
+        self._calls = {}
+        self._used = {}
+        self._evicted = time.monotonic()
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._rejected = 0
+        self._busy = 0
+
+    def _semaphore(self, key, limit):
+        with self._lock:
+            try:
+                return self._semaphores[key]
+            except KeyError:
+                semaphore = self._semaphores[key] = BoundedSemaphore(limit)
+                return semaphore
+
+    def breaker(self, interface, element_id):
+        key = (interface, str(element_id),)
+        with self._lock:
+            try:
+                return self._breakers[key]
+            except KeyError:
+                breaker = self._breakers[key] = Breaker(self.failures,
+                                                        self.reset)
+                return breaker
+
+    def _acquire(self, semaphores):
+        start = time.monotonic()
+        acquired = []
+        try:
+            for semaphore in semaphores:
+                remaining = start + self.timeout - time.monotonic()
+                if not semaphore.acquire(timeout=max(0, remaining)):
+                    with self._lock:
+                        self._busy += 1
+                    raise Busy('Concurrency limit reached, no call finished'
+                               ' within %s seconds' % self.timeout)
+                acquired.append(semaphore)
+        except BaseException:
+            for semaphore in acquired:
+                semaphore.release()
+            raise
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self._waits += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        return acquired
+
+    @contextmanager
+    def enter(self, interface, element_id):
+        """Guard a call to an element.
+
+        Raises:
+            NotFoundError: When the interface is not registered.
+            CircuitOpen: When calls to the element are failing.
+            Busy: When the concurrency limits were reached and no call
+                finished within the timeout.
+        """
+        if interface not in plugins('tachyonic_interfaces'):
+            raise NotFoundError("Interface '%s' not registered" % interface)
+
+        key = (interface, str(element_id),)
+        if time.monotonic() - self._evicted > self.idle:
+            self.evict()
+        with self._lock:
+            # Calls in flight keep their element from being evicted.
+            self._calls[key] = self._calls.get(key, 0) + 1
+
+        try:
+            breaker = self.breaker(interface, element_id)
+            if not breaker.allow():
+                with self._lock:
+                    self._rejected += 1
+                raise CircuitOpen("Calls to element '%s' via '%s' are"
+                                  " failing, retry later"
+                                  % (element_id, interface))
+
+            # The element first, callers queued for a slow element not
+            # holding calls to other elements up.
+            try:
+                acquired = self._acquire((
+                    self._semaphore(key, self.element_limit),
+                    self._semaphore((interface,), self.interface_limit),))
+            except Busy:
+                breaker.cancel()
+                raise
+
+            started = time.monotonic()
+            try:
+                yield
+            except IGNORED:
+                breaker.success(started)
+                raise
+            except BaseException:
+                breaker.failure()
+                if breaker.opened is not None:
+                    log.warning("Circuit to element '%s' via '%s' open"
+                                " after %s failures"
+                                % (element_id, interface, breaker.failures))
+                raise
+            else:
+                breaker.success(started)
+            finally:
+                for semaphore in acquired:
+                    semaphore.release()
+        finally:
+            with self._lock:
+                self._calls[key] -= 1
+                if not self._calls[key]:
+                    del self._calls[key]
+                self._used[key] = time.monotonic()
+
+    def evict(self):
+        """Forget the limits and closed circuits of elements without calls
+        for idle seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evicted = now
+            for key in set(self._breakers) | set(
+                    key for key in self._semaphores if len(key) == 2):
+                breaker = self._breakers.get(key)
+                if (key in self._calls or
+                        now - self._used.get(key, 0) <= self.idle or
+                        (breaker is not None and
+                         breaker.opened is not None)):
+                    continue
+                self._semaphores.pop(key, None)
+                self._breakers.pop(key, None)
+                self._used.pop(key, None)
+
+    def metrics(self):
+        """Queue wait, rejected calls and open circuits.
+        """
+        with self._lock:
+            breakers = list(self._breakers.items())
+            metrics = {'calls': self._waits,
+                       'queue_wait_total': self._wait_total,
+                       'queue_wait_max': self._wait_max,
+                       'queue_wait_avg': (self._wait_total / self._waits
+                                          if self._waits else 0),
+                       'busy': self._busy,
+                       'rejected': self._rejected}
+
+        metrics['circuits'] = [{'interface': key[0],
+                                'element_id': key[1],
+                                'state': breaker.state,
+                                'failures': breaker.failures}
+                               for key, breaker in breakers
+                               if breaker.opened is not None]
+        return metrics
+
+
+_guard = None
+
+
+def guard():
+    """Process wide interface call guard configured by [interfaces].
+    """
+    global _guard
+
+    if _guard is None:
+        config = g.app.config
+        _guard = Guard(element_limit=config.getint('interfaces',
+                                                   'element_limit',
+                                                   fallback=2),
+                       interface_limit=config.getint('interfaces',
+                                                     'interface_limit',
+                                                     fallback=64),
+                       failures=config.getint('interfaces', 'failures',
+                                              fallback=5),
+                       reset=config.getfloat('interfaces', 'reset',
+                                             fallback=30),
+                       timeout=config.getfloat('interfaces', 'timeout',
+                                               fallback=30),
+                       idle=config.getfloat('interfaces', 'idle',
+                                            fallback=300))
+
+    return _guard
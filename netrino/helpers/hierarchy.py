@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+from uuid import uuid4
+
+from luxon import db
+from luxon.exceptions import ValidationError
+
+from netrino.helpers.products import PRODUCT_FIELDS
+
+EXPAND = ('children', 'descendants', 'ancestors',)
+
+
+def _link(conn, ancestors, descendants):
+    # Every pair of (ancestor, depth) and (descendant, depth) becomes a path
+    # through the edge joining the two sets.
+    for ancestor in ancestors:
+        for descendant in descendants:
+            conn.execute('INSERT INTO netrino_product_closure'
+                         ' (id,ancestor_id,descendant_id,depth)'
+                         ' VALUES (?,?,?,?)',
+                         (str(uuid4()), ancestor['ancestor_id'],
+                          descendant['descendant_id'],
+                          ancestor['depth'] + descendant['depth'] + 1,))
+
+
+def _ancestors(conn, pid):
+    return conn.execute('SELECT ancestor_id,depth'
+                        ' FROM netrino_product_closure'
+                        ' WHERE descendant_id=?', pid).fetchall()
+
+
+def _subtree(conn, pid):
+    return conn.execute('SELECT descendant_id,depth'
+                        ' FROM netrino_product_closure'
+                        ' WHERE ancestor_id=?', pid).fetchall()
+
+
+def add(conn, pid, parent_id=None):
+    """Add a new product to the closure table.
+
+    Executed on the connection of the transaction creating the product,
+    the caller commits.
+
+    Args:
+        conn: Database connection.
+        pid (str): Product id.
+        parent_id (str): Parent product id.
+
+    Returns:
+        False if the parent is not indexed and the product could not be
+        linked to its ancestors, otherwise True.
+    """
+    conn.execute('INSERT INTO netrino_product_closure'
+                 ' (id,ancestor_id,descendant_id,depth)'
+                 ' VALUES (?,?,?,0)', (str(uuid4()), pid, pid,))
+    if parent_id:
+        ancestors = _ancestors(conn, parent_id)
+        _link(conn, ancestors, [{'descendant_id': pid, 'depth': 0}])
+        return len(ancestors) > 0
+    return True
+
+
+def move(conn, pid, parent_id=None):
+    """Move a product and its subtree to a new parent.
+
+    Args:
+        conn: Database connection.
+        pid (str): Product id.
+        parent_id (str): New parent product id, None for a root product.
+
+    Raises:
+        ValidationError: When the new parent is within the subtree.
+    """
+    subtree = _subtree(conn, pid)
+    if not subtree:
+        # Not indexed yet, such as products predating the closure table.
+        add(conn, pid, parent_id)
+        return
+
+    ids = [row['descendant_id'] for row in subtree]
+    if parent_id in ids:
+        raise ValidationError("Product can not be its own descendant")
+
+    # Paths from outside the subtree into it run through the old parent.
+    marks = ','.join('?' * len(ids))
+    conn.execute('DELETE FROM netrino_product_closure'
+                 ' WHERE descendant_id IN (%s) AND ancestor_id NOT IN (%s)'
+                 % (marks, marks), ids + ids)
+    if parent_id:
+        _link(conn, _ancestors(conn, parent_id), subtree)
+
+
+def remove(conn, pid):
+    """Remove a product from the closure table.
+
+    Products with children can not be removed, as with the product itself.
+
+    Args:
+        conn: Database connection.
+        pid (str): Product id.
+    """
+    conn.execute('DELETE FROM netrino_product_closure'
+                 ' WHERE descendant_id=?', pid)
+
+
+def expand(pid, relation):
+    """Related products from the closure table in a single query.
+
+    Args:
+        pid (str): Product id.
+        relation (str): 'children', 'descendants' or 'ancestors'.
+
+    Returns:
+        List of products with their depth relative to pid, nearest first.
+    """
+    if relation not in EXPAND:
+        raise ValidationError("Invalid expand '%s', expected one of %s"
+                              % (relation, ', '.join(EXPAND)))
+    if relation == 'ancestors':
+        join, where = 'ancestor_id', 'descendant_id'
+    else:
+        join, where = 'descendant_id', 'ancestor_id'
+    if relation == 'children':
+        depth = 'c.depth=1'
+    else:
+        depth = 'c.depth>0'
+
+    fields = ','.join('p.%s' % field for field in PRODUCT_FIELDS)
+    with db() as conn:
+        return conn.execute('SELECT %s,c.depth'
+                            ' FROM netrino_product_closure c'
+                            ' INNER JOIN netrino_product p ON p.id=c.%s'
+                            ' WHERE c.%s=? AND %s'
+                            ' ORDER BY c.depth,p.name'
+                            % (fields, join, where, depth), pid).fetchall()
+
+
+def bundle(pid):
+    """Price roll-up of a product and all its descendants.
+
+    Args:
+        pid (str): Product id.
+
+    Returns:
+        Dict with the bundle 'price', the 'monthly' portion of it and the
+        number of 'products'.
+    """
+    with db() as conn:
+        result = conn.execute('SELECT SUM(p.price) AS price,'
+                              ' SUM(CASE WHEN p.monthly THEN p.price'
+                              ' ELSE 0 END) AS monthly,'
+                              ' COUNT(p.id) AS products'
+                              ' FROM netrino_product_closure c'
+                              ' INNER JOIN netrino_product p'
+                              ' ON p.id=c.descendant_id'
+                              ' WHERE c.ancestor_id=?', pid).fetchone()
+    return {'price': result['price'] or 0,
+            'monthly': result['monthly'] or 0,
+            'products': result['products']}
+
+
+def rebuild():
+    """Rebuild the closure table from the product parent_id column.
+
+    Returns:
+        Number of closure rows.
+    """
+    with db() as conn:
+        parents = {row['id']: row['parent_id'] for row in
+                   conn.execute('SELECT id,parent_id'
+                                ' FROM netrino_product').fetchall()}
+        conn.execute('DELETE FROM netrino_product_closure')
+        rows = 0
+        for pid in parents:
+            ancestor, depth, seen = pid, 0, set()
+            while ancestor and ancestor in parents and ancestor not in seen:
+                seen.add(ancestor)
+                conn.execute('INSERT INTO netrino_product_closure'
+                             ' (id,ancestor_id,descendant_id,depth)'
+                             ' VALUES (?,?,?,?)',
+                             (str(uuid4()), ancestor, pid, depth,))
+                ancestor = parents[ancestor]
+                depth += 1
+                rows += 1
+        conn.commit()
+
+    return rows
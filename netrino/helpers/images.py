@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+from io import BytesIO
+from hashlib import sha256
+
+from PIL import Image
+
+from luxon import g
+from luxon import db
+from luxon import GetLogger
+from luxon.utils.timezone import now
+
+from netrino.helpers.dialect import insert_ignore
+
+log = GetLogger(__name__)
+
+
+def thumbnail(data, size):
+    """Resized copy of an image, PNG for images with transparency and JPEG
+    otherwise.
+
+    Data Pillow is unable to read gets no thumbnail.
+
+    Args:
+        data (bytes): Image data.
+        size (int): Maximum width and height in pixels.
+
+    Returns:
+        Tuple of thumbnail data and content type or None.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+        image.thumbnail((size, size))
+        if image.mode in ('RGBA', 'LA', 'P',):
+            fmt = 'png'
+        else:
+            fmt = 'jpeg'
+            image = image.convert('RGB')
+        thumb = BytesIO()
+        image.save(thumb, fmt, optimize=True)
+    except Exception as e:
+        log.error('Unable to create thumbnail: %s' % e)
+        return None
+
+    return thumb.getvalue(), 'image/' + fmt
+
+
+def store(conn, data, content_type):
+    """Store image data once per content.
+
+    Args:
+        conn: Database connection.
+        data (bytes): Image data.
+        content_type (str): Image mime type.
+
+    Returns:
+        Image id, the SHA-256 hex digest of the data.
+    """
+    image_id = sha256(data).hexdigest()
+    conn.execute(insert_ignore('netrino_image',
+                               ('id', 'content_type', 'data',
+                                'creation_time',)),
+                 (image_id, content_type, data, now(),))
+
+    return image_id
+
+
+def save_product_image(pid, data, content_type):
+    """Store a product image along with its thumbnail.
+
+    Args:
+        pid (str): Product id.
+        data (bytes): Image data.
+        content_type (str): Image mime type.
+
+    Returns:
+        dict with image_id and thumbnail_id.
+    """
+    size = g.app.config.getint('images', 'thumbnail', fallback=256)
+    thumb = thumbnail(data, size)
+
+    with db() as conn:
+        image_id = store(conn, data, content_type)
+        if thumb:
+            thumbnail_id = store(conn, *thumb)
+        else:
+            thumbnail_id = image_id
+        conn.execute('UPDATE netrino_product SET image=NULL,image_type=?,'
+                     'image_id=?,thumbnail_id=? WHERE id=?',
+                     (content_type, image_id, thumbnail_id, pid,))
+        conn.commit()
+
+    return {'image_id': image_id, 'thumbnail_id': thumbnail_id}
+
+
+def load(image_id):
+    """Image content type and data.
+
+    Args:
+        image_id (str): Image id.
+
+    Returns:
+        dict with content_type and data or None.
+    """
+    with db() as conn:
+        return conn.execute('SELECT content_type,data FROM netrino_image'
+                            ' WHERE id=?', image_id).fetchone()
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+import sys
+import time
+from threading import Lock, Event
+from contextlib import ExitStack
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from luxon import g
+from luxon.exceptions import NotFoundError
+
+from netrino.helpers.sessions import pool
+from netrino.helpers.guard import guard
+from netrino.helpers.plugins import plugins
+from netrino.utils.lru import LRU
+
+# Request methods of calls that may be served from the result cache.
+CACHEABLE = ('GET', 'HEAD',)
+
+_MISSING = object()
+
+
+class _Call(object):
+    # Call in flight, shared by concurrent identical calls.
+    __slots__ = ('done', 'result', 'error',)
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class Results(object):
+    """Cache of interface call results with request coalescing.
+
+    Concurrent calls with the same key wait for the first one instead of
+    each reaching the element.
+
+    Args:
+        size (int): Maximum results kept.
+    """
+    def __init__(self, size=10000):
+        self._cache = LRU(size)
+        self._calls = {}
+        self._lock = Lock()
+
+    def get(self, key, ttl, func, *args):
+        """Cached result of func, calling it when not cached.
+
+        Args:
+            key (tuple): Cache key.
+            ttl (float): Seconds the result is cached.
+            func (callable): Function returning the result.
+            args: Arguments of func.
+        """
+        result = self._cache.get(key, _MISSING)
+        if result is not _MISSING:
+            return result
+
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = _Call()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func(*args)
+            self._cache.set(key, flight.result, ttl)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            flight.done.set()
+
+    def clear(self):
+        self._cache.clear()
+
+
+_results = None
+
+
+def results():
+    """Process wide interface result cache.
+    """
+    global _results
+
+    if _results is None:
+        _results = Results(g.app.config.getint('interfaces', 'cache_size',
+                                               fallback=10000))
+
+    return _results
+
+
+def _ttl(interface, property, method, req):
+    # Interfaces declare cacheable calls in a 'cache' attribute mapping
+    # 'property' or 'property.method' to seconds.
+    if req is not None and getattr(req, 'method', None) not in CACHEABLE:
+        return None
+    cls = plugins('tachyonic_interfaces').get(interface)
+    declared = getattr(cls, 'cache', None) or {}
+    return declared.get('%s.%s' % (property, method) if method
+                        else property)
+
+
+def call(interface, element_id, property, method=None, req=None):
+    """Call an interface property or a method of a property on an element.
+
+    Results of calls the interface declares cacheable are cached for the
+    declared seconds, keyed by element, property, method and query string.
+    Only calls without request or with a GET or HEAD request are cached.
+
+    Methods may return an iterator to stream large results. The call is
+    returned as an iterator holding the element session until exhausted
+    or closed, except for cached results which are collected into a list.
+
+    Args:
+        interface (str): Name of the tachyonic_interfaces plugin.
+        element_id (str): Element id.
+        property (str): Interface method, or property holding method.
+        method (str): Method of the property object.
+        req: Request passed to the method.
+
+    Returns:
+        Result of the method.
+    """
+    ttl = _ttl(interface, property, method, req)
+    if ttl:
+        key = (interface, str(element_id), property, method,
+               getattr(req, 'query_string', None) or '',)
+        return results().get(key, ttl, _collected, interface, element_id,
+                             property, method, req)
+
+    return _call(interface, element_id, property, method, req)
+
+
+def streaming(result):
+    """Whether a call result is an iterator to stream.
+    """
+    return isinstance(result, Iterator) and not isinstance(
+        result, (str, bytes, dict, list, tuple,))
+
+
+def _collected(*args):
+    result = _call(*args)
+    if streaming(result):
+        return list(result)
+    return result
+
+
+def _call(interface, element_id, property, method, req):
+    with ExitStack() as stack:
+        stack.enter_context(guard().enter(interface, element_id))
+        obj = stack.enter_context(pool().session(interface, element_id))
+        # Unknown names are a mistake of the caller, not a failing element.
+        try:
+            target = getattr(obj, property)
+            if method:
+                target = getattr(target, method)
+        except AttributeError:
+            target = None
+        if not callable(target):
+            raise NotFoundError("Interface '%s' has no method '%s'"
+                                % (interface, '.'.join(
+                                    name for name in (property, method)
+                                    if name)))
+        result = target(req)
+        if not streaming(result):
+            return result
+        return _Stream(stack.pop_all(), result)
+
+
+class _Stream(Iterator):
+    # Streamed result, releasing the session and guard once exhausted,
+    # failed or closed.
+    def __init__(self, stack, result):
+        self._stack = stack
+        self._result = iter(result)
+
+    def __next__(self):
+        if self._stack is None:
+            raise StopIteration
+        try:
+            return next(self._result)
+        except StopIteration:
+            self._exit(None, None, None)
+            raise
+        except BaseException:
+            self._exit(*sys.exc_info())
+            raise
+
+    def _exit(self, *exc_info):
+        stack, self._stack = self._stack, None
+        if stack is not None:
+            stack.__exit__(*exc_info)
+
+    def close(self):
+        if self._stack is None:
+            return
+        if hasattr(self._result, 'close'):
+            self._result.close()
+        try:
+            self._exit(GeneratorExit, GeneratorExit(), None)
+        except GeneratorExit:
+            pass
+
+    def __del__(self):
+        self.close()
+
+
+def fan_out(interface, element_ids, property, method=None, req=None,
+            workers=None, timeout=None):
+    """Call an interface on many elements concurrently.
+
+    Calls run on a bounded thread pool. A call running longer than timeout
+    is reported as timed out and no longer waited for.
+
+    Args:
+        interface (str): Name of the tachyonic_interfaces plugin.
+        element_ids (list): Element ids.
+        property (str): Interface method, or property holding method.
+        method (str): Method of the property object.
+        req: Request passed to each call.
+        workers (int): Concurrent calls, [interfaces] batch_workers.
+        timeout (float): Seconds per call, [interfaces] call_timeout.
+
+    Returns:
+        Generator of dicts with the element 'id' and its 'result' or
+        'error', in order of completion.
+    """
+    config = g.app.config
+    if workers is None:
+        workers = config.getint('interfaces', 'batch_workers', fallback=32)
+    if timeout is None:
+        timeout = config.getfloat('interfaces', 'call_timeout', fallback=30)
+
+    # Created before the workers use them.
+    pool()
+    guard()
+    started = {}
+
+    def run(element_id, future_id):
+        started[future_id] = time.monotonic()
+        result = call(interface, element_id, property, method, req)
+        if streaming(result):
+            return list(result)
+        return result
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        pending = {}
+        for element_id in dict.fromkeys(element_ids):
+            future = executor.submit(run, element_id, len(pending))
+            pending[future] = (element_id, len(pending))
+
+        while pending:
+            now = time.monotonic()
+            running = [started[pending[f][1]] for f in pending
+                       if pending[f][1] in started]
+            wait_for = timeout
+            if running:
+                wait_for = max(0, min(running) + timeout - now)
+            done, not_done = wait(pending, timeout=wait_for,
+                                  return_when=FIRST_COMPLETED)
+            for future in done:
+                element_id, future_id = pending.pop(future)
+                try:
+                    yield {'id': element_id, 'result': future.result()}
+                except Exception as e:
+                    yield {'id': element_id, 'error': str(e) or
+                           e.__class__.__name__}
+
+            now = time.monotonic()
+            for future in list(pending):
+                element_id, future_id = pending[future]
+                if (future_id in started and
+                        now - started[future_id] >= timeout):
+                    del pending[future]
+                    future.cancel()
+                    guard().breaker(interface, element_id).failure()
+                    yield {'id': element_id,
+                           'error': 'Timed out after %s seconds' % timeout}
+    finally:
+        for future in pending:
+            future.cancel()
+        # Timed out calls finish in the background.
+        executor.shutdown(wait=False)
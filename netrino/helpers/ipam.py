@@ -0,0 +1,1236 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+"""IP address management.
+
+Prefixes form a binary buddy tree per IP version: a prefix is split into
+both its halves down to the prefix being added or allocated, and free
+halves are merged again when released. Every node of the tree is a row of
+netrino_prefix with one of the types:
+
+    container: Prefix added with add_prefix, allocations are made from
+        containers tagged as pools.
+    hidden: Split of the tree, free when not split any further.
+    allocated: Prefix allocated from a container, or the type given to
+        allocate_prefix.
+
+The tree is mirrored in memory by a binary trie, loaded once per process
+and updated as prefixes are written, so lookups descend at most one node
+per prefix bit instead of querying the database. The free blocks of each
+container are kept by prefix length for find to allocate from the
+smallest block fitting, buddy system style. Every node also counts the
+addresses and prefixes allocated in it, updated along the path to the
+root as prefixes are allocated and released, for the usage of any prefix
+to be read without going through the prefixes inside.
+
+Worker processes each have their own trie. Writes are optimistic: every
+row has a revision, incremented when the row or its halves change, and
+rows are only updated and deleted at the revision the trie last read or
+wrote, while the unique index on the prefixes rejects halves inserted by
+two processes and new roots are checked for roots added around them.
+When another process changed the rows the transaction is rolled back,
+the trees involved are reloaded and the operation retried.
+"""
+import time
+import random
+from uuid import uuid4
+from functools import wraps
+from bisect import bisect_left, bisect_right, insort
+from threading import RLock, Thread, local
+from contextlib import contextmanager
+from ipaddress import ip_network, IPv4Address, IPv6Address
+
+from luxon import g
+from luxon import db
+from luxon import GetLogger
+from luxon.exceptions import NotFoundError, ValidationError
+from luxon.exceptions import SQLIntegrityError
+from luxon.utils.timezone import now
+
+from netrino.helpers.dialect import insert_many
+
+log = GetLogger(__name__)
+
+CONTAINER = 'container'
+HIDDEN = 'hidden'
+ALLOCATED = 'allocated'
+
+BITS = {4: 32, 6: 128}
+
+FIELDS = ('id', 'name', 'version', 'a1', 'a2', 'a3', 'a4', 'prefix_len',
+          'parent', 'free', 'type', 'revision',)
+
+WORD = 0xFFFFFFFF
+
+# Prefixes of which usage is returned at most, as for a heatmap.
+USAGE_PREFIXES = 4096
+
+
+def words(address):
+    """Split an address into the four 32-bit words a1..a4."""
+    return (address >> 96 & WORD, address >> 64 & WORD,
+            address >> 32 & WORD, address & WORD,)
+
+
+class Conflict(Exception):
+    """Prefixes were changed by another process."""
+
+
+def parse(prefix):
+    """Version, network address and length of a prefix.
+
+    Raises:
+        ValidationError: Not a valid network prefix.
+    """
+    try:
+        network = ip_network(prefix)
+    except ValueError:
+        raise ValidationError("Invalid prefix '%s'" % prefix)
+    return network.version, int(network.network_address), network.prefixlen
+
+
+def text(version, address, length):
+    """Prefix in CIDR notation."""
+    if version == 4:
+        return '%s/%s' % (IPv4Address(address), length,)
+    return '%s/%s' % (IPv6Address(address), length,)
+
+
+def _inside(version, address, length, shortest=None):
+    # Condition on the rows inside a prefix, the words it covers equal
+    # and the first word it covers partly within range, of prefix length
+    # shortest or longer.
+    low = words(address)
+    high = words(address | (1 << BITS[version] - length) - 1)
+    sql = ['version=?']
+    vals = [version]
+    for field, first, last in zip(('a1', 'a2', 'a3', 'a4',), low, high):
+        if first == last:
+            sql.append('%s=?' % field)
+            vals.append(first)
+        else:
+            sql.append('%s BETWEEN ? AND ?' % field)
+            vals += [first, last]
+            break
+    sql.append('prefix_len>=?')
+    vals.append(length if shortest is None else shortest)
+    return ' AND '.join(sql), vals
+
+
+def _above(version, address, length):
+    # Condition on the rows containing a prefix, shorter than it.
+    bits = BITS[version]
+    sql = ['(a1=? AND a2=? AND a3=? AND a4=? AND prefix_len=?)'] * length
+    vals = [version]
+    for top in range(length):
+        vals += words(address >> bits - top << bits - top) + (top,)
+    return 'version=? AND (%s)' % ' OR '.join(sql or ['0=1']), vals
+
+
+class Node(object):
+    """Prefix in the trie.
+    """
+    __slots__ = ('id', 'name', 'version', 'address', 'length', 'parent',
+                 'free', 'type', 'up', 'children', 'revision', 'allocated',
+                 'allocations',)
+
+    def __init__(self, id, name, version, address, length, parent=None,
+                 free=False, type=HIDDEN):
+        self.id = id
+        self.name = name
+        self.version = version
+        self.address = address
+        self.length = length
+        self.parent = parent
+        self.free = bool(free)
+        self.type = type
+        self.up = None
+        self.children = None
+        # Revision of the row when last read or written.
+        self.revision = 0
+        # Addresses and prefixes allocated in the node, itself included.
+        self.own()
+
+    @property
+    def key(self):
+        return (self.version, self.address, self.length,)
+
+    @property
+    def prefix(self):
+        return text(self.version, self.address, self.length)
+
+    @property
+    def size(self):
+        return 1 << BITS[self.version] - self.length
+
+    def own(self):
+        """Count only the node itself, allocated or not."""
+        if self.type in (CONTAINER, HIDDEN,):
+            self.allocated = self.allocations = 0
+        else:
+            self.allocated = self.size
+            self.allocations = 1
+
+    def contains(self, version, address, length):
+        shift = BITS[version] - self.length
+        return (self.version == version and self.length <= length and
+                address >> shift == self.address >> shift)
+
+    def child(self, address):
+        """Half of the node containing address."""
+        shift = BITS[self.version] - self.length - 1
+        return self.children[address >> shift & 1]
+
+    def row(self):
+        a1, a2, a3, a4 = words(self.address)
+        return {'id': self.id, 'name': self.name, 'version': self.version,
+                'a1': a1, 'a2': a2, 'a3': a3, 'a4': a4,
+                'prefix_len': self.length, 'parent': self.parent,
+                'free': self.free, 'type': self.type,
+                'revision': self.revision, 'prefix': self.prefix}
+
+
+class Blocks(object):
+    """Free blocks of a container.
+
+    Addresses of the free blocks of each prefix length are kept sorted,
+    with a bitmask of the lengths having free blocks. The longest length
+    not longer than requested, the smallest block fitting, is the highest
+    bit set in the masked bitmask.
+    """
+    __slots__ = ('lengths', 'mask',)
+
+    def __init__(self):
+        self.lengths = {}
+        self.mask = 0
+
+    def __len__(self):
+        return sum(len(addresses) for addresses in self.lengths.values())
+
+    def add(self, node):
+        insort(self.lengths.setdefault(node.length, []), node.address)
+        self.mask |= 1 << node.length
+
+    def remove(self, node):
+        addresses = self.lengths[node.length]
+        del addresses[bisect_left(addresses, node.address)]
+        if not addresses:
+            del self.lengths[node.length]
+            self.mask &= ~(1 << node.length)
+
+    def fit(self, length, spread=False):
+        """Length and address of the smallest free block fitting a prefix
+        length, lowest address first, or None.
+
+        Spread picks a random block of a random length fitting instead,
+        for processes conflicting on the same blocks to pick apart.
+        """
+        mask = self.mask & (1 << length + 1) - 1
+        if not mask:
+            return None
+        if spread:
+            fit = random.choice([fit for fit in self.lengths
+                                 if mask >> fit & 1])
+            return fit, random.choice(self.lengths[fit])
+        fit = mask.bit_length() - 1
+        return fit, self.lengths[fit][0]
+
+
+class Trie(object):
+    """Binary trie of all prefixes, shared by the threads of a process.
+
+    Roots of each IP version are kept sorted by address to find the tree
+    containing a prefix by bisection, from where lookups descend one bit
+    at a time. Free nodes are indexed by container in blocks.
+    """
+    def __init__(self):
+        self.lock = RLock()
+        self.loaded = False
+        self.loaded_at = None
+        # Times trees were reloaded since, by root key.
+        self.reloaded = {}
+        self.nodes = {}
+        self.ids = {}
+        self.tags = {}
+        self.blocks = {}
+        self._starts = {4: [], 6: []}
+        self._roots = {4: [], 6: []}
+
+    def load(self):
+        """(Re)load the trie from the database."""
+        with self.lock:
+            self.loaded = False
+            self.reloaded = {}
+            self.nodes = {}
+            self.ids = {}
+            self.tags = {}
+            self.blocks = {}
+            self._starts = {4: [], 6: []}
+            self._roots = {4: [], 6: []}
+
+            with db() as conn:
+                # Shorter prefixes first, parents are added before their
+                # halves.
+                rows = conn.execute('SELECT %s FROM netrino_prefix'
+                                    ' ORDER BY prefix_len' %
+                                    ','.join(FIELDS)).fetchall()
+                tags = conn.execute('SELECT prefix_id,tag'
+                                    ' FROM netrino_prefix_tag').fetchall()
+
+            self._count([self.add(self._node(row)) for row in rows])
+            self._tag(tags)
+
+            self.loaded = True
+            self.loaded_at = time.monotonic()
+            log.info('Loaded %s prefixes' % len(self.nodes))
+
+    def _node(self, row):
+        address = (row['a1'] << 96 | row['a2'] << 64 |
+                   row['a3'] << 32 | row['a4'])
+        node = Node(row['id'], row['name'], row['version'], address,
+                    row['prefix_len'], row['parent'], row['free'],
+                    row['type'])
+        node.revision = row['revision']
+        return node
+
+    def _tag(self, tags):
+        self.tags = {}
+        for tag in tags:
+            self.tags.setdefault(tag['tag'], set()).add(tag['prefix_id'])
+
+    def reload(self, version, address, length):
+        """Reload the tree of a prefix from the database.
+
+        The tree reloaded is the largest of the one containing the prefix
+        in the database and in the trie, other trees are kept.
+        """
+        bits = BITS[version]
+        with self.lock:
+            with db() as conn:
+                sql, vals = _above(version, address, length)
+                top = conn.execute('SELECT a1,a2,a3,a4,prefix_len'
+                                   ' FROM netrino_prefix WHERE %s'
+                                   ' ORDER BY prefix_len LIMIT 1' % sql,
+                                   vals).fetchone()
+                if top is not None and top['prefix_len'] < length:
+                    length = top['prefix_len']
+                    address = (top['a1'] << 96 | top['a2'] << 64 |
+                               top['a3'] << 32 | top['a4'])
+                node = self.locate(version, address, length)
+                while node is not None and node.up is not None:
+                    node = node.up
+                if node is not None and node.length < length:
+                    length = node.length
+                    address = node.address
+
+                sql, vals = _inside(version, address, length)
+                rows = conn.execute('SELECT %s FROM netrino_prefix'
+                                    ' WHERE %s ORDER BY prefix_len' %
+                                    (','.join(FIELDS), sql,),
+                                    vals).fetchall()
+                tags = conn.execute('SELECT prefix_id,tag'
+                                    ' FROM netrino_prefix_tag').fetchall()
+
+            for root in self.roots(version, address, length):
+                self.unroot(root)
+                self.reloaded.pop(root.key, None)
+                stack = [root]
+                while stack:
+                    node = stack.pop()
+                    del self.nodes[node.key]
+                    del self.ids[node.id]
+                    if node.free:
+                        self._unindex(node)
+                    stack.extend(node.children or ())
+            self._count([self.add(self._node(row)) for row in rows])
+            self._tag(tags)
+            reloaded = time.monotonic()
+            for root in self.roots(version, address, length):
+                self.reloaded[root.key] = reloaded
+
+    def resync(self, nodes, container=False):
+        """Reload from the database the smallest subtree containing nodes.
+
+        The subtree is that of the deepest common ancestor of the nodes
+        still in the database, or the trees of the nodes when none is.
+
+        Args:
+            nodes (list): Nodes to reload.
+            container (bool): Reload the whole container of the nodes.
+        """
+        with self.lock:
+            paths = []
+            for node in nodes:
+                path = []
+                while node is not None:
+                    path.append(node)
+                    node = node.up
+                paths.append(path[::-1])
+
+            common = []
+            for level in zip(*paths):
+                if any(node is not level[0] for node in level):
+                    break
+                common.append(level[0])
+
+            if common:
+                with db() as conn:
+                    found = {row['id']: row for row in conn.execute(
+                        'SELECT %s FROM netrino_prefix WHERE id IN (%s)' %
+                        (','.join(FIELDS), ','.join('?' * len(common)),),
+                        [node.id for node in common]).fetchall()}
+                    for node in reversed(common):
+                        row = found.get(node.id)
+                        if (row is not None and
+                                self.nodes.get(node.key) is node and
+                                (not container or
+                                 row['type'] == CONTAINER)):
+                            self._replace(conn, node, row)
+                            return
+
+            for top in set(path[0].key for path in paths):
+                self.reload(*top)
+
+    def _replace(self, conn, top, row):
+        # Replace a node and its subtree with the rows in the database.
+        sql, vals = _inside(top.version, top.address, top.length,
+                            top.length + 1)
+        rows = conn.execute('SELECT %s FROM netrino_prefix'
+                            ' WHERE %s ORDER BY prefix_len' %
+                            (','.join(FIELDS), sql,), vals).fetchall()
+        tags = conn.execute('SELECT prefix_id,tag'
+                            ' FROM netrino_prefix_tag').fetchall()
+
+        self._add(top.up, -top.allocated, -top.allocations)
+        stack = list(top.children or ())
+        top.children = None
+        while stack:
+            node = stack.pop()
+            del self.nodes[node.key]
+            del self.ids[node.id]
+            if node.free:
+                self._unindex(node)
+            stack.extend(node.children or ())
+
+        self.free(top, False)
+        top.name = row['name']
+        self.move(top, row['parent'])
+        top.type = row['type']
+        self.free(top, bool(row['free']))
+        top.revision = row['revision']
+        top.own()
+        self._count([self.add(self._node(row)) for row in rows])
+        self._add(top.up, top.allocated, top.allocations)
+        self._tag(tags)
+
+    def stale(self, seconds, version=None, address=None, length=None):
+        """Trie, or the tree containing a prefix, loaded more than seconds
+        ago."""
+        loaded = self.loaded_at
+        if version is not None:
+            node = self.locate(version, address, length)
+            while node is not None and node.up is not None:
+                node = node.up
+            if node is not None:
+                loaded = self.reloaded.get(node.key, loaded)
+        return time.monotonic() - loaded > seconds
+
+    def ready(self):
+        """Load the trie unless already loaded."""
+        if not self.loaded:
+            with self.lock:
+                if not self.loaded:
+                    self.load()
+        return self
+
+    def build(self):
+        """Load the trie in a background thread."""
+        def build():
+            try:
+                self.ready()
+            except Exception as e:
+                log.error('Unable to load prefixes: %s' % e)
+
+        Thread(target=build, daemon=True).start()
+
+    def add(self, node):
+        """Add a node below its parent half, or as a root.
+
+        The allocations of the node are not counted in the nodes above,
+        it is expected to be free or part of nodes counted with _count.
+        """
+        self.nodes[node.key] = node
+        self.ids[node.id] = node
+        if node.free:
+            self._index(node)
+        if node.length:
+            bits = BITS[node.version]
+            mask = ~((1 << bits - node.length + 1) - 1)
+            up = self.nodes.get((node.version, node.address & mask,
+                                 node.length - 1,))
+            if up is not None:
+                if up.children is None:
+                    up.children = [None, None]
+                up.children[node.address >> bits - node.length & 1] = node
+                node.up = up
+                return node
+        self.root(node)
+        return node
+
+    def _count(self, nodes):
+        # Add the allocations of nodes added in order of prefix length to
+        # the nodes above them, longest prefixes first.
+        for node in reversed(nodes):
+            if node.up is not None:
+                node.up.allocated += node.allocated
+                node.up.allocations += node.allocations
+
+    def _add(self, node, allocated, allocations):
+        # Add to the allocations of a node and the nodes above it.
+        while node is not None:
+            node.allocated += allocated
+            node.allocations += allocations
+            node = node.up
+
+    def remove(self, node):
+        self._add(node.up, -node.allocated, -node.allocations)
+        del self.nodes[node.key]
+        del self.ids[node.id]
+        if node.free:
+            self._unindex(node)
+        if node.up is None:
+            self.unroot(node)
+
+    def _index(self, node):
+        blocks = self.blocks.get(node.parent)
+        if blocks is None:
+            blocks = self.blocks[node.parent] = Blocks()
+        blocks.add(node)
+
+    def _unindex(self, node):
+        blocks = self.blocks[node.parent]
+        blocks.remove(node)
+        if not blocks.mask:
+            del self.blocks[node.parent]
+
+    def free(self, node, free=True):
+        """Mark a node free or not."""
+        if node.free != free:
+            if free:
+                node.free = True
+                self._index(node)
+            else:
+                self._unindex(node)
+                node.free = False
+
+    def retype(self, node, type):
+        """Set the type of a node, counting it allocated or not."""
+        allocated = node.type not in (CONTAINER, HIDDEN,)
+        node.type = type
+        if allocated != (type not in (CONTAINER, HIDDEN,)):
+            sign = -1 if allocated else 1
+            self._add(node, sign * node.size, sign)
+
+    def attach(self, node, half):
+        """Attach an unrooted tree as a half of a node."""
+        half.up = node
+        node.children[half.address >> BITS[node.version] -
+                      half.length & 1] = half
+        self._add(node, half.allocated, half.allocations)
+
+    def move(self, node, parent):
+        """Set the container of a node."""
+        if node.free:
+            self._unindex(node)
+            node.parent = parent
+            self._index(node)
+        else:
+            node.parent = parent
+
+    def root(self, node):
+        starts = self._starts[node.version]
+        i = bisect_left(starts, node.address)
+        starts.insert(i, node.address)
+        self._roots[node.version].insert(i, node)
+
+    def unroot(self, node):
+        starts = self._starts[node.version]
+        i = bisect_left(starts, node.address)
+        del starts[i]
+        del self._roots[node.version][i]
+
+    def roots(self, version, address, length):
+        """Roots inside a prefix."""
+        end = address + (1 << BITS[version] - length)
+        starts = self._starts[version]
+        return self._roots[version][bisect_left(starts, address):
+                                    bisect_left(starts, end)]
+
+    def locate(self, version, address, length):
+        """Deepest node containing a prefix, None if outside all trees."""
+        i = bisect_right(self._starts[version], address) - 1
+        if i < 0:
+            return None
+        node = self._roots[version][i]
+        if not node.contains(version, address, length):
+            return None
+        while node.children and node.length < length:
+            node = node.child(address)
+        return node
+
+
+_trie = None
+
+
+def trie():
+    """Process wide prefix trie.
+    """
+    global _trie
+
+    if _trie is None:
+        _trie = Trie()
+
+    return _trie
+
+
+class _Changes(object):
+    # Nodes written by an operation, flushed in one transaction.
+    def __init__(self):
+        self.inserted = {}
+        self.updated = {}
+        self.deleted = {}
+        self.untagged = []
+        self.rooted = []
+
+    def __bool__(self):
+        return bool(self.inserted or self.updated or self.deleted or
+                    self.untagged)
+
+    def clear(self):
+        self.__init__()
+
+    def insert(self, node):
+        self.inserted[node.id] = node
+
+    def update(self, node):
+        if node.id not in self.inserted:
+            self.updated[node.id] = node
+
+    def root(self, node):
+        # New root, no other process may have added rows around it.
+        self.rooted.append(node)
+
+    def delete(self, node):
+        self.updated.pop(node.id, None)
+        if self.inserted.pop(node.id, None) is None:
+            self.deleted[node.id] = node
+
+    def nodes(self):
+        return (list(self.inserted.values()) +
+                list(self.updated.values()) +
+                list(self.deleted.values()))
+
+    def flush(self, conn):
+        """Write the changes, only to rows at the revision of the nodes.
+
+        Raises:
+            Conflict: Rows were changed by another process.
+        """
+        deleted = list(self.deleted) + self.untagged
+        for i in range(0, len(deleted), 500):
+            ids = deleted[i:i + 500]
+            conn.execute('DELETE FROM netrino_prefix_tag'
+                         ' WHERE prefix_id IN (%s)' %
+                         ','.join('?' * len(ids)), ids)
+
+        revisions = {}
+        for node in self.deleted.values():
+            revisions.setdefault(node.revision, []).append(node.id)
+        for revision, deleted in revisions.items():
+            for i in range(0, len(deleted), 500):
+                ids = deleted[i:i + 500]
+                if conn.execute('DELETE FROM netrino_prefix'
+                                ' WHERE id IN (%s) AND revision=?' %
+                                ','.join('?' * len(ids)),
+                                ids + [revision]).rowcount != len(ids):
+                    raise Conflict('Prefixes deleted by another process')
+
+        for node in self.updated.values():
+            if not conn.execute('UPDATE netrino_prefix'
+                                ' SET name=?,parent=?,free=?,type=?,'
+                                'revision=revision+1'
+                                ' WHERE id=? AND revision=?',
+                                (node.name, node.parent, node.free,
+                                 node.type, node.id,
+                                 node.revision,)).rowcount:
+                raise Conflict("Prefix '%s' changed by another process" %
+                               node.prefix)
+
+        if self.inserted:
+            creation_time = now()
+            rows = []
+            for node in self.inserted.values():
+                row = node.row()
+                rows.append(tuple(row[field] for field in FIELDS) +
+                            (creation_time,))
+            try:
+                insert_many(conn, 'netrino_prefix',
+                            FIELDS + ('creation_time',), rows)
+            except SQLIntegrityError:
+                raise Conflict('Prefixes added by another process')
+
+        for node in self.rooted:
+            # The unique index only rejects the same prefixes, roots of
+            # other processes inside or around the new root are not.
+            inside, inside_vals = _inside(node.version, node.address,
+                                          node.length)
+            above, above_vals = _above(node.version, node.address,
+                                       node.length)
+            if conn.execute('SELECT id FROM netrino_prefix'
+                            ' WHERE (%s AND parent IS NULL AND id!=?)'
+                            ' OR (%s) LIMIT 1' % (inside, above,),
+                            inside_vals + [node.id] +
+                            above_vals).fetchone():
+                raise Conflict("Prefixes around '%s' added by another"
+                               " process" % node.prefix)
+
+    def saved(self):
+        # Written, the rows are now at the next revision.
+        for node in self.updated.values():
+            node.revision += 1
+
+
+# Conflicts of the operation of each thread.
+_conflicts = local()
+
+
+def _retried(method):
+    # Retry an operation conflicting with other processes, and reload a
+    # trie not loaded recently when the operation fails, it may be
+    # missing prefixes and tags added by other processes.
+    @wraps(method)
+    def retried(self, *args, **kwargs):
+        trie = self._trie.ready()
+        reloaded = False
+        attempt = _conflicts.count = 0
+        while True:
+            try:
+                return method(self, *args, **kwargs)
+            except Conflict as e:
+                attempt = _conflicts.count = attempt + 1
+                if attempt > self.retries:
+                    raise
+                log.debug('Retrying after conflict: %s' % e)
+                # Jitter apart processes conflicting on the same blocks.
+                time.sleep(random.uniform(0, min(0.001 * 2 ** attempt, 1)))
+            except (NotFoundError, ValidationError):
+                if reloaded or not trie.stale(self.refresh):
+                    raise
+                trie.load()
+                reloaded = True
+
+    return retried
+
+
+class IPAM(object):
+    """IP address management of prefixes in netrino_prefix.
+
+    Prefixes are given and returned in CIDR notation, IPv4 or IPv6.
+    """
+    def __init__(self):
+        self._trie = trie()
+        config = g.app.config
+        # Attempts of an operation conflicting with other processes.
+        self.retries = config.getint('ipam', 'retries', fallback=10)
+        # Seconds after which the trie is reloaded on failing operations.
+        self.refresh = config.getfloat('ipam', 'refresh', fallback=10)
+
+    @contextmanager
+    def _write(self):
+        trie = self._trie.ready()
+        with trie.lock:
+            changes = _Changes()
+            try:
+                yield changes
+                if changes:
+                    with db() as conn:
+                        try:
+                            changes.flush(conn)
+                            conn.commit()
+                        except Exception:
+                            conn.rollback()
+                            raise
+                    changes.saved()
+            except Exception:
+                if changes:
+                    self._discard(changes)
+                raise
+
+    def _discard(self, changes):
+        # Discard the changes made to the trie, reloading the nodes
+        # changed from the database. Once conflicting, the rest of the
+        # container is likely stale as well and reloaded.
+        try:
+            self._trie.resync(changes.nodes(),
+                              getattr(_conflicts, 'count', 0) > 0)
+        except Exception:
+            # Loaded again on the next operation.
+            self._trie.loaded = False
+            raise
+
+    def _split(self, changes, node, address, length):
+        # Split a free node or a container without halves down to the
+        # prefix of address and length, returning the node of the prefix.
+        trie = self._trie
+        parent = node.id if node.type == CONTAINER else node.parent
+        # Updated also when only split, for the revision of the row.
+        trie.free(node, False)
+        changes.update(node)
+        shift = BITS[node.version] - node.length - 1
+        while node.length < length:
+            for bit in (0, 1,):
+                half = Node(str(uuid4()), None, node.version,
+                            node.address | bit << shift,
+                            node.length + 1, parent, True)
+                trie.add(half)
+                changes.insert(half)
+            node = node.children[address >> shift & 1]
+            trie.free(node, False)
+            shift -= 1
+        return node
+
+    def _reparent(self, changes, node, parent):
+        # Set the parent of the nodes of the container or split node,
+        # not descending into nested containers.
+        stack = list(node.children or ())
+        while stack:
+            node = stack.pop()
+            if node.parent != parent:
+                self._trie.move(node, parent)
+                changes.update(node)
+            if node.children and node.type != CONTAINER:
+                stack.extend(node.children)
+
+    def _free(self, changes, node):
+        # Free a node and merge it with its free buddies, up to the
+        # enclosing container.
+        trie = self._trie
+        trie.retype(node, HIDDEN)
+        node.name = None
+        trie.free(node)
+        changes.update(node)
+        while node.up is not None:
+            up = node.up
+            if not (up.children[0].free and up.children[1].free):
+                # Not merged, for the revision of the row only.
+                changes.update(up)
+                break
+            for half in up.children:
+                trie.remove(half)
+                changes.delete(half)
+            up.children = None
+            if up.type == CONTAINER:
+                changes.update(up)
+                break
+            trie.free(up)
+            changes.update(up)
+            node = up
+        else:
+            # Free space outside any container is not kept.
+            trie.remove(node)
+            changes.delete(node)
+
+    def _pools(self, tag):
+        trie = self._trie
+        pools = [trie.ids[id] for id in trie.tags.get(tag, ())
+                 if id in trie.ids]
+        return sorted(pools, key=lambda node: node.key)
+
+    @_retried
+    def find(self, prefix_len, tag, name=None):
+        """Allocate a free prefix of a length from tagged pools.
+
+        The prefix is allocated from the smallest free block fitting in
+        any of the pools, at the lowest address of the blocks of that
+        size, keeping larger blocks whole for larger prefixes.
+
+        Args:
+            prefix_len (int): Length of the prefix.
+            tag (str): Tag of the containers to allocate from.
+            name (str): Name of the allocation.
+
+        Returns:
+            Allocated prefix.
+
+        Raises:
+            NotFoundError: No free prefix of the length in the pools.
+        """
+        with self._write() as changes:
+            node = self._find(changes, int(prefix_len), tag, name)
+            if node is not None:
+                return node.prefix
+
+        raise NotFoundError("Unable to allocate address from pool '%s'" %
+                            tag)
+
+    @_retried
+    def find_many(self, requests):
+        """Allocate prefixes from tagged pools, all or none.
+
+        The prefixes are written in one transaction. Longer prefixes are
+        allocated after shorter ones, keeping the pools less fragmented.
+
+        Args:
+            requests (list): Arguments of find for each prefix,
+                (prefix_len, tag, name).
+
+        Returns:
+            Allocated prefixes in the order requested.
+
+        Raises:
+            NotFoundError: A prefix could not be allocated, none are.
+        """
+        requests = [(int(prefix_len), tag, name,)
+                    for prefix_len, tag, name in requests]
+        allocated = {}
+        with self._write() as changes:
+            for i in sorted(range(len(requests)),
+                            key=lambda i: requests[i][0]):
+                prefix_len, tag, name = requests[i]
+                node = self._find(changes, prefix_len, tag, name)
+                if node is None:
+                    # Releasing in reverse merges every split again,
+                    # leaving the trie as it was.
+                    for node in reversed(list(allocated.values())):
+                        self._free(changes, node)
+                    changes.clear()
+                    raise NotFoundError("Unable to allocate address from"
+                                        " pool '%s'" % tag)
+                allocated[i] = node
+
+        return [allocated[i].prefix for i in range(len(requests))]
+
+    def _find(self, changes, prefix_len, tag, name):
+        trie = self._trie
+        block = None
+        for pool in self._pools(tag):
+            if not pool.length < prefix_len <= BITS[pool.version]:
+                continue
+            if pool.children is None:
+                # Empty pool, split from the pool itself.
+                fit = (pool.length, pool.address,)
+            else:
+                blocks = trie.blocks.get(pool.id)
+                fit = (blocks.fit(prefix_len,
+                                  getattr(_conflicts, 'count', 0) > 0)
+                       if blocks else None)
+            if fit and (block is None or fit[0] > block[1]):
+                block = (pool.version,) + fit
+                if fit[0] == prefix_len:
+                    break
+
+        if block is None:
+            return None
+
+        version, length, address = block
+        node = self._split(changes, trie.nodes[(version, address, length,)],
+                           address, prefix_len)
+        trie.retype(node, ALLOCATED)
+        node.name = name
+        changes.update(node)
+        return node
+
+    @_retried
+    def allocate_prefix(self, name, prefix, type=ALLOCATED):
+        """Allocate a specific prefix.
+
+        Args:
+            name (str): Name of the allocation.
+            prefix (str): Prefix to allocate, free inside a container.
+            type (str): Type of the allocation.
+
+        Returns:
+            Allocated prefix row.
+
+        Raises:
+            ValidationError: Prefix is not free.
+        """
+        if type in (CONTAINER, HIDDEN,):
+            raise ValidationError("Invalid allocation type '%s'" % type)
+        version, address, length = parse(prefix)
+        with self._write() as changes:
+            node = self._trie.locate(version, address, length)
+            if (node is None or node.children or
+                    not (node.free or node.type == CONTAINER) or
+                    (node.type == CONTAINER and node.length == length)):
+                raise ValidationError("Unable to allocate '%s', not free" %
+                                      prefix)
+            node = self._split(changes, node, address, length)
+            self._trie.retype(node, type)
+            node.name = name
+            changes.update(node)
+            return node.row()
+
+    @_retried
+    def add_prefix(self, name, prefix):
+        """Add a container prefix.
+
+        The prefix may enclose existing prefixes, which become part of
+        the container, or be inside a container or its free space.
+
+        Args:
+            name (str): Name of the container.
+            prefix (str): Prefix of the container.
+
+        Returns:
+            Container prefix row.
+
+        Raises:
+            ValidationError: Prefix exists or is inside an allocation.
+        """
+        version, address, length = parse(prefix)
+        trie = self._trie
+        with self._write() as changes:
+            node = trie.ready().locate(version, address, length)
+            if node is None:
+                node = self._supernet(changes, name, version, address,
+                                      length)
+            elif node.length == length:
+                if node.type == CONTAINER:
+                    raise ValidationError("Prefix '%s' already exists" %
+                                          prefix)
+                trie.free(node, False)
+                trie.retype(node, CONTAINER)
+                node.name = name
+                changes.update(node)
+            elif node.free or node.type == CONTAINER:
+                node = self._split(changes, node, address, length)
+                trie.retype(node, CONTAINER)
+                node.name = name
+                changes.update(node)
+            else:
+                raise ValidationError("Unable to add '%s', inside '%s'" %
+                                      (prefix, node.prefix,))
+            self._reparent(changes, node, node.id)
+            return node.row()
+
+    def _supernet(self, changes, name, version, address, length):
+        # New root container, enclosing any existing roots.
+        trie = self._trie
+        roots = trie.roots(version, address, length)
+        for root in roots:
+            trie.unroot(root)
+        roots = {root.key: root for root in roots}
+
+        top = Node(str(uuid4()), name, version, address, length,
+                   type=CONTAINER)
+        trie.add(top)
+        changes.insert(top)
+        changes.root(top)
+
+        bits = BITS[version]
+        stack = [top] if roots else []
+        while stack:
+            node = stack.pop()
+            node.children = [None, None]
+            shift = bits - node.length - 1
+            for bit in (0, 1,):
+                start = node.address | bit << shift
+                end = start + (1 << shift)
+                key = (version, start, node.length + 1,)
+                if key in roots:
+                    trie.attach(node, roots[key])
+                    continue
+                # Split down to the enclosed roots, the rest is free.
+                split = any(start <= root.address < end
+                            for root in roots.values())
+                half = Node(str(uuid4()), None, version, start,
+                            node.length + 1, top.id, not split)
+                trie.add(half)
+                changes.insert(half)
+                if split:
+                    stack.append(half)
+        return top
+
+    @_retried
+    def delete_prefix(self, prefix):
+        """Delete a container or allocation.
+
+        Prefixes inside a deleted container become part of the enclosing
+        container.
+
+        Args:
+            prefix (str): Prefix to delete.
+
+        Raises:
+            NotFoundError: Prefix not found.
+            ValidationError: Prefix is a split of the tree.
+        """
+        version, address, length = parse(prefix)
+        trie = self._trie
+        with self._write() as changes:
+            node = trie.ready().nodes.get((version, address, length,))
+            if node is None or (node.type == HIDDEN and node.free):
+                raise NotFoundError("Prefix '%s' not found" % prefix)
+            if node.type == HIDDEN:
+                raise ValidationError("Unable to delete '%s', not a"
+                                      " container or allocation" % prefix)
+            if node.type == CONTAINER:
+                for tagged in trie.tags.values():
+                    tagged.discard(node.id)
+                changes.untagged.append(node.id)
+            if node.children:
+                trie.retype(node, HIDDEN)
+                node.name = None
+                changes.update(node)
+                self._reparent(changes, node, node.parent)
+            else:
+                self._free(changes, node)
+
+    @_retried
+    def release_prefix(self, prefix):
+        """Release an allocated prefix.
+
+        Releasing a prefix that does not exist or is free does nothing.
+
+        Args:
+            prefix (str): Allocated prefix.
+
+        Raises:
+            ValidationError: Prefix is a container or split of the tree.
+        """
+        version, address, length = parse(prefix)
+        with self._write() as changes:
+            node = self._trie.nodes.get((version, address, length,))
+            if node is None or node.free:
+                return
+            if node.type in (CONTAINER, HIDDEN,):
+                raise ValidationError("Unable to release '%s', not an"
+                                      " allocated subnet" % prefix)
+            self._free(changes, node)
+
+    @_retried
+    def add_tag(self, prefix_id, tag):
+        """Tag a container as a pool to allocate from.
+
+        Raises:
+            NotFoundError: Container not found.
+        """
+        trie = self._trie.ready()
+        with trie.lock:
+            node = trie.ids.get(prefix_id)
+            if node is None or node.type != CONTAINER:
+                raise NotFoundError("Container '%s' not found" % prefix_id)
+            if prefix_id in trie.tags.get(tag, ()):
+                return
+            with db() as conn:
+                try:
+                    conn.execute('INSERT INTO netrino_prefix_tag'
+                                 ' (id,prefix_id,tag) VALUES (?,?,?)',
+                                 (str(uuid4()), prefix_id, tag,))
+                    conn.commit()
+                except SQLIntegrityError:
+                    # Tagged by another process.
+                    conn.rollback()
+            trie.tags.setdefault(tag, set()).add(prefix_id)
+
+    def id_tags(self, tag):
+        """Ids of the containers with a tag."""
+        trie = self._trie.ready()
+        with trie.lock:
+            return list(trie.tags.get(tag, ()))
+
+    def usage(self, prefix, length=None):
+        """Addresses allocated and free in a prefix.
+
+        Read from the counts kept in the trie for every prefix, without
+        going through the prefixes inside. The tree of the prefix is
+        reloaded first when loaded longer than refresh seconds ago, for
+        the allocations of other processes.
+
+        Args:
+            prefix (str): Prefix in CIDR notation.
+            length (int): Also the usage of each prefix of this length
+                inside, as for a heatmap.
+
+        Returns:
+            Dict with the 'prefix', addresses 'size', 'allocated' and
+            'free' in containers, the 'allocations' and 'utilization',
+            and the usage of the 'prefixes' of length.
+
+        Raises:
+            ValidationError: Invalid prefix or length.
+        """
+        version, address, prefix_len = parse(prefix)
+        if length is not None:
+            if not prefix_len <= length <= BITS[version]:
+                raise ValidationError("Invalid prefix length '%s' for"
+                                      " '%s'" % (length, prefix,))
+            if 1 << length - prefix_len > USAGE_PREFIXES:
+                raise ValidationError('Usage of at most %s prefixes'
+                                      ' inside a prefix' % USAGE_PREFIXES)
+
+        trie = self._trie.ready()
+        with trie.lock:
+            if trie.stale(self.refresh, version, address, prefix_len):
+                trie.reload(version, address, prefix_len)
+            usage = self._usage(version, address, prefix_len)
+            if length is not None:
+                step = 1 << BITS[version] - length
+                usage['prefixes'] = [
+                    self._usage(version, address + i * step, length)
+                    for i in range(1 << length - prefix_len)]
+        return usage
+
+    def _usage(self, version, address, length):
+        trie = self._trie
+        size = 1 << BITS[version] - length
+        node = trie.locate(version, address, length)
+        if node is None:
+            # Outside the trees, or enclosing some.
+            roots = trie.roots(version, address, length)
+            allocated = sum(root.allocated for root in roots)
+            allocations = sum(root.allocations for root in roots)
+            free = sum(root.size for root in roots) - allocated
+        elif node.length == length:
+            allocated = node.allocated
+            allocations = node.allocations
+            free = size - allocated
+        elif node.allocations:
+            # Inside an allocation.
+            allocated = size
+            allocations = 1
+            free = 0
+        else:
+            allocated = allocations = 0
+            free = size
+        return {'prefix': text(version, address, length), 'size': size,
+                'allocated': allocated, 'free': free,
+                'allocations': allocations,
+                'utilization': allocated / size}
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+from threading import Lock
+
+from luxon import GetLogger
+from luxon.utils.pkg import EntryPoints
+
+log = GetLogger(__name__)
+
+# Entry point groups resolved when the application starts.
+GROUPS = ('netrino.product.tasks',
+          'netrino.payment.gateways',
+          'tachyonic_interfaces',
+          'tachyonic.element.classifications',)
+
+_registry = {}
+_lock = Lock()
+
+
+def _resolve(group):
+    eps = EntryPoints(group)
+    resolved = {}
+    for name in eps:
+        try:
+            resolved[name] = eps[name]
+        except Exception as e:
+            log.error("Unable to load '%s' entry point '%s': %s"
+                      % (group, name, e))
+
+    return resolved
+
+
+def load(groups=GROUPS):
+    """Resolve entry point groups into the plugin registry.
+
+    Groups already resolved are kept, see reload() to pick up newly
+    installed plugins.
+
+    Args:
+        groups (tuple): Entry point group names.
+    """
+    with _lock:
+        for group in groups:
+            if group not in _registry:
+                _registry[group] = _resolve(group)
+
+
+def reload(groups=None):
+    """Resolve entry point groups again, ie after installing plugins.
+
+    Only the registry of the current process is refreshed.
+
+    Args:
+        groups (tuple): Entry point group names, defaults to all resolved.
+    """
+    with _lock:
+        if groups is None:
+            groups = tuple(_registry) or GROUPS
+        for group in groups:
+            _registry[group] = _resolve(group)
+
+
+def plugins(group):
+    """Plugin classes registered under an entry point group.
+
+    Groups not resolved at startup are resolved on first use.
+
+    Args:
+        group (str): Entry point group name.
+
+    Returns:
+        dict of entry point name to plugin class.
+    """
+    try:
+        return _registry[group]
+    except KeyError:
+        load((group,))
+        return _registry[group]
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+from luxon import db
+from luxon.exceptions import NotFoundError
+
+# netrino_product columns returned by the API, the image data is excluded.
+PRODUCT_FIELDS = ('id', 'name', 'parent_id', 'price', 'monthly',
+                  'image_type', 'image_id', 'thumbnail_id', 'description',
+                  'domain', 'creation_time',)
+
+# Product detail key, child table and its columns.
+CHILDREN = (('categories', 'netrino_categories',
+             ('id', 'name', 'product_id',)),
+            ('services', 'netrino_product_entrypoint',
+             ('id', 'product_id', 'entrypoint', 'metadata',
+              'creation_time',)),
+            ('custom_attributes', 'netrino_custom_attr',
+             ('id', 'name', 'value', 'visible', 'product_id',)),
+            ('payment_gateways', 'netrino_payment_gateway',
+             ('id', 'product_id', 'name', 'description',
+              'creation_time',)),)
+
+# Maximum ids per IN list.
+BATCH = 500
+
+
+def _children_columns():
+    columns = []
+    for key, table, fields in CHILDREN:
+        columns += [field for field in fields if field not in columns]
+    return columns
+
+
+def _children_sql(count, children):
+    params = ','.join('?' * count)
+    selects = []
+    for key, table, fields in children:
+        select = ["'%s' AS child" % key]
+        for column in _children_columns():
+            if column in fields:
+                select.append(column)
+            else:
+                select.append('NULL AS %s' % column)
+        selects.append('SELECT %s FROM %s WHERE product_id IN (%s)'
+                       % (','.join(select), table, params))
+
+    return ' UNION ALL '.join(selects)
+
+
+def load_products(pids, fields=PRODUCT_FIELDS, children=None):
+    """Products with their categories, services, custom attributes and
+    payment gateways.
+
+    Products are fetched with one query and all children with a second
+    UNION ALL query per batch of ids.
+
+    Args:
+        pids (list): Product ids.
+        fields (tuple): netrino_product columns to return.
+        children (tuple): Child keys to load, all if None.
+
+    Returns:
+        list of products in the order requested, unknown ids are skipped.
+    """
+    pids = list(dict.fromkeys(pids))
+    if 'id' not in fields:
+        fields = ('id',) + tuple(fields)
+    if children is None:
+        children = CHILDREN
+    else:
+        children = tuple(child for child in CHILDREN if child[0] in children)
+    products = {}
+
+    with db() as conn:
+        for i in range(0, len(pids), BATCH):
+            batch = pids[i:i + BATCH]
+            params = ','.join('?' * len(batch))
+            sql = 'SELECT %s FROM netrino_product WHERE id IN (%s)' % (
+                ','.join(fields), params)
+            for product in conn.execute(sql, batch).fetchall():
+                for key, table, child_fields in children:
+                    product[key] = []
+                products[product['id']] = product
+
+            found = [pid for pid in batch if pid in products]
+            if not found or not children:
+                continue
+
+            rows = conn.execute(_children_sql(len(found), children),
+                                found * len(children)).fetchall()
+            child_fields = {key: child for key, table, child in children}
+            for child in rows:
+                key = child['child']
+                products[child['product_id']][key].append(
+                    {field: child[field] for field in child_fields[key]})
+
+    return [products[pid] for pid in pids if pid in products]
+
+
+def load_product(pid, fields=PRODUCT_FIELDS, children=None):
+    """Product with its categories, services, custom attributes and payment
+    gateways.
+
+    Args:
+        pid (str): Product id.
+        fields (tuple): netrino_product columns to return.
+        children (tuple): Child keys to load, all if None.
+
+    Returns:
+        Product dict.
+    """
+    products = load_products((pid,), fields, children)
+    if not products:
+        raise NotFoundError("Product '%s' not found" % pid)
+
+    return products[0]
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+import time
+from uuid import uuid4
+from threading import Lock, Thread, Event
+
+from luxon import g
+from luxon import db
+from luxon import GetLogger
+
+from netrino.utils.search import Index
+from netrino.helpers.dialect import upsert_add
+
+log = GetLogger(__name__)
+
+WEIGHTS = {'name': 3, 'attributes': 1.5, 'description': 1}
+
+SUMMARY = ('id', 'name', 'parent_id', 'price', 'monthly', 'thumbnail_id',
+           'domain',)
+
+_products_sql = 'SELECT %s,description FROM netrino_product' % (
+    ','.join(SUMMARY))
+_attrs_sql = 'SELECT product_id,value FROM netrino_custom_attr' \
+             ' WHERE visible=1'
+
+
+class Search(object):
+    """Product search index kept in memory.
+
+    The index is built in the background when the worker starts and kept
+    up to date by refresh() for changes made in this worker. Every change
+    is counted in the database, which is checked at most every [catalog]
+    generation_ttl seconds. When other workers moved the count the index
+    is rebuilt in the background while the current one keeps serving.
+    """
+    def __init__(self):
+        self._index = None
+        self._changes = None
+        self._checked = 0
+        self._ready = Event()
+        self._lock = Lock()
+        self._building = False
+
+    def _load(self, conn, pid=None):
+        products_sql = _products_sql
+        attrs_sql = _attrs_sql
+        vals = ()
+        if pid:
+            products_sql += ' WHERE id=?'
+            attrs_sql += ' AND product_id=?'
+            vals = (pid,)
+
+        attrs = {}
+        for attr in conn.execute(attrs_sql, vals).fetchall():
+            attrs.setdefault(attr['product_id'], []).append(attr['value'])
+
+        for product in conn.execute(products_sql, vals).fetchall():
+            fields = {'name': product['name'],
+                      'description': product['description'],
+                      'attributes': ' '.join(str(value) for value in
+                                             attrs.get(product['id'], ())
+                                             if value)}
+            yield product['id'], fields, {field: product[field]
+                                          for field in SUMMARY}
+
+    def _count(self, conn):
+        change = conn.execute('SELECT changes FROM netrino_product_changes'
+                              " WHERE name='products'").fetchone()
+        return change['changes'] if change else 0
+
+    def _build(self):
+        try:
+            index = Index(WEIGHTS)
+            with db() as conn:
+                changes = self._count(conn)
+                for product in self._load(conn):
+                    index.add(*product)
+            with self._lock:
+                self._index = index
+                self._changes = changes
+            log.info('Indexed %s products for search' % len(index))
+        except Exception as e:
+            log.error('Unable to build product search index: %s' % e)
+        finally:
+            self._building = False
+            self._ready.set()
+
+    def build(self, wait=False):
+        """Build the index in a background thread.
+
+        Args:
+            wait (bool): Block until the index is built.
+        """
+        with self._lock:
+            if not self._building:
+                self._building = True
+                self._ready.clear()
+                Thread(target=self._build, daemon=True).start()
+
+        if wait:
+            self._ready.wait()
+
+    def changed(self):
+        """Count a change for other workers to reindex.
+
+        Returns:
+            Whether the index was current before the change.
+        """
+        with db() as conn:
+            current = self._count(conn) == self._changes
+            conn.execute(upsert_add('netrino_product_changes', ('name',),
+                                    'changes'),
+                         (str(uuid4()), 'products', 1,))
+            conn.commit()
+        if current:
+            self._changes += 1
+        return current
+
+    def refresh(self, *pids):
+        """Reindex products changed by this worker.
+
+        Args:
+            pids (str): Ids of products created, updated or deleted.
+        """
+        if not self.changed():
+            # Missed changes of other workers, reindexing all.
+            self.build()
+            return
+
+        with db() as conn:
+            for pid in pids:
+                self._index.remove(pid)
+                for product in self._load(conn, pid):
+                    self._index.add(*product)
+
+    def search(self, query, limit=20, offset=0, domain=None):
+        """Products matching query ranked best first.
+
+        Args:
+            query (str): Search text, the last word may be incomplete.
+            limit (int): Maximum results.
+            offset (int): Results to skip.
+            domain (str): Only products in this domain or without one.
+        """
+        if self._index is None:
+            self.build(wait=True)
+        elif time.monotonic() - self._checked > g.app.config.getfloat(
+                'catalog', 'generation_ttl', fallback=1):
+            self._checked = time.monotonic()
+            with db() as conn:
+                if self._count(conn) != self._changes:
+                    self.build()
+
+        if self._index is None:
+            return []
+
+        match = None
+        if domain is not None:
+            def match(product):
+                return (product['domain'] is None or
+                        product['domain'] == domain)
+
+        return self._index.search(query, limit, offset, match)
+
+
+_search = Search()
+
+
+def search():
+    """Process wide product search index.
+    """
+    return _search
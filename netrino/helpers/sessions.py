@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+import time
+from threading import Condition, Thread
+from contextlib import contextmanager
+
+from luxon import g
+from luxon import GetLogger
+from luxon.exceptions import NotFoundError, ValidationError
+
+from netrino.helpers.plugins import plugins
+
+log = GetLogger(__name__)
+
+# Mistakes of the caller, leaving the session usable. Interfaces may
+# declare their own in a 'caller_errors' attribute, any other exception
+# closes the session.
+CALLER_ERRORS = (NotFoundError, ValidationError,)
+
+
+class Unavailable(Exception):
+    """Element not available for calls at this time."""
+
+
+class PoolExhausted(Unavailable):
+    """No session became available within the pool timeout."""
+
+
+class _Entry(object):
+    __slots__ = ('key', 'interface', 'session', 'last_used',)
+
+    def __init__(self, key, interface, session):
+        self.key = key
+        self.interface = interface
+        self.session = session
+        self.last_used = time.monotonic()
+
+
+def _close(entry):
+    try:
+        entry.interface.__exit__(None, None, None)
+    except Exception as e:
+        log.warning("Closing session to element '%s' via '%s' failed: %s"
+                    % (entry.key[1], entry.key[0], e))
+
+
+def _healthy(session):
+    # Interfaces may offer alive() or ping(), otherwise assumed healthy.
+    check = getattr(session, 'alive', None) or getattr(session, 'ping',
+                                                       None)
+    if check is None:
+        return True
+    try:
+        return check() is not False
+    except Exception:
+        return False
+
+
+class Pool(object):
+    """Element interface sessions kept open between requests.
+
+    Sessions are keyed by interface name and element id. Idle sessions are
+    reused most recently used first, health checked when idle longer than
+    health_check seconds and closed when idle longer than idle seconds.
+    A session is discarded when an exception passes through it, except
+    for caller errors and streamed results closed early, which release it
+    for reuse.
+
+    Args:
+        size (int): Maximum sessions open in total.
+        per_element (int): Maximum sessions open per interface and element.
+        idle (float): Seconds before an idle session is closed.
+        health_check (float): Seconds idle before a session is checked.
+        timeout (float): Seconds to wait for a session at the limit.
+    """
+    def __init__(self, size=64, per_element=2, idle=300, health_check=30,
+                 timeout=30):
+        self.size = size
+        self.per_element = per_element
+        self.idle = idle
+        self.health_check = health_check
+        self.timeout = timeout
+        self._cond = Condition()
+        self._idle = {}
+        self._open = {}
+        self._total = 0
+        self._reaper = None
+
+    def _opened(self, key, count):
+        # Called with the condition held.
+        self._open[key] = self._open.get(key, 0) + count
+        if not self._open[key]:
+            del self._open[key]
+        self._total += count
+        if count < 0:
+            self._cond.notify_all()
+
+    def _expired(self, now):
+        # Idle sessions to close, called with the condition held.
+        expired = []
+        for key in list(self._idle):
+            keep = []
+            for entry in self._idle[key]:
+                if now - entry.last_used > self.idle:
+                    expired.append(entry)
+                    self._opened(key, -1)
+                else:
+                    keep.append(entry)
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        return expired
+
+    def _oldest_idle(self):
+        # Make room for another element, called with the condition held.
+        oldest = None
+        for entries in self._idle.values():
+            if entries and (oldest is None or
+                            entries[0].last_used < oldest.last_used):
+                oldest = entries[0]
+        if oldest is not None:
+            self._idle[oldest.key].remove(oldest)
+            if not self._idle[oldest.key]:
+                del self._idle[oldest.key]
+            self._opened(oldest.key, -1)
+        return oldest
+
+    def _acquire(self, key):
+        deadline = time.monotonic() + self.timeout
+        close = []
+        entry = None
+        try:
+            with self._cond:
+                while True:
+                    close += self._expired(time.monotonic())
+                    if self._idle.get(key):
+                        entry = self._idle[key].pop()
+                        if not self._idle[key]:
+                            del self._idle[key]
+                        return entry
+                    if self._open.get(key, 0) < self.per_element:
+                        if self._total >= self.size:
+                            oldest = self._oldest_idle()
+                            if oldest is not None:
+                                close.append(oldest)
+                        if self._total < self.size:
+                            self._opened(key, 1)
+                            return None
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolExhausted(
+                            "No session to element '%s' via '%s' available"
+                            " within %s seconds" % (key[1], key[0],
+                                                    self.timeout))
+                    self._cond.wait(remaining)
+        finally:
+            for expired in close:
+                _close(expired)
+
+    def _connect(self, key):
+        interface = plugins('tachyonic_interfaces')[key[0]](key[1])
+        return _Entry(key, interface, interface.__enter__())
+
+    def _release(self, entry):
+        entry.last_used = time.monotonic()
+        with self._cond:
+            self._idle.setdefault(entry.key, []).append(entry)
+            self._cond.notify_all()
+        self._start_reaper()
+
+    def _discard(self, entry):
+        _close(entry)
+        with self._cond:
+            self._opened(entry.key, -1)
+
+    @contextmanager
+    def session(self, interface, element_id):
+        """Session to an element via an interface.
+
+        Args:
+            interface (str): Name of the tachyonic_interfaces plugin.
+            element_id (str): Element id.
+
+        Raises:
+            NotFoundError: When the interface is not registered.
+            PoolExhausted: When the limits were reached and no session was
+                released within the timeout.
+        """
+        if interface not in plugins('tachyonic_interfaces'):
+            raise NotFoundError("Interface '%s' not registered" % interface)
+
+        key = (interface, str(element_id),)
+        entry = self._acquire(key)
+        if entry is not None and (time.monotonic() - entry.last_used >
+                                  self.health_check and
+                                  not _healthy(entry.session)):
+            log.info("Reconnecting stale session to element '%s' via '%s'"
+                     % (key[1], key[0]))
+            _close(entry)
+            entry = None
+        if entry is None:
+            try:
+                entry = self._connect(key)
+            except BaseException:
+                with self._cond:
+                    self._opened(key, -1)
+                raise
+
+        try:
+            yield entry.session
+        except GeneratorExit:
+            # Streamed result closed early.
+            self._release(entry)
+            raise
+        except BaseException as e:
+            if isinstance(e, CALLER_ERRORS + tuple(
+                    getattr(entry.interface, 'caller_errors', None) or ())):
+                self._release(entry)
+            else:
+                self._discard(entry)
+            raise
+        else:
+            self._release(entry)
+
+    def evict(self):
+        """Close sessions idle for longer than the idle timeout.
+        """
+        with self._cond:
+            expired = self._expired(time.monotonic())
+        for entry in expired:
+            _close(entry)
+
+    def close(self):
+        """Close all idle sessions.
+        """
+        with self._cond:
+            entries = [entry for key in self._idle
+                       for entry in self._idle[key]]
+            for entry in entries:
+                self._opened(entry.key, -1)
+            self._idle = {}
+        for entry in entries:
+            _close(entry)
+
+    def stats(self):
+        """Sessions open and idle per interface and element.
+        """
+        with self._cond:
+            return [{'interface': key[0],
+                     'element_id': key[1],
+                     'open': self._open[key],
+                     'idle': len(self._idle.get(key, ()))}
+                    for key in self._open]
+
+    def _start_reaper(self):
+        if self._reaper is None:
+            with self._cond:
+                if self._reaper is None:
+                    self._reaper = Thread(target=self._reap, daemon=True)
+                    self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(max(1, self.idle / 2))
+            self.evict()
+
+
+_pool = None
+
+
+def pool():
+    """Process wide interface session pool configured by [interfaces].
+    """
+    global _pool
+
+    if _pool is None:
+        config = g.app.config
+        _pool = Pool(size=config.getint('interfaces', 'pool_size',
+                                        fallback=64),
+                     per_element=config.getint('interfaces', 'per_element',
+                                               fallback=2),
+                     idle=config.getfloat('interfaces', 'idle',
+                                          fallback=300),
+                     health_check=config.getfloat('interfaces',
+                                                  'health_check',
+                                                  fallback=30),
+                     timeout=config.getfloat('interfaces', 'timeout',
+                                             fallback=30))
+
+    return _pool
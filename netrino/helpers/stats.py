@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+from uuid import uuid4
+
+from luxon import db
+from luxon.exceptions import ValidationError
+
+from netrino.helpers.dialect import upsert_add
+
+GROUPS = ('tenant_id', 'product_id', 'status',)
+
+_count_sql = None
+
+
+def count_order(conn, order, orders=1):
+    """Add to the order counter for the order's tenant, product and status.
+
+    Executed on the connection of the transaction changing the order, the
+    caller commits.
+
+    Args:
+        conn: Database connection.
+        order (dict): Order with tenant_id, product_id and status.
+        orders (int): Amount to add, negative to subtract.
+    """
+    global _count_sql
+
+    if _count_sql is None:
+        _count_sql = upsert_add('netrino_order_stats', GROUPS, 'orders')
+
+    conn.execute(_count_sql, (str(uuid4()),
+                              order['tenant_id'] or '',
+                              order['product_id'],
+                              order['status'],
+                              orders,))
+
+
+def statistics(group_by=('status',), tenant_id=None):
+    """Order counts summed per group.
+
+    Args:
+        group_by (tuple): Any of 'tenant_id', 'product_id' and 'status'.
+        tenant_id (str): Restrict counts to tenant.
+
+    Returns:
+        List of groups with 'orders' count.
+    """
+    for group in group_by:
+        if group not in GROUPS:
+            raise ValidationError("Unable to group orders by '%s'" % group)
+
+    sql = ('SELECT %sCOALESCE(SUM(orders),0) AS orders'
+           ' FROM netrino_order_stats' %
+           ''.join(group + ',' for group in group_by))
+    vals = []
+    if tenant_id:
+        sql += ' WHERE tenant_id=?'
+        vals.append(tenant_id)
+    if group_by:
+        sql += ' GROUP BY %s HAVING SUM(orders)>0' % ','.join(group_by)
+
+    with db() as conn:
+        return conn.execute(sql, vals).fetchall()
+
+
+def rebuild():
+    """Recount all orders into the statistics counters.
+
+    Returns:
+        Number of groups counted.
+    """
+    sql = 'SELECT tenant_id,product_id,status,COUNT(id) AS orders' \
+          ' FROM netrino_order GROUP BY tenant_id,product_id,status'
+    with db() as conn:
+        groups = conn.execute(sql).fetchall()
+        conn.execute('DELETE FROM netrino_order_stats')
+        for group in groups:
+            count_order(conn, group, group['orders'])
+        conn.commit()
+
+    return len(groups)
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+"""IPAM pool utilization reports.
+
+The rows of the free and allocated space of the pools are loaded into
+NumPy arrays, the address words a1..a4 as unsigned 64-bit high and low
+halves, and the usage of every pool is computed with interval arithmetic
+over the arrays: blocks are sorted by address, and free blocks where the
+previous one ends are merged into ranges. Without NumPy the same is
+computed in Python, row by row.
+
+Address counts are exact, IPv6 pools are larger than any float or 64-bit
+integer holds.
+"""
+from itertools import chain
+
+from luxon import db
+from luxon import GetLogger
+
+from netrino.helpers.ipam import BITS, CONTAINER, HIDDEN, text
+
+log = GetLogger(__name__)
+
+
+def _pools(conn, tag):
+    return conn.execute('SELECT netrino_prefix.id,name,version,'
+                        'a1,a2,a3,a4,prefix_len FROM netrino_prefix'
+                        ' INNER JOIN netrino_prefix_tag'
+                        ' ON netrino_prefix_tag.prefix_id=netrino_prefix.id'
+                        ' WHERE tag=? AND type=?'
+                        ' ORDER BY version,a1,a2,a3,a4,prefix_len',
+                        (tag, CONTAINER,)).fetchall()
+
+
+def _blocks(conn, pools):
+    # Rows of the pools, allocated and nested containers are used space,
+    # hidden rows not split further are free.
+    index = {pool['id']: i for i, pool in enumerate(pools)}
+    ids = list(index)
+    blocks = []
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        blocks += [(index[row['parent']], row['a1'], row['a2'], row['a3'],
+                    row['a4'], BITS[row['version']] - row['prefix_len'],
+                    bool(row['free']), row['type'] != HIDDEN,)
+                   for row in conn.execute(
+                       'SELECT parent,version,a1,a2,a3,a4,prefix_len,free,type'
+                       ' FROM netrino_prefix WHERE parent IN (%s)'
+                       ' AND (free=? OR type!=?)' %
+                       ','.join('?' * len(chunk)),
+                       chunk + [True, HIDDEN]).fetchall()]
+    return blocks
+
+
+def _sum(np, sums, pool, size):
+    # Add the addresses of the blocks to the sums of their pools, exact
+    # from the blocks counted per pool and size.
+    counts = np.bincount(pool * 129 + size, minlength=len(sums) * 129)
+    for i, j in zip(*np.nonzero(counts.reshape(len(sums), 129))):
+        sums[i] += int(counts[i * 129 + j]) << int(j)
+
+
+def _usage_numpy(np, count, blocks):
+    # Allocated and free addresses, largest free range and free ranges
+    # per pool.
+    allocated = [0] * count
+    free = [0] * count
+    largest = [0] * count
+    ranges = [0] * count
+    if not blocks:
+        return allocated, free, largest, ranges
+
+    blocks = np.fromiter(chain.from_iterable(blocks), np.uint64,
+                         len(blocks) * 8).reshape(-1, 8)
+    pool = blocks[:, 0].astype(np.int64)
+    high = blocks[:, 1] << np.uint64(32) | blocks[:, 2]
+    low = blocks[:, 3] << np.uint64(32) | blocks[:, 4]
+    size = blocks[:, 5].astype(np.int64)
+    is_free = blocks[:, 6].astype(bool)
+    is_used = blocks[:, 7].astype(bool)
+
+    _sum(np, allocated, pool[is_used], size[is_used])
+    _sum(np, free, pool[is_free], size[is_free])
+
+    order = np.lexsort((low, high, pool))
+    order = order[is_free[order]]
+    if not len(order):
+        return allocated, free, largest, ranges
+    pool, high, low, size = (pool[order], high[order], low[order],
+                             size[order],)
+
+    # End of the free blocks, carrying from the low into the high half.
+    one = np.uint64(1)
+    wide = size >= 64
+    shift = np.where(wide, 0, size).astype(np.uint64)
+    end_low = low + np.where(wide, np.uint64(0), one << shift)
+    carry = (end_low < low).astype(np.uint64)
+    shift = np.where(wide, size - 64, 0).astype(np.uint64)
+    end_high = high + carry + np.where(wide, one << shift, np.uint64(0))
+
+    starts = np.ones(len(pool), dtype=bool)
+    starts[1:] = ~((pool[1:] == pool[:-1]) & (high[1:] == end_high[:-1]) &
+                   (low[1:] == end_low[:-1]))
+    run = np.cumsum(starts) - 1
+    run_pool = pool[starts]
+    for i, n in enumerate(np.bincount(run_pool, minlength=count)):
+        ranges[i] = int(n)
+
+    # Largest range of each pool by approximate size, then summed exactly.
+    approx = np.bincount(run, weights=np.exp2(size))
+    best = np.lexsort((approx, run_pool))
+    last = np.ones(len(best), dtype=bool)
+    last[:-1] = run_pool[best][1:] != run_pool[best][:-1]
+    best = best[last]
+    members = np.isin(run, best)
+    _sum(np, largest, pool[members], size[members])
+    return allocated, free, largest, ranges
+
+
+def _usage_python(count, blocks):
+    allocated = [0] * count
+    free = [0] * count
+    largest = [0] * count
+    ranges = [0] * count
+    end = {}
+    current = {}
+    for (pool, a1, a2, a3, a4, size,
+         is_free, is_used) in sorted(blocks):
+        if is_used:
+            allocated[pool] += 1 << size
+        if not is_free:
+            continue
+        free[pool] += 1 << size
+        address = a1 << 96 | a2 << 64 | a3 << 32 | a4
+        if end.get(pool) != address:
+            ranges[pool] += 1
+            current[pool] = 0
+        current[pool] += 1 << size
+        end[pool] = address + (1 << size)
+        largest[pool] = max(largest[pool], current[pool])
+    return allocated, free, largest, ranges
+
+
+def utilization(tag):
+    """Utilization of the pools of a tag.
+
+    Requires NumPy for large pools, without it computed in Python.
+
+    Args:
+        tag (str): Tag of the pool containers.
+
+    Returns:
+        List of pools with the 'id', 'name', 'prefix', addresses 'size',
+        'allocated' and 'free', 'utilization' of the size allocated,
+        'free_ranges', 'largest_free' range of free addresses and
+        'fragmentation', the part of the free addresses outside it.
+    """
+    with db() as conn:
+        pools = _pools(conn, tag)
+        blocks = _blocks(conn, pools)
+
+    try:
+        import numpy
+    except ImportError:
+        log.warning('Computing utilization in Python,'
+                    ' numpy not installed')
+        usage = _usage_python(len(pools), blocks)
+    else:
+        usage = _usage_numpy(numpy, len(pools), blocks)
+
+    report = []
+    for pool, allocated, free, largest, ranges in zip(pools, *usage):
+        size = 1 << BITS[pool['version']] - pool['prefix_len']
+        if not (allocated or free):
+            # Not split, the container is free as a whole.
+            free = largest = size
+            ranges = 1
+        report.append({
+            'id': pool['id'],
+            'name': pool['name'],
+            'prefix': text(pool['version'],
+                           pool['a1'] << 96 | pool['a2'] << 64 |
+                           pool['a3'] << 32 | pool['a4'],
+                           pool['prefix_len']),
+            'size': size,
+            'allocated': allocated,
+            'free': free,
+            'utilization': allocated / size,
+            'free_ranges': ranges,
+            'largest_free': largest,
+            'fragmentation': 1 - largest / free if free else 0.0})
+    return report
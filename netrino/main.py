@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+import argparse
+
+from luxon.core.app import App
+
+from netrino import metadata
+
+
+def rebuild_stats(args):
+    from netrino.helpers.stats import rebuild
+
+    print('Counted %s order statistics groups' % rebuild())
+
+
+def rebuild_facets(args):
+    from netrino.helpers.facets import rebuild
+
+    print('Counted %s product facets' % rebuild())
+
+
+def rebuild_hierarchy(args):
+    from netrino.helpers.hierarchy import rebuild
+
+    print('Indexed %s product hierarchy paths' % rebuild())
+
+
+def rebuild_elements(args):
+    from netrino.helpers.elements import rebuild
+
+    print('Indexed %s element interfaces' % rebuild())
+
+
+def export_products(args):
+    from netrino.helpers.bulk import export
+
+    for line in export(args.format):
+        args.file.write(line)
+
+
+def import_products(args):
+    from netrino.helpers.bulk import Import, parse
+
+    result = Import(domain=args.domain).run(parse(args.file, args.format))
+    for error in result['errors']:
+        print('Row %s (%s): %s' % (error['row'], error['id'],
+                                   error['error']))
+    print('Imported %s products, %s failed' % (result['imported'],
+                                                len(result['errors'])))
+
+
+def publish_events(args):
+    from netrino.helpers.events import Publisher
+
+    Publisher().run(interval=args.interval, once=args.once)
+
+
+def entry():
+    parser = argparse.ArgumentParser(description=metadata.identity)
+    parser.add_argument('-c', '--config',
+                        default='/etc/tachyonic/netrino.ini',
+                        help='Netrino configuration file')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    cmd = commands.add_parser('rebuild-stats',
+                              help='Recount order statistics counters')
+    cmd.set_defaults(func=rebuild_stats)
+
+    cmd = commands.add_parser('rebuild-facets',
+                              help='Recount product category and attribute'
+                                   ' facets')
+    cmd.set_defaults(func=rebuild_facets)
+
+    cmd = commands.add_parser('rebuild-hierarchy',
+                              help='Rebuild the product hierarchy closure'
+                                   ' table')
+    cmd.set_defaults(func=rebuild_hierarchy)
+
+    cmd = commands.add_parser('rebuild-elements',
+                              help='Rebuild the element interface index')
+    cmd.set_defaults(func=rebuild_elements)
+
+    cmd = commands.add_parser('export-products',
+                              help='Export the product catalog')
+    cmd.add_argument('-f', '--format', choices=('ndjson', 'csv'),
+                     default='ndjson')
+    cmd.add_argument('file', nargs='?', type=argparse.FileType('w'),
+                     default='-')
+    cmd.set_defaults(func=export_products)
+
+    cmd = commands.add_parser('import-products',
+                              help='Import products as exported')
+    cmd.add_argument('-f', '--format', choices=('ndjson', 'csv'),
+                     default='ndjson')
+    cmd.add_argument('-d', '--domain', default=None,
+                     help='Domain of the products imported')
+    cmd.add_argument('file', nargs='?', type=argparse.FileType('r'),
+                     default='-')
+    cmd.set_defaults(func=import_products)
+
+    cmd = commands.add_parser('publish-events',
+                              help='Publish outbox events to the broker')
+    cmd.add_argument('-i', '--interval', type=float, default=1,
+                     help='Seconds to wait while the outbox is empty')
+    cmd.add_argument('--once', action='store_true',
+                     help='Stop once the outbox is empty')
+    cmd.set_defaults(func=publish_events)
+
+    args = parser.parse_args()
+    App('netrino', ini=args.config)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    entry()
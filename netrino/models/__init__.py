@@ -3,3 +3,6 @@ import netrino.models.workflows
 import netrino.models.products
 import netrino.models.orders
 import netrino.models.tasks
+import netrino.models.outbox
+import netrino.models.elements
+import netrino.models.ipam
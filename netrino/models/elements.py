@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+from uuid import uuid4
+
+from luxon import register
+from luxon import SQLModel
+from luxon.utils.timezone import now
+
+
+@register.model()
+class netrino_element(SQLModel):
+    id = SQLModel.Uuid(default=uuid4, internal=True)
+    name = SQLModel.String(null=False)
+    # Name of the tachyonic.element.classifications entry point.
+    classification = SQLModel.String(null=False)
+    metadata = SQLModel.MediumText()
+    domain = SQLModel.Fqdn(internal=True)
+    tenant_id = SQLModel.Uuid()
+    creation_time = SQLModel.DateTime(default=now, internal=True)
+    element_classification = SQLModel.Index(classification)
+    primary_key = id
+
+
+@register.model()
+class netrino_element_interface(SQLModel):
+    # Interfaces supported by each element, maintained from the element
+    # classification.
+    id = SQLModel.Uuid(default=uuid4, internal=True)
+    interface = SQLModel.String(null=False)
+    element_id = SQLModel.Uuid(null=False)
+    element_interface_ref = SQLModel.ForeignKey(element_id,
+                                                netrino_element.id)
+    unique_element_interface = SQLModel.UniqueIndex(interface, element_id)
+    element_interface_element = SQLModel.Index(element_id)
+    primary_key = id
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+from uuid import uuid4
+
+from luxon import register
+from luxon import SQLModel
+from luxon.utils.timezone import now
+
+
+@register.model()
+class netrino_prefix(SQLModel):
+    # Prefixes form a binary buddy tree, every split prefix having both
+    # halves as rows. Addresses are stored as four 32-bit words a1..a4,
+    # IPv4 addresses in a4. The parent is the nearest enclosing container.
+    id = SQLModel.Uuid(default=uuid4, internal=True)
+    name = SQLModel.String()
+    version = SQLModel.TinyInt(null=False)
+    a1 = SQLModel.Integer(signed=False, null=False)
+    a2 = SQLModel.Integer(signed=False, null=False)
+    a3 = SQLModel.Integer(signed=False, null=False)
+    a4 = SQLModel.Integer(signed=False, null=False)
+    prefix_len = SQLModel.TinyInt(null=False)
+    parent = SQLModel.Uuid()
+    # Hidden prefixes are splits of the tree, free when not split further.
+    free = SQLModel.Boolean(default=False)
+    type = SQLModel.String(null=False)
+    # Incremented when the prefix or its halves change, for writes by
+    # other processes to be detected.
+    revision = SQLModel.Integer(signed=False, default=0)
+    creation_time = SQLModel.DateTime(default=now, internal=True)
+    unique_prefix = SQLModel.UniqueIndex(version, a1, a2, a3, a4,
+                                         prefix_len)
+    prefix_parent = SQLModel.Index(parent)
+    primary_key = id
+
+
+@register.model()
+class netrino_prefix_tag(SQLModel):
+    id = SQLModel.Uuid(default=uuid4, internal=True)
+    prefix_id = SQLModel.Uuid(null=False)
+    tag = SQLModel.String(null=False)
+    prefix_tag_ref = SQLModel.ForeignKey(prefix_id, netrino_prefix.id)
+    unique_prefix_tag = SQLModel.UniqueIndex(prefix_id, tag)
+    prefix_tag_tag = SQLModel.Index(tag)
+    primary_key = id
@@ -48,9 +48,22 @@ class netrino_order(SQLModel):
     price = SQLModel.Decimal(6, 2, default=0)
     status = SQLModel.String(default="created")
     payment_date = SQLModel.DateTime()
+    version = SQLModel.Integer(default=1, readonly=True)
     creation_time = SQLModel.DateTime(default=now, internal=True)
     primary_key = id
     unique_short_id = SQLModel.UniqueIndex(short_id)
     order_product = SQLModel.ForeignKey(product_id,
                                         netrino_product.id,
                                         on_delete='RESTRICT')
+
+
+@register.model()
+class netrino_order_stats(SQLModel):
+    id = SQLModel.Uuid(default=uuid4, internal=True)
+    # Empty for orders without tenant to keep the group unique.
+    tenant_id = SQLModel.String(max_length=36, null=False, default='')
+    product_id = SQLModel.Uuid(null=False)
+    status = SQLModel.String(null=False)
+    orders = SQLModel.Integer(default=0)
+    primary_key = id
+    unique_order_stats = SQLModel.UniqueIndex(tenant_id, product_id, status)
@@ -43,12 +43,29 @@ class netrino_product(SQLModel):
     monthly = SQLModel.Boolean(default=False)
     image = SQLModel.MediumBlob()
     image_type = SQLModel.String()
+    image_id = SQLModel.String(max_length=64)
+    thumbnail_id = SQLModel.String(max_length=64)
     description = SQLModel.LongText()
     domain = SQLModel.Fqdn(internal=True)
     creation_time = SQLModel.DateTime(default=now, internal=True)
     primary_key = id
     product_parent = SQLModel.ForeignKey(parent_id, id, on_delete='RESTRICT')
 
+@register.model()
+class netrino_product_closure(SQLModel):
+    # One row per ancestor and descendant pair of the product tree,
+    # including each product as its own ancestor at depth 0.
+    id = SQLModel.Uuid(default=uuid4, internal=True)
+    ancestor_id = SQLModel.Uuid(null=False)
+    descendant_id = SQLModel.Uuid(null=False)
+    depth = SQLModel.Integer(null=False, default=0)
+    closure_ancestor_ref = SQLModel.ForeignKey(ancestor_id, netrino_product.id)
+    closure_descendant_ref = SQLModel.ForeignKey(descendant_id,
+                                                 netrino_product.id)
+    unique_closure = SQLModel.UniqueIndex(ancestor_id, descendant_id)
+    closure_descendant = SQLModel.Index(descendant_id, depth)
+    primary_key = id
+
 @register.model()
 class netrino_custom_attr(SQLModel):
     id = SQLModel.Uuid(default=uuid4, internal=True)
@@ -65,6 +82,36 @@ class netrino_categories(SQLModel):
     name = SQLModel.String(null=False)
     product_id = SQLModel.Uuid(null=False)
     product_category_ref = SQLModel.ForeignKey(product_id, netrino_product.id)
+    unique_product_category = SQLModel.UniqueIndex(name, product_id)
+    primary_key = id
+
+@register.model()
+class netrino_category(SQLModel):
+    id = SQLModel.Uuid(default=uuid4, internal=True)
+    name = SQLModel.String(null=False)
+    # Domain of the products counted, empty for products without one.
+    domain = SQLModel.String(null=False, default='')
+    products = SQLModel.Integer(default=0)
+    unique_category = SQLModel.UniqueIndex(name, domain)
+    primary_key = id
+
+@register.model()
+class netrino_attr_facet(SQLModel):
+    id = SQLModel.Uuid(default=uuid4, internal=True)
+    name = SQLModel.String(null=False)
+    value = SQLModel.String(null=False, default='')
+    domain = SQLModel.String(null=False, default='')
+    products = SQLModel.Integer(default=0)
+    unique_attr_facet = SQLModel.UniqueIndex(name, value, domain)
+    primary_key = id
+
+@register.model()
+class netrino_product_changes(SQLModel):
+    # Counts product changes for workers to detect those made by others.
+    id = SQLModel.Uuid(default=uuid4, internal=True)
+    name = SQLModel.String(null=False)
+    changes = SQLModel.Integer(default=0)
+    unique_product_changes = SQLModel.UniqueIndex(name)
     primary_key = id
 
 @register.model()
@@ -89,4 +136,13 @@ class netrino_payment_gateway(SQLModel):
     unique_prod_paygw = SQLModel.UniqueIndex(product_id, name)
     primary_key = id
 
+@register.model()
+class netrino_image(SQLModel):
+    # SHA-256 of the image data.
+    id = SQLModel.String(max_length=64, null=False)
+    content_type = SQLModel.String(null=False)
+    data = SQLModel.MediumBlob(null=False)
+    creation_time = SQLModel.DateTime(default=now, readonly=True)
+    primary_key = id
+
 # @Vuader: Todo: Linked products: upsell and cross sell
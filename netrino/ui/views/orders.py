@@ -32,12 +32,13 @@ from luxon import js
 from luxon import router
 from luxon import register
 from luxon import render_template
-from luxon.utils.pkg import EntryPoints
 from luxon.utils.bootstrap4 import form
 from luxon.utils.timezone import now
 
 from luxon.exceptions import FieldMissing, JSONDecodeError, HTTPError
 
+from netrino.helpers.plugins import plugins
+
 g.nav_menu.add('/Billing/My Orders',
                href='/orders',
                tag='customer',
@@ -58,7 +59,7 @@ def process_notification(req, type, data):
     result = {}
 
     if req.method in ('PUT', 'POST',):
-        _pay_gws = EntryPoints('netrino.payment.gateways')
+        _pay_gws = plugins('netrino.payment.gateways')
         _pg_name = g.app.config.get('orchestration','default_payment_gateway',
                                     fallback=None)
         _pg_name = g.current_request.query_params.get('payment_gw', _pg_name)
@@ -164,7 +165,7 @@ class Orders():
 
         if len(product['services']):
             ep_name = product['services'][0]['entrypoint']
-            _ep = EntryPoints('netrino.product.tasks')[ep_name]
+            _ep = plugins('netrino.product.tasks')[ep_name]
             setup_form = form(_ep.prepare, {})
         else:
             return self.order_product(req, resp, pid, order['id'])
@@ -191,7 +192,7 @@ class Orders():
                                             endpoint='orchestration',
                                             data=data).json
 
-        payment_gw = EntryPoints('netrino.payment.gateways')[
+        payment_gw = plugins('netrino.payment.gateways')[
             req.form_dict['payment_gateway']](product, oid)
 
         return render_template('netrino.ui/orders/view_product.html',
@@ -231,7 +232,7 @@ class Orders():
             pg_name = g.app.config.get('orchestration',
                                        'default_payment_gateway')
 
-        payment_gw = EntryPoints('netrino.payment.gateways')[
+        payment_gw = plugins('netrino.payment.gateways')[
             pg_name](product, oid)
 
         additional = None
@@ -32,11 +32,11 @@ from luxon import router
 from luxon import register
 from luxon import render_template
 from luxon.utils.bootstrap4 import form
-from luxon.utils.pkg import EntryPoints
 from luxon.exceptions import FieldMissing
 
 from netrino.ui.models.products import netrino_product
 from netrino.ui.models.products import netrino_custom_attr
+from netrino.helpers.plugins import plugins
 
 
 def render_model(element_model, pid, mval, mtype, view, data={},
@@ -242,7 +242,7 @@ class Products():
         except KeyError:
             raise FieldMissing('Service', 'Product Service',
                                'Please select Service for Product')
-        model = EntryPoints('netrino.product.tasks')[ep].form
+        model = plugins('netrino.product.tasks')[ep].form
 
         return render_model(model, pid, ep, 'service', view="Add")
 
@@ -267,7 +267,7 @@ class Products():
                                             pid, ep,),
                                         data=req.form_dict)
 
-        model = EntryPoints('netrino.product.tasks')[ep].form
+        model = plugins('netrino.product.tasks')[ep].form
 
         return render_model(model, pid, ep,
                             'service', view="Edit",
@@ -278,7 +278,7 @@ class Products():
                                         '/v1/product/%s/%s' % (
                                            pid, ep,))
 
-        model = EntryPoints('netrino.product.tasks')[ep].form
+        model = plugins('netrino.product.tasks')[ep].form
 
         return render_model(model, pid, ep,
                             'service', view="View",
@@ -33,6 +33,14 @@ from luxon import GetLogger
 
 log = GetLogger(__name__)
 
+# netrino_workflow columns rendered, metadata and entry_point are not.
+FIELDS = ('node', 'node_type', 'node_label', 'node_description',
+          'node_style', 'node_parent', 'node_source', 'node_target',
+          'node_x', 'node_y', 'node_width', 'node_height',
+          'node_link_target_x', 'node_link_target_y',
+          'node_link_source_x', 'node_link_source_y',
+          'node_link_point_x', 'node_link_point_y',)
+
 
 def mxgraph(result):
     result = sorted(result, key=lambda i: i['node'])
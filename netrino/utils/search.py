@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+import re
+import heapq
+from math import log
+from bisect import bisect_left, insort
+from threading import RLock
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Maximum terms a query prefix expands to.
+MAX_EXPANSIONS = 64
+
+# Score factor for terms matched by prefix only.
+PREFIX_WEIGHT = 0.5
+
+
+def tokenize(text):
+    """Lowercase word tokens of text.
+
+    >>> tokenize('Fibre 100Mb/s, uncapped!')
+    ['fibre', '100mb', 's', 'uncapped']
+    """
+    if not text:
+        return []
+    return TOKEN_RE.findall(str(text).lower())
+
+
+class Index(object):
+    """Inverted index with ranked and prefix matching.
+
+    Documents are made of weighted fields, each field's tokens counting
+    towards the document's term frequency with the field weight. Results
+    must match every query token, either exactly or as the prefix of a
+    term, and are ranked by weighted term frequency times inverse document
+    frequency.
+
+    Args:
+        weights (dict): Weight per field name, unknown fields weigh 1.
+
+    >>> index = Index({'name': 3})
+    >>> index.add('1', {'name': 'Fibre 100'}, {'name': 'Fibre 100'})
+    >>> index.add('2', {'name': 'LTE', 'description': 'no fibre'})
+    >>> [doc['id'] for doc in index.search('fib')]
+    ['1', '2']
+    >>> index.remove('1')
+    >>> [doc['id'] for doc in index.search('fibre 100')]
+    []
+    """
+    def __init__(self, weights=None):
+        self.weights = weights or {}
+        self._postings = {}
+        self._terms = []
+        self._docs = {}
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, doc_id, fields, summary=None):
+        """Index a document, replacing any previous version.
+
+        Args:
+            doc_id (str): Document id.
+            fields (dict): Text per field name.
+            summary (dict): Returned with search results.
+        """
+        freqs = {}
+        for field, text in fields.items():
+            weight = self.weights.get(field, 1)
+            for token in tokenize(text):
+                freqs[token] = freqs.get(token, 0) + weight
+
+        with self._lock:
+            self.remove(doc_id)
+            for token, freq in freqs.items():
+                posting = self._postings.get(token)
+                if posting is None:
+                    posting = self._postings[token] = {}
+                    insort(self._terms, token)
+                posting[doc_id] = freq
+            self._docs[doc_id] = (tuple(freqs),
+                                  dict(summary or {}, id=doc_id))
+
+    def remove(self, doc_id):
+        """Remove a document from the index.
+
+        Args:
+            doc_id (str): Document id.
+        """
+        with self._lock:
+            doc = self._docs.pop(doc_id, None)
+            if doc is None:
+                return
+
+            for token in doc[0]:
+                posting = self._postings[token]
+                del posting[doc_id]
+                if not posting:
+                    del self._postings[token]
+                    del self._terms[bisect_left(self._terms, token)]
+
+    def _expand(self, token):
+        terms = {}
+        if token in self._postings:
+            terms[token] = 1
+
+        i = bisect_left(self._terms, token)
+        while len(terms) < MAX_EXPANSIONS and i < len(self._terms):
+            term = self._terms[i]
+            if not term.startswith(token):
+                break
+            terms.setdefault(term, PREFIX_WEIGHT)
+            i += 1
+
+        return terms
+
+    def _scores(self, token):
+        docs = len(self._docs)
+        scores = {}
+        for term, weight in self._expand(token).items():
+            posting = self._postings[term]
+            idf = log(1 + docs / len(posting))
+            for doc_id, freq in posting.items():
+                score = freq * idf * weight
+                if score > scores.get(doc_id, 0):
+                    scores[doc_id] = score
+
+        return scores
+
+    def search(self, query, limit=20, offset=0, match=None):
+        """Documents matching every token of query, best first.
+
+        Args:
+            query (str): Search text.
+            limit (int): Maximum results.
+            offset (int): Results to skip.
+            match (callable): Called with the summary of each document
+                found, only those it returns True for are ranked.
+
+        Returns:
+            list of document summaries with 'score'.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+
+        with self._lock:
+            matches = sorted((self._scores(token) for token in tokens),
+                             key=len)
+            scores = matches[0]
+            for other in matches[1:]:
+                scores = {doc_id: score + other[doc_id]
+                          for doc_id, score in scores.items()
+                          if doc_id in other}
+            if match is not None:
+                scores = {doc_id: score for doc_id, score in scores.items()
+                          if match(self._docs[doc_id][1])}
+
+            best = heapq.nlargest(offset + limit, scores.items(),
+                                  key=lambda item: (item[1], item[0]))
+            return [dict(self._docs[doc_id][1], score=round(score, 4))
+                    for doc_id, score in best[offset:]]
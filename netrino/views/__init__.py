@@ -2,3 +2,7 @@ import netrino.views.process
 import netrino.views.products
 import netrino.views.orders
 import netrino.views.tasks
+import netrino.views.plugins
+import netrino.views.elements
+import netrino.views.interface
+import netrino.views.ipam
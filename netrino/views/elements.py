@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+from luxon import register
+from luxon import router
+from luxon import db
+
+from luxon.helpers.api import sql_list, obj
+from luxon.exceptions import ValidationError
+
+from netrino.models.elements import netrino_element
+from netrino.helpers.dialect import insert, update
+from netrino.helpers.plugins import plugins
+from netrino.helpers import elements
+
+
+def _validate(element):
+    if element['classification'] not in plugins(elements.CLASSIFICATIONS):
+        raise ValidationError("Unknown element classification '%s'"
+                              % element['classification'])
+
+
+@register.resources()
+class Elements:
+    def __init__(self):
+        router.add('GET', '/v1/elements', self.list,
+                   tag='services')
+        router.add('GET', '/v1/element/{eid}', self.view,
+                   tag='services')
+        router.add('POST', '/v1/element', self.create,
+                   tag='services:admin')
+        router.add(['PUT', 'PATCH'], '/v1/element/{eid}', self.update,
+                   tag='services:admin')
+        router.add('DELETE', '/v1/element/{eid}', self.delete,
+                   tag='services:admin')
+
+    def list(self, req, resp):
+        return sql_list(req,
+                        'netrino_element',
+                        fields=('id',
+                                'name',
+                                'classification',
+                                'creation_time',),
+                        search={'id': str,
+                                'name': str,
+                                'classification': str})
+
+    def view(self, req, resp, eid):
+        return obj(req, netrino_element, sql_id=eid)
+
+    def create(self, req, resp):
+        element = obj(req, netrino_element)
+        _validate(element)
+        with db() as conn:
+            insert(conn, 'netrino_element', element.dict)
+            elements.index(conn, str(element['id']),
+                           element['classification'])
+            conn.commit()
+        return element
+
+    def update(self, req, resp, eid):
+        element = obj(req, netrino_element, sql_id=eid)
+        _validate(element)
+        with db() as conn:
+            update(conn, 'netrino_element', element.dict, eid)
+            elements.index(conn, eid, element['classification'])
+            conn.commit()
+        return element
+
+    def delete(self, req, resp, eid):
+        element = obj(req, netrino_element, sql_id=eid)
+        with db() as conn:
+            elements.unindex(conn, eid)
+            conn.execute('DELETE FROM netrino_element WHERE id=?', eid)
+            conn.commit()
+        return element
@@ -30,22 +30,75 @@
 from luxon import router
 from luxon import register
 from luxon import db
+from luxon import js
 
-from luxon.utils.pkg import EntryPoints
 from luxon.exceptions import NotFoundError
+from luxon.exceptions import ValidationError
 from luxon.helpers.api import raw_list
 
 from netrino.helpers.elements import elements_with_interface
+from netrino.helpers.fields import number
+from netrino.helpers.plugins import plugins
+from netrino.helpers.sessions import Unavailable, pool
+from netrino.helpers.guard import guard
+from netrino.helpers.interfaces import call, fan_out, streaming
 
 METHODS = ('GET','POST','PUT','DELETE','PATCH',
            'OPTIONS','HEAD','TRACE','CONNECT')
 
+# Maximum elements called by a batch request.
+MAX_ELEMENTS = 1000
+
+
+def _batch(results):
+    # JSON lines returned as the WSGI body, sent as each call completes.
+    try:
+        for result in results:
+            try:
+                line = js.dumps(result)
+            except Exception:
+                line = js.dumps({'id': result['id'],
+                                 'error': 'Result not serializable'})
+            yield (line + '\n').encode('utf-8')
+    finally:
+        results.close()
+
+
+def _lines(result):
+    # Streamed result as JSON lines, closed when done or the client is gone.
+    try:
+        try:
+            for item in result:
+                yield (js.dumps(item) + '\n').encode('utf-8')
+        except Exception as e:
+            # The status was set before the body, the error is reported as
+            # the last line instead.
+            yield (js.dumps({'error': str(e)}) + '\n').encode('utf-8')
+    finally:
+        result.close()
+
+
+def _array(result):
+    # Streamed result as a JSON array, item by item.
+    try:
+        yield b'['
+        for i, item in enumerate(result):
+            yield ((',' if i else '') + js.dumps(item)).encode('utf-8')
+        yield b']'
+    finally:
+        result.close()
+
+
 @register.resources()
 class Interface():
     def __init__(self):
         router.add('GET','/v1/interfaces', self.list, tag='services')
         router.add('GET', '/v1/interfaces/{interface}', self.list_elements,
                    tag='services')
+        router.add('POST', '/v1/interfaces/{interface}/batch', self.batch,
+                   tag='services')
+        router.add('GET', '/v1/metrics/interfaces', self.metrics,
+                   tag='services:admin')
         router.add(METHODS,
                    '/v1/interface/{id}/{interface}/{property}',
                    self.interface, tag='services')
@@ -57,21 +110,41 @@ class Interface():
         """Lists all the registered tachyonic_interfaces Entrypoints.
         """
         interfaces = []
-        for e in EntryPoints('tachyonic_interfaces'):
+        for e in plugins('tachyonic_interfaces'):
             interfaces.append({'id': e, 'name': e})
         return raw_list(req, interfaces)
 
+    def metrics(self, req, resp):
+        """Interface call metrics of the worker handling the request.
+
+        Returns:
+            Queue wait and rejected calls, circuits not closed and the
+            sessions open per element.
+        """
+        metrics = guard().metrics()
+        metrics['sessions'] = pool().stats()
+        return metrics
+
     def list_elements(self, req, resp, interface):
         """For a given interface, list all elements that supports this
         interface
 
+        Paged with the limit query parameter and the marker, being the last
+        element id of the previous page.
+
         Args:
             interface (str): Netrino Interface in question.
 
         Returns:
             list of elements id's that supports this interface.
         """
-        return elements_with_interface(interface)
+        limit = number(req, 'limit', 1000, 1)
+        ids = elements_with_interface(interface, limit,
+                                      req.query_params.get('marker', None))
+        return {'payload': ids,
+                'metadata': {'limit': limit,
+                             'marker': ids[-1] if len(ids) == limit
+                             else None}}
 
 
 
@@ -86,14 +159,11 @@ class Interface():
         Returns:
             Executes the method, and returns the result.
         """
-        tachyonic_interface = EntryPoints('tachyonic_interfaces')
-
         try:
-            with tachyonic_interface[interface](id) as obj:
-                method = getattr(obj, property)
-                return method(req)
-        except KeyError:
-            raise NotFoundError("Interface '%s' not registered" % interface)
+            return self._result(req, resp,
+                                call(interface, id, property, req=req))
+        except Unavailable as e:
+            return self._unavailable(resp, e)
 
     def property(self, req, resp, id, interface, property, method):
         """ Interact with element via given interface, with property method.
@@ -108,8 +178,74 @@ class Interface():
         Returns:
             Executes the method, and returns the result.
         """
-        tachyonic_interface = EntryPoints('tachyonic_interfaces')
-        with tachyonic_interface[interface](id) as obj:
-            prop_obj = getattr(obj, property)
-            method = getattr(prop_obj, method)
-            return method(req)
+        try:
+            return self._result(req, resp,
+                                call(interface, id, property, method, req))
+        except Unavailable as e:
+            return self._unavailable(resp, e)
+
+    def batch(self, req, resp, interface):
+        """Call an interface property or property method on many elements
+        concurrently.
+
+        The request body holds the element 'ids', the 'property', optionally
+        the 'method' of the property and a per call 'timeout' in seconds.
+
+        Args:
+            interface (str): Netrino Interface to use.
+
+        Returns:
+            Streams a JSON line per element as its call completes, with the
+            element 'id' and the 'result' or 'error'.
+        """
+        if interface not in plugins('tachyonic_interfaces'):
+            raise NotFoundError("Interface '%s' not registered" % interface)
+
+        body = req.json
+        ids = body.get('ids')
+        if not isinstance(ids, list) or not ids:
+            raise ValidationError("'ids' must be a list of element ids")
+        if len(ids) > MAX_ELEMENTS:
+            raise ValidationError('At most %s elements can be called per'
+                                  ' request' % MAX_ELEMENTS)
+        if not body.get('property'):
+            raise ValidationError("'property' is required")
+        timeout = body.get('timeout')
+        if timeout is not None:
+            try:
+                timeout = float(timeout)
+            except (TypeError, ValueError):
+                timeout = None
+            # Comparisons are False for nan.
+            if timeout is None or not 0 < timeout <= guard().timeout:
+                raise ValidationError("Invalid timeout '%s', expected"
+                                      " seconds up to %s"
+                                      % (body['timeout'], guard().timeout))
+
+        resp.content_type = 'application/x-ndjson'
+        return _batch(fan_out(interface, ids, body['property'],
+                              body.get('method'), req, timeout=timeout))
+
+    def _result(self, req, resp, result):
+        """Returns the result, or an iterable body streaming it when the
+        interface method returned an iterator.
+
+        Streamed as NDJSON when requested with ?format=ndjson or the
+        application/x-ndjson Accept header, otherwise as a JSON array
+        sent item by item.
+        """
+        if not streaming(result):
+            return result
+
+        if (req.query_params.get('format', None) == 'ndjson' or
+                'application/x-ndjson' in (req.get_header('Accept') or '')):
+            resp.content_type = 'application/x-ndjson'
+            return _lines(result)
+
+        resp.content_type = 'application/json'
+        return _array(result)
+
+    def _unavailable(self, resp, error):
+        resp.status = 503
+        return {'error': {'title': 'Service Unavailable',
+                          'description': str(error)}}
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+from luxon import register
+from luxon import router
+
+from luxon.exceptions import ValidationError
+from luxon.exceptions import HTTPConflict
+
+from netrino.helpers.ipam import IPAM, Conflict
+from netrino.helpers.utilization import utilization
+
+# Prefixes allocated by a single request.
+MAX_PREFIXES = 10000
+
+
+def _count(value):
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        count = 0
+    if not 1 <= count <= MAX_PREFIXES:
+        raise ValidationError("'count' must be an integer from 1 to %s"
+                              % MAX_PREFIXES)
+    return count
+
+
+@register.resources()
+class Prefixes:
+    def __init__(self):
+        router.add('POST', '/v1/ipam/allocate', self.allocate,
+                   tag='services:admin')
+        router.add('GET', '/v1/ipam/utilization', self.utilization,
+                   tag='services')
+        router.add('GET', '/v1/ipam/usage', self.usage,
+                   tag='services')
+
+    def allocate(self, req, resp):
+        """Allocates prefixes of mixed lengths from the pools of a tag,
+        all or none of them.
+
+        The body has the 'tag' and the 'prefixes' to allocate, each with
+        the 'prefix_len', optional 'count' and 'name'. Returns the
+        allocated 'prefixes' in the order requested.
+        """
+        body = req.json
+        tag = body.get('tag')
+        if not tag:
+            raise ValidationError("'tag' is required")
+        prefixes = body.get('prefixes')
+        if not isinstance(prefixes, list) or not prefixes:
+            raise ValidationError("'prefixes' must be a list of prefix"
+                                  " lengths to allocate")
+
+        lengths = []
+        for prefix in prefixes:
+            if not isinstance(prefix, dict) or 'prefix_len' not in prefix:
+                raise ValidationError("'prefix_len' is required")
+            try:
+                prefix_len = int(prefix['prefix_len'])
+            except (TypeError, ValueError):
+                raise ValidationError("'prefix_len' must be an integer")
+            lengths.append((prefix_len, prefix.get('name'),
+                            _count(prefix.get('count', 1)),))
+        # Checked before expanding the counts into requests.
+        if sum(count for prefix_len, name, count in lengths) > MAX_PREFIXES:
+            raise ValidationError('At most %s prefixes can be allocated'
+                                  ' per request' % MAX_PREFIXES)
+        requests = [(prefix_len, tag, name,)
+                    for prefix_len, name, count in lengths
+                    for i in range(count)]
+
+        try:
+            allocated = IPAM().find_many(requests)
+        except Conflict as e:
+            raise HTTPConflict(title="Allocation Conflict",
+                               description=str(e))
+        return {'tag': tag,
+                'prefixes': [{'prefix': prefix, 'name': name}
+                             for prefix, (prefix_len, tag, name)
+                             in zip(allocated, requests)]}
+
+    def utilization(self, req, resp):
+        """Utilization of the pools of the 'tag' query parameter.
+
+        Returns the pools with their addresses allocated and free, and
+        the fragmentation of the free addresses.
+        """
+        tag = req.query_params.get('tag')
+        if not tag:
+            raise ValidationError("'tag' is required")
+        return {'tag': tag, 'pools': utilization(tag)}
+
+    def usage(self, req, resp):
+        """Addresses allocated and free in the 'prefix' query parameter.
+
+        With 'length', also those of each prefix of the length inside,
+        to render a heatmap of the prefix.
+        """
+        prefix = req.query_params.get('prefix')
+        if not prefix:
+            raise ValidationError("'prefix' is required")
+        length = req.query_params.get('length')
+        if length is not None:
+            try:
+                length = int(length)
+            except ValueError:
+                raise ValidationError("'length' must be an integer")
+        return IPAM().usage(prefix, length)
@@ -32,15 +32,47 @@ from luxon import router
 from luxon import db
 from luxon import js
 
-from luxon.utils.pkg import EntryPoints
 from luxon.helpers.api import raw_list, obj
 from luxon.utils.unique import string_id
 from luxon.utils.timezone import to_utc
 
 from luxon.exceptions import ValidationError
+from luxon.exceptions import NotFoundError
+from luxon.exceptions import SQLIntegrityError
 from luxon.exceptions import HTTPConflict
 
 from netrino.models.orders import netrino_order
+from netrino.helpers.dialect import json_merge_patch, insert
+from netrino.helpers.stats import count_order, statistics, rebuild
+from netrino.helpers.events import emit
+from netrino.helpers.plugins import plugins
+from netrino.helpers.products import PRODUCT_FIELDS
+from netrino.helpers.fields import requested, project
+from netrino.utils.merge import merge_patch
+
+# Attempts at compare-and-swap when the database has no native merge-patch.
+UPDATE_RETRIES = 5
+
+# netrino_order columns that may be requested with ?fields=.
+ORDER_FIELDS = ('id', 'short_id', 'product_id', 'domain', 'tenant_id',
+                'user_id', 'metadata', 'price', 'status', 'payment_date',
+                'version', 'creation_time',)
+
+# Order list columns, metadata is deferred.
+ORDER_COLUMNS = {'id': 'netrino_order.id',
+                 'short_id': 'netrino_order.short_id',
+                 'product_id': 'netrino_order.product_id',
+                 'product_name': 'netrino_product.name',
+                 'tenant_id': 'netrino_order.tenant_id',
+                 'user_id': 'netrino_order.user_id',
+                 'metadata': 'netrino_order.metadata',
+                 'price': 'netrino_order.price',
+                 'status': 'netrino_order.status',
+                 'payment_date': 'netrino_order.payment_date',
+                 'version': 'netrino_order.version',
+                 'creation_time': 'netrino_order.creation_time'}
+ORDER_LIST = ('id', 'product_name', 'creation_time', 'tenant_id', 'status',
+              'short_id',)
 
 
 @register.resources()
@@ -50,6 +82,11 @@ class Orders:
                    tag='customer')
         router.add('GET', '/v1/order/{oid}', self.view,
                    tag='customer')
+        router.add('GET', '/v1/orders/statistics', self.stats,
+                   tag='customer')
+        router.add('POST', '/v1/orders/statistics/rebuild',
+                   self.rebuild_stats,
+                   tag='services:admin')
         router.add('POST', '/v1/order', self.create,
                    tag='customer')
         router.add(['PUT', 'PATCH'], '/v1/order/{oid}', self.update,
@@ -61,7 +98,8 @@ class Orders:
 
     def _get_service(self, oid):
         sql_order = 'SELECT product_id FROM netrino_order WHERE id=?'
-        sql_product = 'SELECT * FROM netrino_product WHERE id=?'
+        sql_product = 'SELECT %s FROM netrino_product WHERE id=?' % (
+            ','.join(PRODUCT_FIELDS))
         sql = 'SELECT entrypoint,metadata FROM netrino_product_entrypoint ' \
               'WHERE product_id=?'
         with db() as conn:
@@ -81,13 +119,8 @@ class Orders:
         return product, None, None
 
     def _get_orders(self, req):
-        select = {'netrino_order.id': 'id',
-                  'netrino_product.name': 'product_name',
-                  'netrino_order.creation_time': 'creation_time',
-                  'netrino_order.tenant_id': 'tenant_id',
-                  'netrino_order.status':'status',
-                  'netrino_order.short_id': 'short_id'
-                  }
+        columns = dict(ORDER_COLUMNS)
+        default = ORDER_LIST
 
         s_from = ['netrino_order', 'netrino_product']
         where = {'netrino_order.product_id': 'netrino_product.id'}
@@ -97,11 +130,13 @@ class Orders:
             where['tenant_id'] = None
             vals.append(req.context_tenant_id)
         else:
-            select['infinitystone_tenant.name'] = 'tenant_name'
+            columns['tenant_name'] = 'infinitystone_tenant.name'
+            default += ('tenant_name',)
             s_from.append('infinitystone_tenant')
             where['infinitystone_tenant.id'] = 'netrino_order.tenant_id'
 
-        select = ['%s AS %s' % (k,select[k],) for k in select]
+        fields = requested(req, tuple(columns), default)
+        select = ['%s AS %s' % (columns[k], k,) for k in fields]
         select = 'SELECT ' + ','.join(select)
         select += ' FROM ' + ','.join(s_from)
 
@@ -123,61 +158,179 @@ class Orders:
 
         return raw_list(req, orders)
 
-    def create(self, req, resp):
+    def stats(self, req, resp):
+        group_by = req.query_params.get('group_by', 'status')
+        group_by = tuple(group for group in group_by.split(',') if group)
 
+        return raw_list(req, statistics(group_by, req.context_tenant_id))
+
+    def rebuild_stats(self, req, resp):
+        return {'groups': rebuild()}
+
+    def create(self, req, resp):
         order = obj(req, netrino_order)
         order.update({'short_id': string_id(25)})
+        # Insert and count in one transaction, which commit() cannot do.
         try:
-            order.commit()
-        except ValidationError:
+            with db() as conn:
+                insert(conn, 'netrino_order', order.dict)
+                count_order(conn, order.dict)
+                emit(conn, 'order.created', order['id'], order.dict)
+                conn.commit()
+        except SQLIntegrityError:
             raise HTTPConflict(title="Duplicate Order",
                                description="Please retry this request")
 
         return order
 
+    def _if_match(self, req):
+        etag = req.get_header('If-Match')
+        if not etag or etag == '*':
+            return None
+
+        try:
+            return int(etag.replace('W/', '').strip('"'))
+        except ValueError:
+            raise ValidationError("Invalid If-Match order version '%s'"
+                                  % etag)
+
+    def _update_sql(self, conn, req, oid, version):
+        fields = ['version=version+1']
+        vals = []
+        current = None
+        merge = json_merge_patch('metadata')
+
+        if 'status' in req.json or ('metadata' in req.json and not merge):
+            # Compare-and-swap on version, the statistics counters need the
+            # previous status and without native merge-patch the metadata
+            # is merged here.
+            current = conn.execute('SELECT tenant_id,product_id,status,'
+                                   'metadata,version'
+                                   ' FROM netrino_order WHERE id=?',
+                                   oid).fetchone()
+            if not current:
+                raise NotFoundError("Order '%s' not found" % oid)
+            if version is None:
+                version = current['version']
+
+        if 'metadata' in req.json:
+            if merge:
+                fields.append('metadata=' + merge)
+                vals.append(js.dumps(req.json['metadata']))
+            else:
+                md = js.loads(current['metadata'] or '{}')
+                fields.append('metadata=?')
+                vals.append(js.dumps(merge_patch(md, req.json['metadata'])))
+
+        if 'status' in req.json:
+            fields.append('status=?')
+            vals.append(req.json['status'])
+
+        if 'payment_date' in req.json:
+            fields.append('payment_date=?')
+            vals.append(to_utc(req.json['payment_date']))
+
+        if len(fields) == 1:
+            return None, None, version, current
+
+        sql = 'UPDATE netrino_order SET ' + ','.join(fields)
+        sql += ' WHERE id=?'
+        vals.append(oid)
+
+        if version is not None:
+            sql += ' AND version=?'
+            vals.append(version)
+
+        return sql, vals, version, current
+
     def update(self, req, resp, oid):
         """The following fields can be updated:
         status
         metadata
         payment_date
-        """
-        sql = 'UPDATE netrino_order SET '
-        vals = []
-        fields = []
-        o_sql = 'SELECT * FROM netrino_order WHERE id=?'
-        with db() as conn:
-            if 'metadata' in req.json:
-                emd = conn.execute(o_sql, oid).fetchone()['metadata']
-                if emd:
-                    md = js.loads(emd)
-                else:
-                    md = {}
-
-                md.update(req.json['metadata'])
-                fields.append('metadata=?')
-                vals.append(js.dumps(md))
 
-            if 'status' in req.json:
-                fields.append('status=?')
-                vals.append(req.json['status'])
+        Metadata is applied as a JSON merge-patch (RFC 7396) within the
+        same statement that increments the order version. Send the version
+        last seen in the If-Match header to receive a conflict rather than
+        overwriting a concurrent update. Send 'Prefer: return=minimal' to
+        skip reading back the order.
+        """
+        expected = self._if_match(req)
+
+        for attempt in range(UPDATE_RETRIES):
+            with db() as conn:
+                sql, vals, version, current = self._update_sql(conn, req,
+                                                               oid, expected)
+                if not sql:
+                    break
+
+                if conn.execute(sql, vals).rowcount:
+                    event = {field: req.json[field]
+                             for field in ('status', 'metadata',
+                                           'payment_date',)
+                             if field in req.json}
+                    event['id'] = oid
+                    if current and current['status'] != req.json.get(
+                            'status', current['status']):
+                        count_order(conn, current, -1)
+                        count_order(conn, dict(current,
+                                               status=req.json['status']))
+                        event['previous_status'] = current['status']
+                    emit(conn, 'order.updated', oid, event)
+                    conn.commit()
+                    break
+
+                if not conn.execute('SELECT id FROM netrino_order'
+                                    ' WHERE id=?', oid).fetchone():
+                    raise NotFoundError("Order '%s' not found" % oid)
+
+            if expected is not None:
+                raise HTTPConflict(title="Order Modified",
+                                   description="Order '%s' is no longer at"
+                                               " version %s" % (oid,
+                                                                expected))
+        else:
+            raise HTTPConflict(title="Order Modified",
+                               description="Please retry this request")
 
-            if 'payment_date' in req.json:
-                fields.append('payment_date=?')
-                vals.append(to_utc(req.json['payment_date']))
+        if req.get_header('Prefer') == 'return=minimal':
+            if sql and version is not None:
+                resp.set_header('ETag', '"%s"' % (version + 1))
+            return None
 
-            sql += ','.join(fields)
-            sql += ' WHERE id=?'
+        order = obj(req, netrino_order, sql_id=oid)
+        resp.set_header('ETag', '"%s"' % order['version'])
+        return order
 
-            if vals:
-                conn.execute(sql, vals + [oid])
-                conn.commit()
+    def view(self, req, resp, oid):
+        if req.query_params.get('fields', None):
+            order, version = self._get_order(req, oid)
+        else:
+            order = obj(req, netrino_order, sql_id=oid)
+            version = order['version']
+        resp.set_header('ETag', '"%s"' % version)
+        return order
 
-            order = conn.execute(o_sql, oid).fetchone()
+    def _get_order(self, req, oid):
+        # Only the columns requested, scoped as obj() would. The version
+        # is always read for the ETag but only returned when requested.
+        fields = requested(req, ORDER_FIELDS)
+        columns = fields if 'version' in fields else fields + ('version',)
+        sql = 'SELECT %s FROM netrino_order WHERE id=?' % ','.join(columns)
+        vals = [oid]
+        if req.context_domain:
+            sql += ' AND domain=?'
+            vals.append(req.context_domain)
+        if req.context_tenant_id:
+            sql += ' AND tenant_id=?'
+            vals.append(req.context_tenant_id)
 
-        return order
+        with db() as conn:
+            order = conn.execute(sql, vals).fetchone()
+        if not order:
+            raise NotFoundError("Order '%s' not found" % oid)
 
-    def view(self, req, resp, oid):
-        return obj(req, netrino_order, sql_id=oid)
+        return project(order, fields), order['version']
 
     def activate(self, req, resp, oid):
         product, ep, metadata = self._get_service(oid)
@@ -185,10 +338,15 @@ class Orders:
         result = {'reason': 'Nothing to do, no "netrino.product.tasks" '
                             'entrypoint found'}
         if ep:
-            ep = EntryPoints('netrino.product.tasks')[ep]
+            ep = plugins('netrino.product.tasks')[ep]
             ep_obj = ep(req, metadata, oid, product)
             result = ep_obj.deploy()
 
+        with db() as conn:
+            emit(conn, 'order.activated', oid,
+                 {'id': oid, 'product_id': product['id'], 'result': result})
+            conn.commit()
+
         return result
 
     def deactivate(self, req, resp, oid):
@@ -197,8 +355,13 @@ class Orders:
         result = {'reason': 'Nothing to do, no "netrino.product.tasks" '
                             'entrypoint found'}
         if ep:
-            ep = EntryPoints('netrino.product.tasks')[ep]
+            ep = plugins('netrino.product.tasks')[ep]
             ep_obj = ep(req, metadata, oid, product)
             result = ep_obj.deactivate()
 
+        with db() as conn:
+            emit(conn, 'order.deactivated', oid,
+                 {'id': oid, 'product_id': product['id'], 'result': result})
+            conn.commit()
+
         return result
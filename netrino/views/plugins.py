@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2019 Christiaan Frans Rademan, Dave Kruger.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holders nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF
+# THE POSSIBILITY OF SUCH DAMAGE.
+from luxon import register
+from luxon import router
+from luxon.helpers.api import raw_list
+
+from netrino.helpers.plugins import plugins, reload, GROUPS
+from netrino.helpers import elements
+
+
+@register.resources()
+class Plugins:
+    def __init__(self):
+        router.add('GET', '/v1/plugins', self.list,
+                   tag='services:admin')
+        router.add('POST', '/v1/plugins/reload', self.reload,
+                   tag='services:admin')
+
+    def list(self, req, resp):
+        """Lists plugins resolved per entry point group.
+        """
+        resolved = []
+        for group in GROUPS:
+            for name in plugins(group):
+                resolved.append({'id': '%s:%s' % (group, name),
+                                 'group': group,
+                                 'name': name})
+        return raw_list(req, resolved)
+
+    def reload(self, req, resp):
+        """Resolves entry points again in the worker handling the request.
+
+        The element interface index is rebuilt when the interfaces of
+        element classifications changed.
+        """
+        supported = elements.signature()
+        reload()
+        if elements.signature() != supported:
+            elements.rebuild()
+        return {group: sorted(plugins(group)) for group in GROUPS}
@@ -36,6 +36,7 @@ from luxon.helpers.api import sql_list, obj
 from luxon.exceptions import SQLIntegrityError, HTTPBadRequest
 
 from netrino.utils.mxgraph import MxChangeDecoder, mxgraph
+from netrino.utils.mxgraph import FIELDS as MXGRAPH_FIELDS
 from netrino.models.processes import netrino_process
 
 log = GetLogger(__name__)
@@ -111,7 +112,8 @@ class Workflow():
                          ' AND (node_removed = 1' +
                          ' OR node_type is NULL)', process_id)
             conn.commit()
-            graph = conn.execute('SELECT * FROM netrino_workflow' +
+            graph = conn.execute('SELECT ' + ','.join(MXGRAPH_FIELDS) +
+                                 ' FROM netrino_workflow' +
                                  ' WHERE process_id = %s' +
                                  ' AND node_removed = 0',
                                  process_id).fetchall()
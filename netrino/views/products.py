@@ -35,7 +35,11 @@ from luxon import g
 from luxon import js
 
 from luxon.helpers.api import sql_list, obj, raw_list
-from luxon.utils.pkg import EntryPoints
+from luxon.exceptions import NotFoundError
+from luxon.exceptions import AccessDeniedError
+from luxon.exceptions import ValidationError
+from luxon.exceptions import SQLIntegrityError
+from luxon.exceptions import HTTPConflict
 from luxon.utils import sql
 
 from netrino.models.products import netrino_product
@@ -43,6 +47,57 @@ from netrino.models.products import netrino_custom_attr
 from netrino.models.products import netrino_categories
 from netrino.models.products import netrino_product_entrypoint
 from netrino.models.products import netrino_payment_gateway
+from netrino.helpers.plugins import plugins
+from netrino.helpers.products import load_product, load_products
+from netrino.helpers.products import PRODUCT_FIELDS, CHILDREN
+from netrino.helpers.fields import requested, project, number
+from netrino.helpers.catalog import catalog
+from netrino.helpers.dialect import insert
+from netrino.helpers.dialect import update
+from netrino.helpers import hierarchy
+from netrino.helpers import bulk
+from netrino.helpers import facets
+from netrino.helpers.search import search
+from netrino.helpers.images import save_product_image
+from netrino.helpers.images import load as load_image
+
+# Served for products without an image.
+BLANK_IMAGE = base64.b64decode(b"R0lGODlhAQABAIAAAAAAAP///"
+                               b"yH5BAEAAAAALAAAAAABAAEAAAIBRAA7")
+BLANK_ID = 'blank'
+
+# Product list columns unless others are requested with ?fields=.
+LIST_FIELDS = ('id', 'name', 'parent_id', 'price', 'monthly',
+               'thumbnail_id', 'creation_time',)
+
+# Product list columns matched by ?search=field:value.
+SEARCH_FIELDS = {'id': str,
+                 'name': str,
+                 'parent_id': str,
+                 'price': str,
+                 'monthly': str,
+                 'description': str,
+                 'creation_time': str}
+
+CHILD_KEYS = tuple(key for key, table, fields in CHILDREN)
+
+# Product detail ?view= and the child it lists.
+VIEWS = {'categories': 'categories',
+         'services': 'services',
+         'attributes': 'custom_attributes',
+         'payment_gateways': 'payment_gateways'}
+
+
+def _in_domain(req, product):
+    # The domain scoping obj() applies, cached products being loaded
+    # without the request.
+    return (product.get('domain') is None or req.context_domain is None or
+            product['domain'] == req.context_domain)
+
+
+def _id(value):
+    # Uuid fields may hold UUID objects or strings.
+    return str(value) if value else None
 
 
 @register.resources()
@@ -52,12 +107,18 @@ class Products:
                    tag='customer')
         router.add('GET', '/v1/products', self.products,
                    tag='customer')
+        router.add('GET', '/v1/products/search', self.search,
+                   tag='customer')
         router.add('GET', '/v1/products/categories', self.categories,
                    tag='customer')
         router.add('GET', '/v1/products/attributes', self.attributes,
                    tag='customer')
         router.add('GET', '/v1/products/payment-gateways', self.pmt_gws,
                    tag='customer')
+        router.add('GET', '/v1/products/export', self.export,
+                   tag='products:admin')
+        router.add('POST', '/v1/products/import', self.bulk_import,
+                   tag='products:admin')
         router.add('POST', '/v1/product', self.create,
                    tag='products:admin')
         router.add(['PUT', 'PATCH'], '/v1/product/{pid}', self.update,
@@ -88,6 +149,12 @@ class Products:
         router.add('GET', '/v1/product/{pid}/image',
                    self.image,
                    tag='customer')
+        router.add('GET', '/v1/product/{pid}/thumbnail',
+                   self.thumbnail,
+                   tag='customer')
+        router.add('GET', '/v1/images/{image_id}',
+                   self.stored_image,
+                   tag='customer')
         router.add('GET', '/v1/products/tasks',
                    self.entrypoints,
                    tag='products:admin')
@@ -98,65 +165,96 @@ class Products:
                    self.delete_ep,
                    tag='products:admin')
 
-    def _get_categories(self, pid):
-        sql = 'SELECT * FROM netrino_categories WHERE product_id=?'
-        with db() as conn:
-            return conn.execute(sql, (pid,)).fetchall()
-
-    def _get_services(self, pid):
-        sql = 'SELECT netrino_product_entrypoint.* FROM ' \
-              'netrino_product_entrypoint WHERE product_id=?'
-        with db() as conn:
-            return conn.execute(sql, (pid,)).fetchall()
-
-    def _get_attrs(self, pid):
-        sql = 'SELECT * FROM ' \
-              'netrino_custom_attr WHERE product_id=?'
-        with db() as conn:
-            return conn.execute(sql, (pid,)).fetchall()
-
-    def _get_pmnt_gws(self, pid):
-        sql = 'SELECT * FROM ' \
-              'netrino_payment_gateway WHERE product_id=?'
-        with db() as conn:
-            return conn.execute(sql, (pid,)).fetchall()
-
     def product(self, req, resp, pid):
-        product = obj(req, netrino_product, sql_id=pid).dict
-        del product['image']
-
-        categories = self._get_categories(pid)
-        services = self._get_services(pid)
-        attrs = self._get_attrs(pid)
-        pmnt_gws = self._get_pmnt_gws(pid)
-        product['categories'] = categories
-        product['services'] = services
-        product['custom_attributes'] = attrs
-        product['payment_gateways'] = pmnt_gws
-
-        view = req.query_params.get('view', False)
-
+        expand = req.query_params.get('expand', None)
+        relations = tuple(expand.split(',')) if expand else ()
+
+        fields = None
+        if req.query_params.get('fields', None):
+            # Only the requested columns and children are loaded, not
+            # cached as invalidation is per product.
+            fields = requested(req, PRODUCT_FIELDS + CHILD_KEYS + relations +
+                               (('bundle',) if relations else ()))
+            view = VIEWS.get(req.query_params.get('view', None))
+            if view:
+                fields += (view,)
+            product = load_product(
+                pid,
+                tuple(field for field in PRODUCT_FIELDS
+                      if field in fields or field == 'domain'),
+                tuple(field for field in CHILD_KEYS if field in fields))
+        else:
+            product = catalog().get('product:%s' % pid, load_product, pid)
+
+        if not _in_domain(req, product):
+            raise AccessDeniedError("Product '%s' not in context domain"
+                                    % pid)
+        if fields is not None:
+            product = project(product, fields)
+
+        if relations:
+            # Not under 'product:' as it depends on other products.
+            product = dict(product)
+            for relation in relations:
+                if fields is None or relation in fields:
+                    product[relation] = catalog().get(
+                        'hierarchy:%s:%s' % (pid, relation),
+                        hierarchy.expand, pid, relation)
+            if fields is None or 'bundle' in fields:
+                product['bundle'] = catalog().get('bundle:%s' % pid,
+                                                  hierarchy.bundle, pid)
+
+        view = VIEWS.get(req.query_params.get('view', None))
         if view:
-            if view == 'categories':
-                return raw_list(req, categories)
-            elif view == 'services':
-                return raw_list(req, services)
-            elif view == 'attributes':
-                return raw_list(req, attrs)
-            elif view == 'payment_gateways':
-                return raw_list(req, pmnt_gws)
+            return raw_list(req, product[view])
 
         return product
 
     def products(self, req, resp):
+        # Listings are scoped to the domain and tenant of the request.
+        products = catalog().get('products:%s:%s:%s' % (
+            req.context_domain, req.context_tenant_id, req.query_string),
+            self._products, req)
+        if req.query_params.get('facets', False):
+            products = dict(products)
+            products['facets'] = self._facets(req)
+
+        return products
+
+    def _facets(self, req):
+        # Counted under the category, domain and search filters of the
+        # listing. Without category and search the counters maintained
+        # per domain are read, otherwise the matching products counted.
+        category = req.query_params.get('category', None)
+        fields = requested(req, PRODUCT_FIELDS, LIST_FIELDS)
+        terms = {}
+        for term in req.query_params.get('search', '').split(','):
+            field, sep, value = term.partition(':')
+            if sep and value and field in SEARCH_FIELDS and field in fields:
+                terms[field] = value
+        return catalog().get('facets:%s:%s:%s' % (
+            req.context_domain, category, sorted(terms.items())),
+            facets.facets, category, req.context_domain, terms)
+
+    def _products(self, req):
+        ids = req.query_params.get('ids', None)
+        if ids:
+            fields = requested(req, PRODUCT_FIELDS + CHILD_KEYS)
+            columns = tuple(field for field in fields
+                            if field in PRODUCT_FIELDS)
+            if 'domain' not in columns:
+                columns += ('domain',)
+            products = load_products(
+                ids.split(','), columns,
+                tuple(field for field in fields if field in CHILD_KEYS))
+            return raw_list(req, [project(product, fields)
+                                  for product in products
+                                  if _in_domain(req, product)])
+
+        fields = requested(req, PRODUCT_FIELDS, LIST_FIELDS)
+
         select = sql.Select('netrino_product')
         f_product = sql.Field('netrino_product.id')
-        f_name = sql.Field('netrino_product.name')
-        f_parent_id = sql.Field('netrino_product.parent_id')
-        f_price = sql.Field('netrino_product.price')
-        f_monthly = sql.Field('netrino_product.monthly')
-        f_description = sql.Field('netrino_product.description')
-        f_creation_time = sql.Field('netrino_product.creation_time')
 
         filter = req.query_params.get('category', None)
         if filter:
@@ -167,121 +265,245 @@ class Products:
             select.where = f_category_name == sql.Value(filter)
             select.inner_join('netrino_product', j_product)
 
-        select.fields = (
-            f_product, f_name, f_parent_id, f_price, f_monthly, f_description,
-            f_creation_time)
+        select.fields = tuple(sql.Field('netrino_product.%s' % field)
+                              for field in fields)
 
         return sql_list(req,
                         select,
-                        fields=('id',
-                                'name',
-                                'parent_id',
-                                'price',
-                                'monthly',
-                                'description',
-                                'creation_time',),
-                        search={'id': str,
-                                'name': str,
-                                'parent_id': str,
-                                'price': str,
-                                'monthly': str,
-                                'description': str,
-                                'creation_time': str})
+                        fields=fields,
+                        search={field: SEARCH_FIELDS[field]
+                                for field in SEARCH_FIELDS
+                                if field in fields})
+
+    def search(self, req, resp):
+        """Ranked products matching all words in the q query parameter,
+        the last word matching as prefix.
+        """
+        query = req.query_params.get('q', '')
+        limit = number(req, 'limit', 20)
+        offset = number(req, 'offset', 0)
+        return raw_list(req, search().search(query, limit, offset,
+                                             req.context_domain))
 
     def categories(self, req, resp):
-        sql = 'SELECT DISTINCT(name) FROM netrino_categories'
-        with db()as conn:
-            categories = conn.execute(sql).fetchall()
-        return raw_list(req, categories)
+        return raw_list(req, catalog().get(
+            'categories:%s' % req.context_domain, facets.categories,
+            req.context_domain))
 
     def attributes(self, req, resp):
-        sql = 'SELECT DISTINCT(name) FROM netrino_custom_attr'
-        with db()as conn:
-            attributes = conn.execute(sql).fetchall()
-        return raw_list(req, attributes)
+        return raw_list(req, catalog().get(
+            'attributes:%s' % req.context_domain, facets.attributes,
+            req.context_domain))
+
+    def _format(self, req):
+        fmt = req.query_params.get('format', None)
+        if not fmt:
+            fmt = 'csv' if 'csv' in (req.content_type or '') else 'ndjson'
+        if fmt not in bulk.FORMATS:
+            raise ValidationError("Invalid format '%s', expected one of %s"
+                                  % (fmt, ', '.join(bulk.FORMATS)))
+        return fmt
+
+    def export(self, req, resp):
+        """Streams all products with their children as NDJSON or CSV,
+        parents before children.
+        """
+        fmt = self._format(req)
+        if fmt == 'csv':
+            resp.content_type = 'text/csv'
+        else:
+            resp.content_type = 'application/x-ndjson'
+        # Returned as the WSGI iterable, sent line by line as produced.
+        return (line.encode('utf-8') for line in bulk.export(fmt))
+
+    def bulk_import(self, req, resp):
+        """Imports products in the export format read from the request
+        body, reporting the rows that failed.
+        """
+        fmt = self._format(req)
+        result = bulk.Import(domain=req.context_domain).run(
+            bulk.parse(req.stream, fmt))
+        if result['imported']:
+            catalog().invalidate()
+        return result
 
     def pmt_gws(self, req, resp):
         gateways = []
-        pgw_eps = EntryPoints('netrino.payment.gateways')
+        pgw_eps = plugins('netrino.payment.gateways')
         for pg in pgw_eps:
             gateways.append({'id': pg, 'name': pg})
         return raw_list(req, gateways)
 
     def create(self, req, resp):
         product = obj(req, netrino_product)
-        product.commit()
+        with db() as conn:
+            insert(conn, 'netrino_product', product.dict)
+            hierarchy.add(conn, product['id'], _id(product['parent_id']))
+            conn.commit()
+        catalog().invalidate()
+        search().refresh(product['id'])
         return product
 
     def update(self, req, resp, pid):
         product = obj(req, netrino_product, sql_id=pid)
-        product.commit()
+        parent_id = _id(product['parent_id'])
+        # Image data is only written through add_image.
+        values = {field: value for field, value in product.dict.items()
+                  if field != 'image'}
+        with db() as conn:
+            current = conn.execute('SELECT parent_id FROM netrino_product'
+                                   ' WHERE id=?', pid).fetchone()
+            update(conn, 'netrino_product', values, pid)
+            if _id(current['parent_id']) != parent_id:
+                hierarchy.move(conn, pid, parent_id)
+            conn.commit()
+        catalog().invalidate(pid)
+        search().refresh(pid)
         return product
 
     def delete(self, req, resp, pid):
         product = obj(req, netrino_product, sql_id=pid)
-        product.commit()
+        with db() as conn:
+            hierarchy.remove(conn, pid)
+            facets.count_product(conn, pid, -1)
+            conn.execute('DELETE FROM netrino_product WHERE id=?', pid)
+            conn.commit()
+        catalog().invalidate(pid)
+        search().refresh(pid)
         return product
 
     def add_category(self, req, resp, pid, category):
         category_entry = obj(req, netrino_categories)
         category_entry['name'] = category
         category_entry['product_id'] = pid
-        category_entry.commit()
+        try:
+            with db() as conn:
+                insert(conn, 'netrino_categories', category_entry.dict)
+                facets.count_category(conn, category, 1,
+                                      facets.domain(conn, pid))
+                conn.commit()
+        except SQLIntegrityError:
+            raise HTTPConflict(title="Duplicate Category",
+                               description="Product already in category '%s'"
+                                           % category)
+        catalog().invalidate(pid)
         return category_entry
 
     def delete_category(self, req, resp, cid):
         category_entry = obj(req, netrino_categories, sql_id=cid)
-        category_entry.commit()
+        with db() as conn:
+            conn.execute('DELETE FROM netrino_categories WHERE id=?', cid)
+            facets.count_category(conn, category_entry['name'], -1,
+                                  facets.domain(
+                                      conn, category_entry['product_id']))
+            conn.commit()
+        catalog().invalidate(category_entry['product_id'])
 
     def add_attr(self, req, resp, pid):
         category_entry = obj(req, netrino_custom_attr)
         category_entry['product_id'] = pid
-        category_entry.commit()
+        with db() as conn:
+            insert(conn, 'netrino_custom_attr', category_entry.dict)
+            facets.count_attribute(conn, category_entry['name'],
+                                   category_entry['value'], 1,
+                                   facets.domain(conn, pid))
+            conn.commit()
+        catalog().invalidate(pid)
+        search().refresh(pid)
         return category_entry
 
     def delete_attr(self, req, resp, aid):
         category_entry = obj(req, netrino_custom_attr, sql_id=aid)
-        category_entry.commit()
+        with db() as conn:
+            conn.execute('DELETE FROM netrino_custom_attr WHERE id=?', aid)
+            facets.count_attribute(conn, category_entry['name'],
+                                   category_entry['value'], -1,
+                                   facets.domain(
+                                       conn, category_entry['product_id']))
+            conn.commit()
+        catalog().invalidate(category_entry['product_id'])
+        search().refresh(category_entry['product_id'])
 
     def add_pmt_gw(self, req, resp, pid):
         category_entry = obj(req, netrino_payment_gateway)
         category_entry['product_id'] = pid
         category_entry.commit()
+        catalog().invalidate(pid)
         return category_entry
 
     def delete_pmt_gw(self, req, resp, pgid):
         category_entry = obj(req, netrino_payment_gateway, sql_id=pgid)
         category_entry.commit()
+        catalog().invalidate(category_entry['product_id'])
 
     def add_image(self, req, resp, pid):
-        image_file = req.json['image_file']['base64']
+        image_file = base64.b64decode(req.json['image_file']['base64'])
         image_type = req.json['image_file']['type']
-        sql = 'UPDATE netrino_product SET image=?,image_type=? WHERE id=?'
+        result = save_product_image(pid, image_file, image_type)
+        catalog().invalidate(pid)
+        search().refresh(pid)
+        return result
+
+    def _send_image(self, req, resp, image_id, cache_control):
+        etag = '"%s"' % image_id
+        resp.set_header('ETag', etag)
+        resp.set_header('Cache-Control', cache_control)
+        if etag in (req.get_header('If-None-Match') or ''):
+            resp.status = 304
+            return
+
+        if image_id == BLANK_ID:
+            image = {'content_type': 'image/gif', 'data': BLANK_IMAGE}
+        else:
+            image = load_image(image_id)
+            if not image:
+                raise NotFoundError("Image '%s' not found" % image_id)
+
+        resp.set_header('Content-Type', image['content_type'])
+        resp.content_type = image['content_type']
+        resp.write(image['data'])
+
+    def _product_image(self, req, resp, pid, field):
+        sql = 'SELECT image_id,thumbnail_id,image_type FROM netrino_product' \
+              ' WHERE id=?'
         with db() as conn:
-            conn.execute(sql, (image_file, image_type, pid))
-            conn.commit()
-        return {}
+            result = conn.execute(sql, pid).fetchone()
+
+        max_age = g.app.config.getint('images', 'max_age', fallback=300)
+        cache_control = 'public, max-age=%s' % max_age
+
+        if result and result[field]:
+            return self._send_image(req, resp, result[field], cache_control)
 
-    def image(self, req, resp, pid):
-        sql = 'SELECT image,image_type FROM netrino_product WHERE id=?'
         with db() as conn:
-            result = conn.execute(sql, pid).fetchone()
+            legacy = conn.execute('SELECT image FROM netrino_product'
+                                  ' WHERE id=?', pid).fetchone()
 
-        if not result or not result['image_type'] or not result['image']:
+        if not result or not result['image_type'] or not legacy['image']:
             # Returning blank image so that products
             # with no images do not have "404 not found" image
-            result = {'image_type': "image/gif",
-                      'image': b"R0lGODlhAQABAIAAAAAAAP///"
-                               b"yH5BAEAAAAALAAAAAABAAEAAAIBRAA7"}
+            return self._send_image(req, resp, BLANK_ID, cache_control)
 
+        # Base64 image stored before images were content-addressed.
         resp.set_header('Content-Type', result['image_type'])
         resp.content_type = result['image_type']
-        resp.write(base64.b64decode(result['image']))
+        resp.write(base64.b64decode(legacy['image']))
+
+    def image(self, req, resp, pid):
+        self._product_image(req, resp, pid, 'image_id')
+
+    def thumbnail(self, req, resp, pid):
+        self._product_image(req, resp, pid, 'thumbnail_id')
+
+    def stored_image(self, req, resp, image_id):
+        # Content-addressed, the image at this URL never changes.
+        self._send_image(req, resp, image_id,
+                         'public, max-age=31536000, immutable')
 
     def add_ep(self, req, resp, pid, ep):
         region = g.app.config.get('identity', 'region',
                                   fallback=req.context_region)
-        metadata_model = EntryPoints('netrino.product.tasks')[
+        metadata_model = plugins('netrino.product.tasks')[
             ep].model()
         metadata_model.update(req.json)
         # Check to see all required data was submittied
@@ -293,6 +515,7 @@ class Products:
         model['entrypoint'] = ep
         model['metadata'] = js.dumps(metadata)
         model.commit()
+        catalog().invalidate(pid)
         return self.view_ep(req, resp, model['id'])
 
     def view_ep(self, req, resp, eid):
@@ -304,6 +527,7 @@ class Products:
     def delete_ep(self, req, resp, ep):
         nep = obj(req, netrino_product_entrypoint, sql_id=ep)
         nep.commit()
+        catalog().invalidate(nep['product_id'])
 
         return nep
 
@@ -312,6 +536,6 @@ class Products:
                 netrino.product.tasks entry point.
                 """
         eps = []
-        for e in EntryPoints('netrino.product.tasks'):
+        for e in plugins('netrino.product.tasks'):
             eps.append({'id': e, 'name': e})
         return raw_list(req, eps)
@@ -38,6 +38,8 @@ from luxon.utils import sql
 from luxon.utils.uri import decode
 
 from netrino.models.tasks import netrino_task
+from netrino.helpers.dialect import insert, update
+from netrino.helpers.events import emit
 
 OPERATORS_RE = '=|>=|<=|<|>|\*='
 
@@ -102,7 +104,7 @@ class Tasks:
                    tag='internal')
         router.add(['PUT', 'PATCH'], '/v1/task/{task_id}', self.update,
                    tag='internal')
-        router.add('DELETE', '/v1/task', self.delete,
+        router.add('DELETE', '/v1/task/{task_id}', self.delete,
                    tag='internal')
 
     def list(self, req, resp):
@@ -121,13 +123,19 @@ class Tasks:
 
     def create(self, req, resp):
         task = obj(req, netrino_task)
-        task.commit()
+        with db() as conn:
+            insert(conn, 'netrino_task', task.dict)
+            emit(conn, 'task.created', task['id'], task.dict)
+            conn.commit()
 
         return task
 
     def update(self, req, resp, task_id):
         task = obj(req, netrino_task, sql_id=task_id)
-        task.commit()
+        with db() as conn:
+            update(conn, 'netrino_task', task.dict, task_id)
+            emit(conn, 'task.updated', task_id, task.dict)
+            conn.commit()
 
         return task
 
@@ -136,5 +144,8 @@ class Tasks:
 
     def delete(self, req, resp, task_id):
         task = obj(req, netrino_task, sql_id=task_id)
-        task.delete()
-        task.commit()
+        with db() as conn:
+            conn.execute('DELETE FROM netrino_task WHERE id=?', task_id)
+            emit(conn, 'task.deleted', task_id, {'id': task_id,
+                                                 'name': task['name']})
+            conn.commit()
@@ -183,6 +183,9 @@ setup_dict = dict(
     zip_safe=False,  # don't use eggs
     python_requires='>=3.6',
     entry_points={
+        'console_scripts': [
+            'netrino = netrino.main:entry'
+        ],
         'tachyonic.element.classifications': [
             'ont = netrino.elements.fttx.ont:ONT'
         ],
@@ -0,0 +1,149 @@
+from luxon.core.app import App
+from luxon import db
+from luxon import js
+
+from netrino.models.products import netrino_product
+from netrino.models.products import netrino_product_closure
+from netrino.models.products import netrino_custom_attr
+from netrino.models.products import netrino_categories
+from netrino.models.products import netrino_category
+from netrino.models.products import netrino_attr_facet
+from netrino.models.products import netrino_product_entrypoint
+from netrino.models.products import netrino_payment_gateway
+from netrino.models.products import netrino_product_changes
+from netrino.helpers import bulk
+from netrino.helpers.search import search
+
+import pytest
+
+app = App(name="Test", ini='/dev/null')
+app.config['database'] = {}
+app.config['database']['type'] = 'sqlite3'
+
+for model in (netrino_product, netrino_product_closure, netrino_custom_attr,
+              netrino_categories, netrino_category, netrino_attr_facet,
+              netrino_product_entrypoint, netrino_payment_gateway,
+              netrino_product_changes):
+    model().create_table()
+
+RECORDS = [
+    {'id': 'bulk-fibre', 'name': 'Fibre', 'price': '500.00',
+     'monthly': True, 'categories': ['bulk-internet'],
+     'custom_attributes': [{'name': 'bulk-speed', 'value': '100'}],
+     'payment_gateways': [{'name': 'paypal', 'description': 'PayPal'}]},
+    {'id': 'bulk-router', 'name': 'Router', 'parent_id': 'bulk-fibre',
+     'price': 80, 'categories': ['bulk-internet', 'bulk-hardware']},
+    {'id': 'bulk-bad', 'price': 10},
+    {'id': 'bulk-fibre', 'name': 'Duplicate'},
+    {'id': 'bulk-task', 'name': 'Task',
+     'services': [{'entrypoint': 'bulk-unknown'}]},
+]
+
+
+def clear():
+    with db() as conn:
+        for table, column in (('netrino_product_closure', 'descendant_id'),
+                              ('netrino_categories', 'product_id'),
+                              ('netrino_custom_attr', 'product_id'),
+                              ('netrino_payment_gateway', 'product_id'),
+                              ('netrino_product_entrypoint', 'product_id')):
+            conn.execute("DELETE FROM %s WHERE %s LIKE 'bulk-%%'"
+                         % (table, column))
+        conn.execute("DELETE FROM netrino_product WHERE parent_id"
+                     " LIKE 'bulk-%'")
+        conn.execute("DELETE FROM netrino_product WHERE id LIKE 'bulk-%'")
+        conn.execute("DELETE FROM netrino_category WHERE name"
+                     " LIKE 'bulk-%'")
+        conn.execute("DELETE FROM netrino_attr_facet WHERE name"
+                     " LIKE 'bulk-%'")
+        conn.commit()
+
+
+@pytest.fixture(autouse=True)
+def cleanup():
+    clear()
+    yield
+    clear()
+
+
+def exported(fmt):
+    # Products of other test modules share the database.
+    records = list(bulk.parse(bulk.export(fmt), fmt))
+    return [r for r in records if r['id'].startswith('bulk-')]
+
+
+def test_import_reports_row_errors():
+    result = bulk.Import(batch=10).run(RECORDS)
+    assert result['imported'] == 2
+    assert [(e['row'], e['id']) for e in result['errors']] == [
+        (3, 'bulk-bad'), (5, 'bulk-task'), (4, 'bulk-fibre')]
+
+    with db() as conn:
+        counts = conn.execute("SELECT name,products FROM netrino_category"
+                              " WHERE name LIKE 'bulk-%' ORDER BY name"
+                              ).fetchall()
+        closure = conn.execute('SELECT depth FROM netrino_product_closure'
+                               " WHERE ancestor_id='bulk-fibre'"
+                               " AND descendant_id='bulk-router'"
+                               ).fetchone()
+    assert [(c['name'], c['products']) for c in counts] == [
+        ('bulk-hardware', 1), ('bulk-internet', 2)]
+    assert closure['depth'] == 1
+
+
+def test_import_children_first():
+    result = bulk.Import(batch=1).run(reversed(RECORDS[:2]))
+    assert result['imported'] == 2
+    assert [r['id'] for r in exported('ndjson')] == ['bulk-fibre',
+                                                     'bulk-router']
+
+
+def test_import_reindexes_batches():
+    search().build(wait=True)
+    bulk.Import(batch=1).run(RECORDS[:2])
+    assert [r['id'] for r in search().search('router', 10)
+            if r['id'].startswith('bulk-')] == ['bulk-router']
+
+
+@pytest.mark.parametrize('fmt', bulk.FORMATS)
+def test_export_round_trip(fmt):
+    bulk.Import().run(RECORDS[:2])
+    records = exported(fmt)
+    assert [r['id'] for r in records] == ['bulk-fibre', 'bulk-router']
+    fibre = records[0]
+    if fmt == 'csv':
+        assert js.loads(fibre['categories']) == ['bulk-internet']
+    else:
+        assert fibre['categories'] == ['bulk-internet']
+        assert fibre['payment_gateways'] == [{'name': 'paypal',
+                                              'description': 'PayPal'}]
+
+    clear()
+    result = bulk.Import().run(records)
+    assert result['errors'] == []
+    assert [r['id'] for r in exported(fmt)] == ['bulk-fibre', 'bulk-router']
+
+
+def test_export_without_closure():
+    bulk.Import().run(RECORDS[:2])
+    with db() as conn:
+        conn.execute("DELETE FROM netrino_product_closure"
+                     " WHERE descendant_id LIKE 'bulk-%'")
+        conn.commit()
+    assert [r['id'] for r in exported('ndjson')] == ['bulk-fibre',
+                                                     'bulk-router']
+
+
+def test_import_reports_database_errors(monkeypatch):
+    count_category = bulk.facets.count_category
+
+    def failing(conn, name, products=1, domain=None):
+        if name == 'bulk-hardware':
+            raise RuntimeError('Lost connection')
+        count_category(conn, name, products, domain)
+
+    monkeypatch.setattr(bulk.facets, 'count_category', failing)
+    result = bulk.Import().run(RECORDS[:2])
+    assert result['imported'] == 1
+    assert [(e['row'], e['id'], e['error']) for e in result['errors']] == [
+        (2, 'bulk-router', 'Lost connection')]
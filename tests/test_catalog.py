@@ -0,0 +1,33 @@
+from luxon.core.app import App
+
+from netrino.models.products import netrino_product_changes
+from netrino.helpers.catalog import Catalog
+
+app = App(name="Test", ini='/dev/null')
+app.config['database'] = {}
+app.config['database']['type'] = 'sqlite3'
+
+netrino_product_changes().create_table()
+
+
+def worker():
+    cache = Catalog()
+    # Check the generation on every read.
+    cache._generation_ttl = -1
+    return cache
+
+
+def test_invalidated_by_other_worker():
+    first = worker()
+    second = worker()
+    assert first.get('products:all', lambda: 'old') == 'old'
+    assert first.get('product:p1', lambda: 'old') == 'old'
+    second.invalidate('p1')
+    assert first.get('products:all', lambda: 'new') == 'new'
+    assert first.get('product:p1', lambda: 'new') == 'new'
+
+
+def test_cached_until_invalidated():
+    cache = worker()
+    assert cache.get('categories', lambda: 'old') == 'old'
+    assert cache.get('categories', lambda: 'new') == 'old'
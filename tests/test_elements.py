@@ -0,0 +1,77 @@
+from luxon.core.app import App
+from luxon import db
+
+from netrino.models.elements import netrino_element
+from netrino.models.elements import netrino_element_interface
+from netrino.helpers import plugins
+from netrino.helpers import elements
+
+import pytest
+
+app = App(name="Test", ini='/dev/null')
+app.config['database'] = {}
+app.config['database']['type'] = 'sqlite3'
+
+for model in (netrino_element, netrino_element_interface):
+    model().create_table()
+
+
+class Ont(object):
+    interfaces = ('ont', 'snmp',)
+
+
+class Olt(object):
+    interfaces = ('snmp',)
+
+
+class Tr069(object):
+    classifications = ('ont',)
+
+
+@pytest.fixture(autouse=True)
+def classifications(monkeypatch):
+    monkeypatch.setitem(plugins._registry, elements.CLASSIFICATIONS,
+                        {'ont': Ont, 'olt': Olt})
+    monkeypatch.setitem(plugins._registry, 'tachyonic_interfaces', {})
+    with db() as conn:
+        conn.execute('DELETE FROM netrino_element_interface')
+        conn.execute('DELETE FROM netrino_element')
+        for i, classification in enumerate(('olt', 'ont', 'ont', 'ont')):
+            eid = 'e%s' % i
+            conn.execute('INSERT INTO netrino_element'
+                         ' (id,name,classification) VALUES (?,?,?)',
+                         (eid, eid, classification,))
+            elements.index(conn, eid, classification)
+        conn.commit()
+
+
+def test_elements_with_interface():
+    assert elements.elements_with_interface('ont') == ['e1', 'e2', 'e3']
+    assert elements.elements_with_interface('snmp', 2) == ['e0', 'e1']
+    assert elements.elements_with_interface('snmp', 2, 'e1') == ['e2',
+                                                                 'e3']
+    assert elements.elements_with_interface('netconf') == []
+
+
+def test_interfaces_declared_by_interface(monkeypatch):
+    monkeypatch.setitem(plugins._registry, 'tachyonic_interfaces',
+                        {'tr069': Tr069})
+    assert elements.interfaces('ont') == ('ont', 'snmp', 'tr069',)
+    elements.rebuild()
+    assert elements.elements_with_interface('tr069') == ['e1', 'e2', 'e3']
+
+
+def test_reindex_on_change():
+    with db() as conn:
+        elements.index(conn, 'e1', 'olt')
+        elements.unindex(conn, 'e2')
+        conn.commit()
+    assert elements.elements_with_interface('ont') == ['e3']
+    assert elements.elements_with_interface('snmp') == ['e0', 'e1', 'e3']
+
+
+def test_rebuild(monkeypatch):
+    monkeypatch.setattr(Olt, 'interfaces', ('snmp', 'netconf',))
+    monkeypatch.setattr(elements, 'BATCH', 3)
+    assert elements.rebuild() == 8
+    assert elements.elements_with_interface('netconf') == ['e0']
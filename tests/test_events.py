@@ -0,0 +1,85 @@
+import pytest
+
+from luxon.core.app import App
+from luxon import db
+
+from netrino.helpers.events import emit, Publisher, Local
+from netrino.models.outbox import netrino_outbox
+
+app = App(name="Test", ini='/dev/null')
+app.config['database'] = {}
+app.config['database']['type'] = 'sqlite3'
+
+netrino_outbox().create_table()
+
+with db() as conn:
+    conn.execute('DELETE FROM netrino_outbox')
+
+
+def test_uncommitted_not_published():
+    broker = Local()
+    with db() as conn:
+        emit(conn, 'order.created', 'o1', {'id': 'o1'})
+    assert Publisher(broker, 10).drain() == 0
+    assert broker.events == []
+
+
+def test_drain_batches():
+    broker = Local()
+    with db() as conn:
+        for i in range(5):
+            emit(conn, 'order.updated', 'o%s' % i, {'id': 'o%s' % i})
+        conn.commit()
+    publisher = Publisher(broker, 2)
+    assert publisher.drain() == 2
+    publisher.run(once=True)
+    assert len(broker.events) == 5
+    assert broker.events[0]['payload'] == {'id': 'o0'}
+    assert publisher.drain() == 0
+
+
+class Failing(object):
+    def publish(self, events):
+        raise ConnectionError('broker down')
+
+
+def test_failed_publish_kept():
+    with db() as conn:
+        emit(conn, 'task.created', 't1', {'id': 't1'})
+        conn.commit()
+    with pytest.raises(ConnectionError):
+        Publisher(Failing(), 10).drain()
+    with db() as conn:
+        row = conn.execute('SELECT attempts FROM netrino_outbox').fetchone()
+    assert row['attempts'] == 1
+    broker = Local()
+    assert Publisher(broker, 10).drain() == 1
+
+
+class Checking(object):
+    def __init__(self):
+        self.events = []
+
+    def publish(self, events):
+        # A second publisher neither blocks nor claims the batch in flight.
+        assert Publisher(Local(), 10).drain() == 0
+        self.events.extend(events)
+
+
+def test_publish_outside_transaction():
+    with db() as conn:
+        emit(conn, 'task.updated', 't2', {'id': 't2'})
+        conn.commit()
+    broker = Checking()
+    assert Publisher(broker, 10).drain() == 1
+    assert len(broker.events) == 1
+
+
+def test_expired_claim_retried():
+    with db() as conn:
+        emit(conn, 'order.deleted', 'o9', {'id': 'o9'})
+        conn.commit()
+    Publisher(Local(), 10, lease=-1)._claim()
+    broker = Local()
+    assert Publisher(broker, 10).drain() == 1
+    assert broker.events[0]['object_id'] == 'o9'
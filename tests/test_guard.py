@@ -0,0 +1,155 @@
+import time
+from threading import Thread, Event
+
+from luxon.core.app import App
+from luxon.exceptions import ValidationError, NotFoundError
+
+from netrino.helpers import plugins
+from netrino.helpers.guard import Guard, Breaker, CircuitOpen, Busy
+
+import pytest
+
+app = App(name="Test", ini='/dev/null')
+
+
+@pytest.fixture(autouse=True)
+def interfaces(monkeypatch):
+    monkeypatch.setitem(plugins._registry, 'tachyonic_interfaces',
+                        {'olt': object})
+
+
+def fail(guard, error=IOError):
+    with pytest.raises(error):
+        with guard.enter('olt', 'e1'):
+            raise error('timeout')
+
+
+def test_breaker_opens_and_probes():
+    guard = Guard(failures=2, reset=0.05)
+    fail(guard)
+    fail(guard)
+    with pytest.raises(CircuitOpen):
+        with guard.enter('olt', 'e1'):
+            pass
+    with guard.enter('olt', 'e2'):
+        pass
+    assert guard.metrics()['circuits'] == [{'interface': 'olt',
+                                            'element_id': 'e1',
+                                            'state': 'open',
+                                            'failures': 2}]
+
+    time.sleep(0.06)
+    fail(guard)
+    with pytest.raises(CircuitOpen):
+        with guard.enter('olt', 'e1'):
+            pass
+
+    time.sleep(0.06)
+    with guard.enter('olt', 'e1'):
+        pass
+    assert guard.metrics()['circuits'] == []
+    assert guard.metrics()['rejected'] == 2
+
+
+def test_ignored_errors():
+    guard = Guard(failures=1)
+    fail(guard, ValidationError)
+    with guard.enter('olt', 'e1'):
+        pass
+
+
+def test_half_open_single_probe():
+    breaker = Breaker(failures=1, reset=0)
+    breaker.failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.cancel()
+    assert breaker.allow()
+
+
+def test_element_limit():
+    guard = Guard(element_limit=1, timeout=0.05)
+    entered = Event()
+    release = Event()
+
+    def hold():
+        with guard.enter('olt', 'e1'):
+            entered.set()
+            release.wait()
+
+    thread = Thread(target=hold)
+    thread.start()
+    entered.wait()
+    with pytest.raises(Busy):
+        with guard.enter('olt', 'e1'):
+            pass
+    with guard.enter('olt', 'e2'):
+        pass
+    release.set()
+    thread.join()
+
+    metrics = guard.metrics()
+    assert metrics['busy'] == 1
+    assert metrics['calls'] == 2
+    assert metrics['circuits'] == []
+
+
+def test_timed_out_success_ignored():
+    guard = Guard(failures=1, reset=60)
+    with guard.enter('olt', 'e1'):
+        # Reported as timed out while the call runs.
+        guard.breaker('olt', 'e1').failure()
+    assert guard.breaker('olt', 'e1').state == 'open'
+
+
+def test_idle_elements_evicted():
+    guard = Guard(failures=1, idle=0.05)
+    with guard.enter('olt', 'e1'):
+        pass
+    with pytest.raises(IOError):
+        with guard.enter('olt', 'e2'):
+            raise IOError('timeout')
+    with guard.enter('olt', 'e3'):
+        time.sleep(0.06)
+        guard.evict()
+    assert set(guard._breakers) == {('olt', 'e2',), ('olt', 'e3',)}
+    assert set(guard._semaphores) == {('olt',), ('olt', 'e2',),
+                                      ('olt', 'e3',)}
+
+
+def test_unknown_interface():
+    guard = Guard()
+    with pytest.raises(NotFoundError):
+        with guard.enter('unknown', 'e1'):
+            pass
+    assert guard._semaphores == {}
+
+
+def test_queued_element_holds_no_interface_slot():
+    guard = Guard(element_limit=1, interface_limit=2, timeout=0.5)
+    entered = Event()
+    release = Event()
+
+    def hold():
+        with guard.enter('olt', 'e1'):
+            entered.set()
+            release.wait()
+
+    def queue():
+        with guard.enter('olt', 'e1'):
+            pass
+
+    threads = [Thread(target=hold), Thread(target=queue)]
+    threads[0].start()
+    entered.wait()
+    threads[1].start()
+    time.sleep(0.05)
+    start = time.monotonic()
+    try:
+        with guard.enter('olt', 'e2'):
+            pass
+    finally:
+        release.set()
+        for thread in threads:
+            thread.join()
+    assert time.monotonic() - start < 0.25
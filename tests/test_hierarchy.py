@@ -0,0 +1,104 @@
+from luxon.core.app import App
+from luxon import db
+from luxon.exceptions import ValidationError
+
+from netrino.models.products import netrino_product
+from netrino.models.products import netrino_product_closure
+from netrino.helpers import hierarchy
+
+import pytest
+
+app = App(name="Test", ini='/dev/null')
+app.config['database'] = {}
+app.config['database']['type'] = 'sqlite3'
+
+for model in (netrino_product, netrino_product_closure):
+    model().create_table()
+
+
+TREE = (('bundle', None, 100, 1),
+        ('router', 'bundle', 50, 0),
+        ('antenna', 'router', 25, 0),
+        ('voip', 'bundle', 10, 1))
+
+
+def clear(conn):
+    for pid in reversed([product[0] for product in TREE]):
+        conn.execute('DELETE FROM netrino_product_closure'
+                     ' WHERE descendant_id=?', pid)
+        conn.execute('DELETE FROM netrino_product WHERE id=?', pid)
+
+
+@pytest.fixture(autouse=True)
+def tree():
+    # bundle -> (router -> antenna, voip)
+    with db() as conn:
+        clear(conn)
+        for pid, parent_id, price, monthly in TREE:
+            conn.execute('INSERT INTO netrino_product'
+                         ' (id,name,parent_id,price,monthly)'
+                         ' VALUES (?,?,?,?,?)',
+                         (pid, pid, parent_id, price, monthly,))
+            hierarchy.add(conn, pid, parent_id)
+        conn.commit()
+    yield
+    with db() as conn:
+        clear(conn)
+        conn.commit()
+
+
+def ids(relation, pid):
+    return [p['id'] for p in hierarchy.expand(pid, relation)]
+
+
+def test_expand():
+    assert ids('children', 'bundle') == ['router', 'voip']
+    assert ids('descendants', 'bundle') == ['router', 'voip', 'antenna']
+    assert ids('ancestors', 'antenna') == ['router', 'bundle']
+    assert ids('ancestors', 'bundle') == []
+    with pytest.raises(ValidationError):
+        hierarchy.expand('bundle', 'siblings')
+
+
+def test_bundle():
+    assert hierarchy.bundle('bundle') == {'price': 185,
+                                          'monthly': 110,
+                                          'products': 4}
+    assert hierarchy.bundle('router')['price'] == 75
+
+
+def test_move():
+    with db() as conn:
+        conn.execute("UPDATE netrino_product SET parent_id='voip'"
+                     " WHERE id='router'")
+        hierarchy.move(conn, 'router', 'voip')
+        conn.commit()
+    assert ids('ancestors', 'antenna') == ['router', 'voip', 'bundle']
+    assert ids('children', 'bundle') == ['voip']
+
+    with db() as conn:
+        hierarchy.move(conn, 'router', None)
+        conn.commit()
+    assert ids('ancestors', 'antenna') == ['router']
+    assert hierarchy.bundle('bundle')['products'] == 2
+
+
+def test_move_into_subtree():
+    with db() as conn:
+        with pytest.raises(ValidationError):
+            hierarchy.move(conn, 'router', 'antenna')
+
+
+def test_remove():
+    with db() as conn:
+        hierarchy.remove(conn, 'voip')
+        conn.execute("DELETE FROM netrino_product WHERE id='voip'")
+        conn.commit()
+    assert ids('descendants', 'bundle') == ['router', 'antenna']
+
+
+def test_rebuild():
+    before = sorted(ids('descendants', 'bundle'))
+    assert hierarchy.rebuild() >= 8
+    assert sorted(ids('descendants', 'bundle')) == before
+    assert ids('ancestors', 'antenna') == ['router', 'bundle']
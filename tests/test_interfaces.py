@@ -0,0 +1,141 @@
+import time
+from threading import Thread
+
+from luxon.core.app import App
+from luxon.exceptions import NotFoundError
+
+from netrino.helpers import plugins
+from netrino.helpers import sessions
+from netrino.helpers import interfaces
+from netrino.helpers import guard
+from netrino.helpers.interfaces import call, fan_out
+
+import pytest
+
+app = App(name="Test", ini='/dev/null')
+
+
+class Ont(object):
+    """Interface answering after the number of seconds in its id."""
+    cache = {'levels': 60}
+    reads = []
+
+    def __init__(self, id):
+        self.id = id
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def status(self, req):
+        if self.id == 'broken':
+            raise ValueError('Link down')
+        time.sleep(float(self.id))
+        return {'online': True}
+
+    def levels(self, req):
+        self.reads.append(self.id)
+        time.sleep(float(self.id))
+        return {'rx': -21.5}
+
+
+class Request(object):
+    def __init__(self, method='GET', query_string=''):
+        self.method = method
+        self.query_string = query_string
+
+
+@pytest.fixture(autouse=True)
+def ont(monkeypatch):
+    monkeypatch.setitem(plugins._registry, 'tachyonic_interfaces',
+                        {'ont': Ont})
+    monkeypatch.setattr(sessions, '_pool', sessions.Pool())
+    monkeypatch.setattr(interfaces, '_results', interfaces.Results())
+    monkeypatch.setattr(guard, '_guard', guard.Guard())
+    Ont.reads = []
+
+
+def test_call():
+    assert call('ont', '0', 'status') == {'online': True}
+
+
+def test_fan_out_as_completed():
+    start = time.monotonic()
+    results = list(fan_out('ont', ['0.2', '0', 'broken', '0.1'], 'status',
+                           workers=4, timeout=5))
+    assert time.monotonic() - start < 0.4
+    assert [r['id'] for r in results][-2:] == ['0.1', '0.2']
+    assert {'id': 'broken', 'error': 'Link down'} in results
+
+
+def test_fan_out_timeout():
+    results = list(fan_out('ont', ['0', '1'], 'status', workers=2,
+                           timeout=0.1))
+    assert results == [{'id': '0', 'result': {'online': True}},
+                       {'id': '1', 'error': 'Timed out after 0.1 seconds'}]
+
+
+def test_cached_call():
+    for i in range(3):
+        assert call('ont', '0', 'levels', req=Request()) == {'rx': -21.5}
+    call('ont', '0', 'levels', req=Request(query_string='port=2'))
+    call('ont', '0', 'levels', req=Request('POST'))
+    call('ont', '0', 'status', req=Request())
+    assert Ont.reads == ['0', '0', '0']
+
+
+def test_cached_call_coalesced():
+    threads = [Thread(target=call, args=('ont', '0.1', 'levels'))
+               for i in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert Ont.reads == ['0.1']
+
+
+def test_streamed_call_holds_session(monkeypatch):
+    def rows(req):
+        for port in range(3):
+            yield {'port': port}
+
+    monkeypatch.setattr(Ont, 'rows', lambda self, req: rows(req),
+                        raising=False)
+    result = call('ont', '0', 'rows')
+    assert interfaces.streaming(result)
+    assert sessions.pool().stats()[0]['idle'] == 0
+    assert next(result) == {'port': 0}
+    assert list(result) == [{'port': 1}, {'port': 2}]
+    assert sessions.pool().stats()[0]['idle'] == 1
+
+    result = call('ont', '0', 'rows')
+    next(result)
+    result.close()
+    assert sessions.pool().stats()[0]['idle'] == 1
+    assert guard.guard().metrics()['circuits'] == []
+
+
+def test_streamed_call_failure(monkeypatch):
+    def rows(req):
+        yield {'port': 0}
+        raise IOError('Connection lost')
+
+    monkeypatch.setattr(Ont, 'rows', lambda self, req: rows(req),
+                        raising=False)
+    result = call('ont', '0', 'rows')
+    with pytest.raises(IOError):
+        list(result)
+    assert sessions.pool().stats() == []
+    assert guard.guard().breaker('ont', '0').failures == 1
+
+
+def test_unknown_method_not_failure():
+    for i in range(6):
+        with pytest.raises(NotFoundError):
+            call('ont', '0', 'missing')
+        with pytest.raises(NotFoundError):
+            call('ont', '0', 'status', 'missing')
+    assert guard.guard().breaker('ont', '0').state == 'closed'
+    assert call('ont', '0', 'status') == {'online': True}
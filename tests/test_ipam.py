@@ -3,6 +3,8 @@ from luxon import db
 from luxon.exceptions import NotFoundError, ValidationError
 
 from netrino.helpers.ipam import IPAM
+from netrino.helpers import ipam as helper
+from netrino.helpers import utilization
 from netrino.models.ipam import netrino_prefix
 from netrino.models.ipam import netrino_prefix_tag
 
@@ -243,6 +245,149 @@ def test_add_delete_prefix():
     assert len(rows) == 0
 
 
+def test_find_smallest_fitting_block():
+    pool = ipam.add_prefix('buddy', '100.64.0.0/24')
+    ipam.add_tag(pool['id'], 'buddy_pool')
+    ipam.allocate_prefix('used', '100.64.0.64/26')
+    ipam.allocate_prefix('used', '100.64.0.128/27')
+    # Free are 0/26, 160/27 and 192/26, the /27 fits best.
+    assert ipam.find(27, 'buddy_pool', 'best') == '100.64.0.160/27'
+    assert ipam.find(26, 'buddy_pool', 'next') == '100.64.0.0/26'
+
+
+def test_release_coalesces_buddies():
+    for prefix in ('100.64.0.64/26', '100.64.0.128/27', '100.64.0.160/27',
+                   '100.64.0.0/26'):
+        ipam.release_prefix(prefix)
+    with db() as conn:
+        sql = "SELECT * FROM netrino_prefix WHERE a4>=? AND a4<=?"
+        rows = conn.execute(sql, (1681915904, 1681916159)).fetchall()
+    assert len(rows) == 1
+    assert rows[0]['type'] == 'container'
+    ipam.delete_prefix('100.64.0.0/24')
+
+
+def test_find_many():
+    pool = ipam.add_prefix('bulk', '100.64.1.0/24')
+    ipam.add_tag(pool['id'], 'bulk_pool')
+    requests = [(32, 'bulk_pool', 'lo%s' % i) for i in range(4)]
+    requests.insert(2, (30, 'bulk_pool', 'p2p'))
+    result = ipam.find_many(requests)
+    # The /30 is allocated first, at the start of the pool.
+    assert result == ['100.64.1.4/32', '100.64.1.5/32', '100.64.1.0/30',
+                      '100.64.1.6/32', '100.64.1.7/32']
+
+
+def test_find_many_all_or_none():
+    with db() as conn:
+        sql = "SELECT count(id) AS n FROM netrino_prefix " \
+              "WHERE a4>=? AND a4<=?"
+        before = conn.execute(sql, (1681916160, 1681916415)).fetchone()['n']
+    with pytest.raises(NotFoundError):
+        ipam.find_many([(25, 'bulk_pool', 'fits'),
+                        (25, 'bulk_pool', 'does not fit')])
+    with db() as conn:
+        after = conn.execute(sql, (1681916160, 1681916415)).fetchone()['n']
+    assert before == after
+    assert ipam.find(25, 'bulk_pool', 'fits') == '100.64.1.128/25'
+
+
+def test_utilization():
+    pool = ipam.add_prefix('report-v4', '100.64.2.0/24')
+    ipam.add_tag(pool['id'], 'report_pool')
+    ipam.allocate_prefix('used', '100.64.2.64/26')
+    pool = ipam.add_prefix('report-v6', '2001:db8::/32')
+    ipam.add_tag(pool['id'], 'report_pool')
+    ipam.allocate_prefix('used', '2001:db8::/48')
+    pool = ipam.add_prefix('report-empty', '100.64.3.0/24')
+    ipam.add_tag(pool['id'], 'report_pool')
+
+    report = {pool['prefix']: pool
+              for pool in utilization.utilization('report_pool')}
+    v4 = report['100.64.2.0/24']
+    assert (v4['size'], v4['allocated'], v4['free'],) == (256, 64, 192,)
+    assert v4['free_ranges'] == 2
+    assert v4['largest_free'] == 128
+    assert v4['utilization'] == 0.25
+    assert round(v4['fragmentation'], 4) == round(1 / 3, 4)
+    v6 = report['2001:db8::/32']
+    assert v6['allocated'] == 1 << 80
+    assert v6['free'] == (1 << 96) - (1 << 80)
+    assert v6['largest_free'] == v6['free']
+    assert v6['fragmentation'] == 0
+    empty = report['100.64.3.0/24']
+    assert (empty['allocated'], empty['free'],) == (0, 256,)
+    assert empty['free_ranges'] == 1
+
+
+def test_utilization_numpy():
+    numpy = pytest.importorskip('numpy')
+    with db() as conn:
+        pools = utilization._pools(conn, 'report_pool')
+        blocks = utilization._blocks(conn, pools)
+    assert (utilization._usage_numpy(numpy, len(pools), blocks) ==
+            utilization._usage_python(len(pools), blocks))
+
+
+def test_usage():
+    pool = ipam.add_prefix('usage', '100.64.4.0/22')
+    ipam.add_tag(pool['id'], 'usage_pool')
+    ipam.allocate_prefix('used', '100.64.5.0/24')
+    ipam.allocate_prefix('used', '100.64.6.64/26')
+    usage = ipam.usage('100.64.4.0/22', 24)
+    assert (usage['size'], usage['allocated'], usage['free'],) == (1024,
+                                                                   320,
+                                                                   704,)
+    assert usage['allocations'] == 2
+    assert [prefix['allocated'] for prefix in usage['prefixes']] == [0,
+                                                                     256,
+                                                                     64,
+                                                                     0]
+    assert ipam.usage('100.64.5.128/25')['allocated'] == 128
+    assert ipam.usage('100.64.6.0/26')['free'] == 64
+    assert ipam.usage('100.64.0.0/16')['allocated'] >= 320
+
+    ipam.release_prefix('100.64.5.0/24')
+    usage = ipam.usage('100.64.4.0/22')
+    assert (usage['allocated'], usage['allocations'],) == (64, 1,)
+    with pytest.raises(ValidationError):
+        ipam.usage('100.64.4.0/22', 20)
+    with pytest.raises(ValidationError):
+        ipam.usage('100.64.0.0/16', 32)
+
+
+def test_usage_reloads_tree(monkeypatch):
+    # Another process, with a trie of its own.
+    other = IPAM()
+    other._trie = helper.Trie()
+    other.allocate_prefix('used', '100.64.6.128/26')
+
+    def load():
+        raise AssertionError('Full load')
+
+    monkeypatch.setattr(ipam, 'refresh', 0)
+    monkeypatch.setattr(ipam._trie, 'load', load)
+    assert ipam.usage('100.64.4.0/22')['allocated'] == 128
+    other.release_prefix('100.64.6.128/26')
+    assert ipam.usage('100.64.4.0/22')['allocated'] == 64
+
+
+def test_failed_resync_reloads(monkeypatch):
+    def fail(*args):
+        raise RuntimeError('Database unavailable')
+
+    monkeypatch.setattr(helper._Changes, 'flush', fail)
+    monkeypatch.setattr(ipam._trie, 'resync', fail)
+    with pytest.raises(RuntimeError):
+        ipam.add_prefix('resync', '100.65.0.0/24')
+    assert not ipam._trie.loaded
+
+    monkeypatch.undo()
+    prefix = ipam.add_prefix('resync', '100.65.0.0/24')
+    assert ipam._trie.loaded
+    ipam.delete_prefix(prefix['prefix'])
+
+
 import time
 
 def test_speed():
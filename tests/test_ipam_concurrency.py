@@ -0,0 +1,54 @@
+from multiprocessing import get_context
+
+from luxon.core.app import App
+from luxon import db
+
+from netrino.helpers.ipam import IPAM, trie
+from netrino.models.ipam import netrino_prefix
+from netrino.models.ipam import netrino_prefix_tag
+
+app = App(name="Test", ini='/dev/null')
+app.config['database'] = {}
+app.config['database']['type'] = 'sqlite3'
+
+netrino_prefix().create_table()
+netrino_prefix_tag().create_table()
+
+# 100.65.0.0/22, allocated from by worker processes each with a trie.
+POOL = '100.65.0.0/22'
+FIRST = 1681981440
+LAST = 1681982463
+WORKERS = 4
+PER_WORKER = 100
+
+
+def allocate(count):
+    ipam = IPAM()
+    return [ipam.find(32, 'stress_pool', 'stress') for i in range(count)]
+
+
+def test_concurrent_find_across_processes():
+    ipam = IPAM()
+    pool = ipam.add_prefix('stress', POOL)
+    ipam.add_tag(pool['id'], 'stress_pool')
+    try:
+        with get_context('spawn').Pool(WORKERS) as workers:
+            results = workers.map(allocate, [PER_WORKER] * WORKERS)
+        allocated = [prefix for result in results for prefix in result]
+        assert len(allocated) == WORKERS * PER_WORKER
+        assert len(set(allocated)) == len(allocated)
+        with db() as conn:
+            rows = conn.execute("SELECT a4 FROM netrino_prefix"
+                                " WHERE a4>=? AND a4<=? AND prefix_len=32"
+                                " AND type='allocated'",
+                                (FIRST, LAST,)).fetchall()
+        assert len(rows) == len(allocated)
+        assert len(set(row['a4'] for row in rows)) == len(rows)
+    finally:
+        with db() as conn:
+            conn.execute('DELETE FROM netrino_prefix_tag WHERE prefix_id=?',
+                         pool['id'])
+            conn.execute('DELETE FROM netrino_prefix'
+                         ' WHERE a4>=? AND a4<=?', (FIRST, LAST,))
+            conn.commit()
+        trie().load()
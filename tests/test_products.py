@@ -0,0 +1,146 @@
+from luxon.core.app import App
+from luxon import db
+from luxon.exceptions import NotFoundError
+
+from netrino.models.products import netrino_product
+from netrino.models.products import netrino_custom_attr
+from netrino.models.products import netrino_categories
+from netrino.models.products import netrino_product_entrypoint
+from netrino.models.products import netrino_payment_gateway
+from netrino.models.products import netrino_image
+from netrino.models.products import netrino_category
+from netrino.models.products import netrino_attr_facet
+from netrino.helpers import products
+from netrino.helpers import images
+from netrino.helpers import facets
+
+import pytest
+
+app = App(name="Test", ini='/dev/null')
+app.config['database'] = {}
+app.config['database']['type'] = 'sqlite3'
+
+for model in (netrino_product, netrino_custom_attr, netrino_categories,
+              netrino_product_entrypoint, netrino_payment_gateway,
+              netrino_image, netrino_category, netrino_attr_facet):
+    model().create_table()
+
+with db() as conn:
+    conn.execute('DELETE FROM netrino_categories')
+    conn.execute('DELETE FROM netrino_custom_attr')
+    conn.execute('DELETE FROM netrino_product_entrypoint')
+    conn.execute('DELETE FROM netrino_payment_gateway')
+    conn.execute('DELETE FROM netrino_product')
+    conn.execute('DELETE FROM netrino_image')
+    for i in range(5):
+        conn.execute('INSERT INTO netrino_product (id,name,image)'
+                     ' VALUES (?,?,?)', ('p%s' % i, 'product %s' % i,
+                                         b'image'))
+        conn.execute('INSERT INTO netrino_categories (id,name,product_id)'
+                     ' VALUES (?,?,?)', ('c%s' % i, 'fibre', 'p%s' % i))
+    conn.execute('INSERT INTO netrino_custom_attr'
+                 ' (id,name,value,visible,product_id)'
+                 " VALUES ('a1','speed','100',1,'p1')")
+    conn.execute('INSERT INTO netrino_payment_gateway'
+                 ' (id,product_id,name)'
+                 " VALUES ('g1','p1','paypal')")
+    conn.commit()
+
+
+def test_load_product():
+    product = products.load_product('p1')
+    assert 'image' not in product
+    assert product['name'] == 'product 1'
+    assert [c['id'] for c in product['categories']] == ['c1']
+    assert product['custom_attributes'][0]['value'] == '100'
+    assert product['payment_gateways'][0]['name'] == 'paypal'
+    assert product['services'] == []
+
+
+def test_load_product_not_found():
+    with pytest.raises(NotFoundError):
+        products.load_product('unknown')
+
+
+def test_load_products_batched(monkeypatch):
+    monkeypatch.setattr(products, 'BATCH', 2)
+    result = products.load_products(['p4', 'p0', 'unknown', 'p2', 'p0'])
+    assert [p['id'] for p in result] == ['p4', 'p0', 'p2']
+    assert [p['categories'][0]['id'] for p in result] == ['c4', 'c0', 'c2']
+
+
+def test_product_image_deduplicated():
+    first = images.save_product_image('p1', b'not an image', 'image/png')
+    second = images.save_product_image('p2', b'not an image', 'image/png')
+    assert first == second
+    with db() as conn:
+        count = conn.execute('SELECT count(id) AS n FROM netrino_image'
+                             ).fetchone()
+        product = conn.execute('SELECT image,image_id FROM netrino_product'
+                               " WHERE id='p2'").fetchone()
+    assert count['n'] == 1
+    assert product['image'] is None
+    assert product['image_id'] == first['image_id']
+    image = images.load(first['image_id'])
+    assert image['data'] == b'not an image'
+
+
+def test_product_thumbnail():
+    from io import BytesIO
+    from PIL import Image
+    data = BytesIO()
+    Image.new('RGB', (1024, 512)).save(data, 'png')
+    saved = images.save_product_image('p3', data.getvalue(), 'image/png')
+    assert saved['thumbnail_id'] != saved['image_id']
+    thumb = images.load(saved['thumbnail_id'])
+    assert thumb['content_type'] == 'image/jpeg'
+    assert Image.open(BytesIO(thumb['data'])).size == (256, 128)
+
+
+def test_load_products_projection():
+    product = products.load_products(['p1'], ('name',),
+                                     ('categories',))[0]
+    assert set(product) == {'id', 'name', 'categories'}
+    assert [c['id'] for c in product['categories']] == ['c1']
+    assert products.load_products(['p1'], ('id',), ())[0] == {'id': 'p1'}
+
+
+def test_facets_filtered():
+    counted = facets.facets(search={'name': 'product 1'})
+    assert [dict(c) for c in counted['categories']] == [
+        {'name': 'fibre', 'products': 1}]
+    assert [dict(a) for a in counted['attributes']] == [
+        {'name': 'speed', 'value': '100', 'products': 1}]
+    counted = facets.facets(category='fibre', domain='example.com')
+    assert counted['categories'][0]['products'] == 5
+    assert facets.facets(category='dsl')['categories'] == []
+
+
+def test_facets_counted_per_domain():
+    with db() as conn:
+        conn.execute('INSERT INTO netrino_product (id,name,domain)'
+                     " VALUES ('f1','Voice','a.example.com')")
+        conn.execute('INSERT INTO netrino_categories (id,name,product_id)'
+                     " VALUES ('fc1','voice','f1')")
+        conn.execute('INSERT INTO netrino_custom_attr'
+                     ' (id,name,value,visible,product_id)'
+                     " VALUES ('fa1','lines','2',1,'f1')")
+        facets.count_product(conn, 'f1', 1)
+        conn.commit()
+
+    def voice(domain):
+        return [dict(c) for c in facets.facets(domain=domain)['categories']
+                if c['name'] == 'voice']
+
+    assert voice('a.example.com') == [{'name': 'voice', 'products': 1}]
+    assert voice(None) == [{'name': 'voice', 'products': 1}]
+    assert voice('b.example.com') == []
+
+    with db() as conn:
+        facets.count_product(conn, 'f1', -1)
+        conn.execute("DELETE FROM netrino_categories WHERE product_id='f1'")
+        conn.execute("DELETE FROM netrino_custom_attr WHERE product_id='f1'")
+        conn.execute("DELETE FROM netrino_product WHERE id='f1'")
+        conn.commit()
+    assert voice(None) == []
+    assert 'lines' not in [a['name'] for a in facets.attributes()]
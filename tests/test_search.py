@@ -0,0 +1,105 @@
+from luxon.core.app import App
+from luxon import db
+
+from netrino.models.products import netrino_product
+from netrino.models.products import netrino_custom_attr
+from netrino.models.products import netrino_product_changes
+from netrino.utils.search import Index
+from netrino.helpers.search import Search
+
+app = App(name="Test", ini='/dev/null')
+app.config['database'] = {}
+app.config['database']['type'] = 'sqlite3'
+
+for model in (netrino_product, netrino_custom_attr, netrino_product_changes):
+    model().create_table()
+
+
+def build():
+    index = Index({'name': 3, 'description': 1})
+    index.add('1', {'name': 'Fibre 100Mb', 'description': 'Uncapped home'},
+              {'name': 'Fibre 100Mb'})
+    index.add('2', {'name': 'Fibre 20Mb', 'description': 'Capped home'},
+              {'name': 'Fibre 20Mb'})
+    index.add('3', {'name': 'LTE', 'description': 'Backup for fibre'},
+              {'name': 'LTE'})
+    return index
+
+
+def test_ranked_by_field_weight():
+    results = build().search('fibre')
+    assert [r['id'] for r in results][-1] == '3'
+    assert results[0]['score'] >= results[1]['score'] > results[2]['score']
+
+
+def test_all_tokens_required():
+    assert [r['id'] for r in build().search('fibre uncapped')] == ['1']
+
+
+def test_prefix():
+    assert [r['id'] for r in build().search('unc')] == ['1']
+    assert [r['id'] for r in build().search('fib cap')] == ['2']
+    assert {r['id'] for r in build().search('fib ho')} == {'1', '2'}
+
+
+def test_exact_ranks_above_prefix():
+    index = Index()
+    index.add('a', {'name': 'cap'})
+    index.add('b', {'name': 'capped'})
+    assert [r['id'] for r in index.search('cap')] == ['a', 'b']
+
+
+def test_update_and_remove():
+    index = build()
+    index.add('3', {'name': 'LTE', 'description': 'Backup'})
+    assert [r['id'] for r in index.search('backup')] == ['3']
+    assert '3' not in [r['id'] for r in index.search('fibre')]
+    index.remove('1')
+    assert index.search('uncapped') == []
+    assert len(index) == 2
+
+
+def test_paging():
+    index = Index()
+    for i in range(30):
+        index.add(str(i), {'name': 'product %s' % i})
+    assert len(index.search('product', limit=10, offset=25)) == 5
+
+
+def test_changes_of_other_workers():
+    worker, other = Search(), Search()
+    worker.build(wait=True)
+    other.build(wait=True)
+    with db() as conn:
+        conn.execute('INSERT INTO netrino_product (id,name)'
+                     " VALUES ('s1','Wireless')")
+        conn.commit()
+    other.refresh('s1')
+    assert [r['id'] for r in other.search('wireless')] == ['s1']
+    worker.search('wireless')
+    worker.build(wait=True)
+    assert [r['id'] for r in worker.search('wireless')] == ['s1']
+    with db() as conn:
+        conn.execute("DELETE FROM netrino_product WHERE id='s1'")
+        conn.commit()
+
+
+def test_scoped_to_domain():
+    with db() as conn:
+        conn.execute('INSERT INTO netrino_product (id,name,domain)'
+                     " VALUES ('s2','Wireless A','a.example.com')")
+        conn.execute('INSERT INTO netrino_product (id,name,domain)'
+                     " VALUES ('s3','Wireless B','b.example.com')")
+        conn.execute('INSERT INTO netrino_product (id,name)'
+                     " VALUES ('s4','Wireless')")
+        conn.commit()
+    index = Search()
+    index.build(wait=True)
+    assert {r['id'] for r in index.search('wireless')} == {'s2', 's3', 's4'}
+    # Limited after leaving out other domains.
+    assert {r['id'] for r in index.search('wireless', 2, 0,
+                                          'a.example.com')} == {'s2', 's4'}
+    with db() as conn:
+        conn.execute("DELETE FROM netrino_product WHERE id IN"
+                     " ('s2','s3','s4')")
+        conn.commit()
@@ -0,0 +1,133 @@
+import time
+
+from luxon.core.app import App
+from luxon.exceptions import NotFoundError
+
+from netrino.helpers import plugins
+from netrino.helpers.sessions import Pool, PoolExhausted
+
+import pytest
+
+app = App(name="Test", ini='/dev/null')
+
+
+class Device(object):
+    """Interface counting logins."""
+    logins = []
+    closed = []
+
+    def __init__(self, id):
+        self.id = id
+        self.healthy = True
+
+    def __enter__(self):
+        self.logins.append(self.id)
+        return self
+
+    def __exit__(self, *args):
+        self.closed.append(self.id)
+
+    def alive(self):
+        return self.healthy
+
+
+@pytest.fixture(autouse=True)
+def device(monkeypatch):
+    monkeypatch.setitem(plugins._registry, 'tachyonic_interfaces',
+                        {'device': Device})
+    Device.logins = []
+    Device.closed = []
+
+
+def test_session_reused():
+    pool = Pool()
+    for i in range(3):
+        with pool.session('device', 'e1') as session:
+            assert session.id == 'e1'
+    with pool.session('device', 'e2'):
+        pass
+    assert Device.logins == ['e1', 'e2']
+    assert pool.stats() == [
+        {'interface': 'device', 'element_id': 'e1', 'open': 1, 'idle': 1},
+        {'interface': 'device', 'element_id': 'e2', 'open': 1, 'idle': 1}]
+
+
+def test_unknown_interface():
+    with pytest.raises(NotFoundError):
+        with Pool().session('unknown', 'e1'):
+            pass
+
+
+def test_per_element_limit():
+    pool = Pool(per_element=1, timeout=0.05)
+    with pool.session('device', 'e1'):
+        with pytest.raises(PoolExhausted):
+            with pool.session('device', 'e1'):
+                pass
+        with pool.session('device', 'e2'):
+            pass
+
+
+def test_pool_size_closes_oldest_idle():
+    pool = Pool(size=1, timeout=0.05)
+    with pool.session('device', 'e1'):
+        pass
+    with pool.session('device', 'e2'):
+        pass
+    assert Device.closed == ['e1']
+    assert [s['element_id'] for s in pool.stats()] == ['e2']
+
+
+def test_error_discards_session():
+    pool = Pool()
+    with pytest.raises(ConnectionResetError):
+        with pool.session('device', 'e1'):
+            raise ConnectionResetError('connection reset')
+    assert Device.closed == ['e1']
+    assert pool.stats() == []
+
+
+def test_transport_error_discards_session():
+    class SSHException(Exception):
+        pass
+
+    pool = Pool()
+    with pytest.raises(SSHException):
+        with pool.session('device', 'e1'):
+            raise SSHException('Channel closed')
+    assert Device.closed == ['e1']
+    assert pool.stats() == []
+
+
+def test_declared_caller_error_keeps_session(monkeypatch):
+    monkeypatch.setattr(Device, 'caller_errors', (KeyError,),
+                        raising=False)
+    pool = Pool()
+    with pytest.raises(KeyError):
+        with pool.session('device', 'e1'):
+            raise KeyError('port')
+    assert Device.closed == []
+
+
+def test_caller_error_keeps_session():
+    pool = Pool()
+    with pytest.raises(NotFoundError):
+        with pool.session('device', 'e1'):
+            raise NotFoundError('no such port')
+    assert Device.closed == []
+    assert pool.stats()[0]['idle'] == 1
+
+
+def test_idle_and_health_check():
+    pool = Pool(idle=0.05, health_check=0)
+    with pool.session('device', 'e1') as session:
+        session.healthy = False
+    with pool.session('device', 'e1'):
+        pass
+    assert Device.logins == ['e1', 'e1']
+    assert Device.closed == ['e1']
+
+    time.sleep(0.1)
+    pool.evict()
+    assert Device.closed == ['e1', 'e1']
+    assert pool.stats() == []